@@ -3,5 +3,6 @@ POE2DB Crawler package for extracting content and updating knowledge base.
 """
 
 from .poe2db_crawler import POE2DBCrawler
+from .crawl_engine import CrawlEngine
 
-__all__ = ['POE2DBCrawler'] 
\ No newline at end of file
+__all__ = ['POE2DBCrawler', 'CrawlEngine'] 
\ No newline at end of file
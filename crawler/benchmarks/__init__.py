@@ -0,0 +1,4 @@
+"""
+Benchmarks for the crawler. Run from the crawler/ directory, e.g.
+``python -m benchmarks.bench_extract``.
+"""
@@ -0,0 +1,93 @@
+"""
+Extraction throughput on saved HTML pages.
+
+Runs the original BeautifulSoup extractor (POE2DBCrawler.extract_content)
+and the lxml extractor in static_extract over every fixture and reports
+pages/sec for each, whether the lxml output in compatible mode is identical
+to the original, and how much duplicated text the default deduplicating
+mode removes without dropping any text node.
+
+    python -m benchmarks.bench_extract --fixtures benchmarks/fixtures --iterations 200
+"""
+import argparse
+import json
+import re
+import time
+from pathlib import Path
+from typing import Iterator
+import lxml.html
+from poe2db_crawler import POE2DBCrawler
+from static_extract import BLOCK_TAGS, SKIP_TAGS, extract_markdown, looks_js_rendered
+
+CRAWLED_AT = "2024-01-01T00:00:00"
+
+
+def without_timestamp(markdown: str) -> str:
+    return re.sub(r"^Crawled at: .*$", f"Crawled at: {CRAWLED_AT}", markdown, count=1, flags=re.M)
+
+
+def pages_per_sec(extract, pages, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for url, html in pages:
+            extract(html, url)
+    return len(pages) * iterations / (time.perf_counter() - started)
+
+
+def block_strings(html: str) -> Iterator[str]:
+    """Every non-empty text node inside an extracted element."""
+    root = lxml.html.document_fromstring(html)
+    for element in root.iter(*BLOCK_TAGS):
+        if any(ancestor.tag in SKIP_TAGS for ancestor in element.iterancestors()):
+            continue
+        for text in element.itertext():
+            if text.strip():
+                yield text.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BeautifulSoup vs. lxml page extraction")
+    parser.add_argument("--fixtures", default=str(Path(__file__).parent / "fixtures"),
+                        help="Directory of saved .html pages")
+    parser.add_argument("--iterations", type=int, default=200, help="Passes over the fixtures per extractor")
+    args = parser.parse_args()
+
+    crawler = POE2DBCrawler(state_path=":memory:")
+    pages = [(f"https://poe2db.tw/us/{path.stem}", path.read_text(encoding="utf-8"))
+             for path in sorted(Path(args.fixtures).glob("*.html"))]
+    if not pages:
+        parser.error(f"No .html fixtures in {args.fixtures}")
+
+    results = []
+    for url, html in pages:
+        reference = without_timestamp(crawler.extract_content(html, url))
+        compat = extract_markdown(html, url, dedupe=False, crawled_at=CRAWLED_AT)
+        deduped = extract_markdown(html, url, crawled_at=CRAWLED_AT)
+        result = {
+            "page": url,
+            "compat_identical": compat == reference,
+            "reference_chars": len(reference),
+            "deduped_chars": len(deduped),
+            "deduped_keeps_all_text": all(text in deduped for text in block_strings(html)),
+            "js_rendered": looks_js_rendered(deduped),
+        }
+        results.append(result)
+        print(json.dumps(result))
+
+    summary = {
+        "pages": len(pages),
+        "iterations": args.iterations,
+        "bs4_pages_per_sec": round(pages_per_sec(crawler.extract_content, pages, args.iterations), 1),
+        "lxml_compat_pages_per_sec": round(pages_per_sec(
+            lambda html, url: extract_markdown(html, url, dedupe=False), pages, args.iterations), 1),
+        "lxml_pages_per_sec": round(pages_per_sec(extract_markdown, pages, args.iterations), 1),
+    }
+    summary["speedup"] = round(summary["lxml_pages_per_sec"] / summary["bs4_pages_per_sec"], 2)
+    print(json.dumps(summary))
+    crawler.state.close()
+
+    return results, summary
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,73 @@
 import argparse
-import logging
 import asyncio
+from pathlib import Path
 from poe2db_crawler import POE2DBCrawler
+from crawl_engine import CrawlEngine
+from static_extract import extract_markdown
 
 async def main():
     parser = argparse.ArgumentParser(description='POE2DB Crawler CLI')
-    parser.add_argument('url', help='URL to crawl')
+    parser.add_argument('urls', nargs='*', help='URLs to crawl')
+    parser.add_argument('--url-file', help='File with one URL per line')
+    parser.add_argument('--follow', action='store_true', help='Follow links from the given URLs')
+    parser.add_argument('--max-pages', type=int, default=100, help='Maximum pages to crawl when following links')
+    parser.add_argument('--max-depth', type=int, default=1, help='Maximum link depth from the seed URLs')
+    parser.add_argument('--concurrency', type=int, default=4, help='Pages crawled in parallel')
+    parser.add_argument('--rate', type=float, default=2.0, help='Maximum requests per second per host')
+    parser.add_argument('--wait-until', default='domcontentloaded',
+                        choices=['load', 'domcontentloaded', 'networkidle'],
+                        help='Page load state to wait for before extracting')
+    parser.add_argument('--browser', action='store_true',
+                        help='Always render pages in the headless browser instead of trying a plain HTTP fetch first')
+    parser.add_argument('--batch-size', type=int, default=50,
+                        help='Pages per /update-batch request; 0 uploads each page separately')
+    parser.add_argument('--force', action='store_true',
+                        help='Render every page even if it is unchanged since the last crawl')
     
     args = parser.parse_args()
     
-    crawler = POE2DBCrawler()
-    success = await crawler.process_url(args.url)
+    urls = list(args.urls)
+    if args.url_file:
+        urls.extend(line.strip() for line in Path(args.url_file).read_text().splitlines() if line.strip())
+    if not urls:
+        parser.error('Provide at least one URL or --url-file')
     
-    if success:
-        print("Crawling completed successfully!")
+    crawler = POE2DBCrawler(static_first=not args.browser, max_connections=args.concurrency * 2)
+    uploader = crawler.start_batch_upload(batch_size=args.batch_size) if args.batch_size > 0 else None
+    engine = CrawlEngine(
+        extract=extract_markdown,
+        concurrency=args.concurrency,
+        requests_per_second=args.rate,
+        follow_links=args.follow,
+        max_pages=args.max_pages,
+        max_depth=args.max_depth,
+        allowed_prefix=crawler.base_url,
+        wait_until=args.wait_until,
+        should_render=None if args.force else crawler.needs_render,
+        static_page=None if args.browser else crawler.fetch_static,
+        prefetched=crawler.has_prefetched,
+        on_finished=crawler.release
+    )
+    
+    failed_uploads = []
+    
+    async def on_page(url: str, content: str):
+        if not await crawler.store_content(url, content):
+            failed_uploads.append(url)
+    
+    try:
+        stats = await engine.crawl(urls, on_page)
+    finally:
+        await crawler.aclose()
+    
+    print(f"Crawled {stats.pages} pages in {stats.elapsed:.1f}s "
+          f"({stats.pages_per_minute:.1f} pages/minute), {stats.skipped} unchanged, {stats.static_pages} without a browser, {stats.failures} failed")
+    if uploader is not None:
+        print(f"Uploaded {uploader.uploaded} pages in {uploader.requests} requests, {uploader.failed} failed")
+    if stats.failures or failed_uploads or (uploader is not None and uploader.failed):
+        print("Some pages failed. Check the logs for details.")
     else:
-        print("Crawling failed. Check the logs for details.")
+        print("Crawling completed successfully!")
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main()) 
@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urldefrag, urlparse
+from playwright.async_api import async_playwright, Route
+
+logger = logging.getLogger(__name__)
+
+# Requests that never contribute to the extracted text
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+BLOCKED_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "googlesyndication.com",
+    "doubleclick.net",
+    "adservice.google.com",
+    "facebook.net",
+    "hotjar.com",
+    "cloudflareinsights.com",
+)
+
+class HostRateLimiter:
+    """Space out requests to the same host by at least 1 / rate seconds."""
+
+    def __init__(self, requests_per_second: float):
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._next_slot: Dict[str, float] = {}
+        self._lock = asyncio.Lock()
+
+    async def wait(self, host: str):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+class CrawlStats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.pages = 0
+        self.failures = 0
+        self.skipped = 0
+        self.static_pages = 0
+        self.blocked_requests = 0
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def pages_per_minute(self) -> float:
+        return self.pages / self.elapsed * 60 if self.elapsed else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "pages": self.pages,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "static_pages": self.static_pages,
+            "blocked_requests": self.blocked_requests,
+            "seconds": round(self.elapsed, 2),
+            "pages_per_minute": round(self.pages_per_minute, 2),
+        }
+
+class CrawlEngine:
+    """
+    Crawl many pages with one shared headless browser.
+
+    A fixed pool of workers pulls URLs from a queue, so the browser is
+    launched at most once per crawl instead of once per URL. Images, fonts, media and known
+    analytics hosts are blocked, requests to each host are rate limited and,
+    when ``follow_links`` is set, links under ``allowed_prefix`` are queued up
+    to ``max_depth`` hops from the seeds. An optional ``should_render`` hook
+    is awaited before each leaf page is loaded and pages it rejects (e.g.
+    unchanged since the last crawl) are skipped without opening the browser.
+    When ``static_page`` is given it is tried first and the browser is only
+    launched for pages it cannot handle. Each request counts against the
+    host's rate limit once: ``prefetched`` tells whether ``static_page``
+    can reuse the body ``should_render`` already downloaded.
+    ``on_finished`` is called with every URL once the engine is done with
+    it, however its crawl ended, so hooks can drop what they kept for it.
+    """
+
+    def __init__(self, extract: Callable[[str, str], str], concurrency: int = 4,
+                 requests_per_second: float = 2.0, follow_links: bool = False,
+                 max_pages: int = 100, max_depth: int = 1,
+                 allowed_prefix: Optional[str] = None, wait_until: str = "domcontentloaded",
+                 timeout_ms: int = 30000,
+                 should_render: Optional[Callable[[str], Awaitable[bool]]] = None,
+                 static_page: Optional[Callable[[str, bool], Awaitable[Optional[Tuple[str, List[str]]]]]] = None,
+                 prefetched: Optional[Callable[[str], bool]] = None,
+                 on_finished: Optional[Callable[[str], None]] = None):
+        self.extract = extract
+        self.should_render = should_render
+        # Awaited with (url, want_links); returns (content, links) or None
+        # when the page needs a browser
+        self.static_page = static_page
+        self.prefetched = prefetched
+        self.on_finished = on_finished
+        self.concurrency = concurrency
+        self.rate_limiter = HostRateLimiter(requests_per_second)
+        self.follow_links = follow_links
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.allowed_prefix = allowed_prefix
+        self.wait_until = wait_until
+        self.timeout_ms = timeout_ms
+        self.stats = CrawlStats()
+
+    async def crawl(self, urls: Iterable[str],
+                    on_page: Callable[[str, str], Awaitable[None]]) -> CrawlStats:
+        """
+        Crawl the URLs (and, optionally, the pages they link to).
+
+        Args:
+            urls: Seed URLs
+            on_page: Awaited with (url, extracted content) for every crawled page
+
+        Returns:
+            Crawl statistics, including pages per minute
+        """
+        self.stats = CrawlStats()
+        queue: asyncio.Queue = asyncio.Queue()
+        seen: Set[str] = set()
+        for url in urls:
+            url = self._normalize(url)
+            if url not in seen:
+                seen.add(url)
+                queue.put_nowait((url, 0))
+
+        self._browser_lock = asyncio.Lock()
+        self._playwright = self._browser = self._context = None
+        try:
+            workers = [
+                asyncio.create_task(self._worker(queue, seen, on_page))
+                for _ in range(self.concurrency)
+            ]
+            await queue.join()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        finally:
+            await self._close_browser()
+
+        logger.info(f"Crawl finished: {self.stats.as_dict()}")
+        return self.stats
+
+    async def _worker(self, queue: asyncio.Queue, seen: Set[str],
+                      on_page: Callable[[str, str], Awaitable[None]]):
+        # Each worker opens its browser page on first use
+        pages = []
+
+        async def get_page():
+            if not pages:
+                pages.append(await self._new_page())
+            return pages[0]
+
+        try:
+            while True:
+                url, depth = await queue.get()
+                try:
+                    expand = self.follow_links and depth < self.max_depth
+                    links = await self._crawl_page(get_page, url, on_page, expand)
+                    if expand:
+                        for link in links:
+                            if len(seen) >= self.max_pages:
+                                break
+                            if link not in seen and self._allowed(link):
+                                seen.add(link)
+                                queue.put_nowait((link, depth + 1))
+                except Exception as e:
+                    self.stats.failures += 1
+                    logger.error(f"Error crawling {url}: {str(e)}")
+                finally:
+                    if self.on_finished:
+                        self.on_finished(url)
+                    queue.task_done()
+        finally:
+            for page in pages:
+                await page.close()
+
+    async def _crawl_page(self, get_page, url: str,
+                          on_page: Callable[[str, str], Awaitable[None]],
+                          expand: bool) -> List[str]:
+        host = urlparse(url).netloc
+        # Pages whose links are still needed are always fetched
+        if self.should_render and not expand:
+            await self.rate_limiter.wait(host)
+            if not await self.should_render(url):
+                self.stats.skipped += 1
+                return []
+        if self.static_page:
+            if not (self.prefetched and self.prefetched(url)):
+                await self.rate_limiter.wait(host)
+            result = await self.static_page(url, expand)
+            if result is not None:
+                content, links = result
+                await on_page(url, content)
+                self.stats.pages += 1
+                self.stats.static_pages += 1
+                return [self._normalize(link) for link in links]
+        await self.rate_limiter.wait(host)
+        page = await get_page()
+        logger.info(f"Crawling URL: {url}")
+        await page.goto(url, wait_until=self.wait_until)
+        html = await page.content()
+        links: List[str] = []
+        if expand:
+            hrefs = await page.eval_on_selector_all("a[href]", "els => els.map(e => e.href)")
+            links = [self._normalize(href) for href in hrefs]
+        # Parsing is CPU-bound; keep it off the loop driving the other pages
+        content = await asyncio.to_thread(self.extract, html, url)
+        await on_page(url, content)
+        self.stats.pages += 1
+        return links
+
+    async def _new_page(self):
+        async with self._browser_lock:
+            if self._context is None:
+                logger.info("Launching browser")
+                self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(headless=True)
+                self._context = await self._browser.new_context()
+                await self._context.route("**/*", self._route)
+        page = await self._context.new_page()
+        page.set_default_timeout(self.timeout_ms)
+        return page
+
+    async def _close_browser(self):
+        if self._context is not None:
+            await self._context.close()
+        if self._browser is not None:
+            await self._browser.close()
+        if self._playwright is not None:
+            await self._playwright.stop()
+        self._playwright = self._browser = self._context = None
+
+    async def _route(self, route: Route):
+        request = route.request
+        host = urlparse(request.url).netloc
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or host.endswith(BLOCKED_HOSTS):
+            self.stats.blocked_requests += 1
+            await route.abort()
+        else:
+            await route.continue_()
+
+    def _allowed(self, url: str) -> bool:
+        return url.startswith(self.allowed_prefix) if self.allowed_prefix else True
+
+    @staticmethod
+    def _normalize(url: str) -> str:
+        return urldefrag(url)[0]
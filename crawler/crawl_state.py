@@ -0,0 +1,163 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import httpx
+
+logger = logging.getLogger(__name__)
+
+def content_hash(content: str) -> str:
+    """Hash extracted page content, ignoring the per-crawl timestamp line."""
+    lines = [line for line in content.splitlines() if not line.startswith("Crawled at: ")]
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
+class CrawlState:
+    """
+    What the crawler knows about every URL it has uploaded.
+
+    Stores the HTTP validators (ETag / Last-Modified) and a hash of the raw
+    response body for cheap conditional re-fetches, plus a hash of the
+    extracted content and the chunk IDs the knowledge base returned for it.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                body_hash TEXT,
+                content_hash TEXT,
+                chunk_ids TEXT,
+                checked_at TEXT,
+                updated_at TEXT
+            )
+        """)
+        self._db.commit()
+
+    def get(self, url: str) -> Optional[Dict[str, Optional[str]]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT etag, last_modified, body_hash, content_hash, chunk_ids FROM pages WHERE url = ?",
+                (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "etag": row[0],
+            "last_modified": row[1],
+            "body_hash": row[2],
+            "content_hash": row[3],
+            "chunk_ids": json.loads(row[4]) if row[4] else [],
+        }
+
+    def record_fetch(self, url: str, etag: Optional[str], last_modified: Optional[str], body_hash: Optional[str]):
+        """Remember the validators of a fetch whose content is already stored."""
+        now = datetime.now().isoformat()
+        with self._lock:
+            self._db.execute("""
+                INSERT INTO pages (url, etag, last_modified, body_hash, checked_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    body_hash = excluded.body_hash,
+                    checked_at = excluded.checked_at
+            """, (url, etag, last_modified, body_hash, now))
+            self._db.commit()
+
+    def record_upload(self, url: str, content_hash: str, chunk_ids: List[str],
+                      validators: Optional[Dict[str, Optional[str]]] = None):
+        """
+        Remember what was uploaded for a URL.
+
+        Args:
+            url: Page URL
+            content_hash: content_hash() of the uploaded content
+            chunk_ids: Chunk IDs the knowledge base stored
+            validators: From the fetch the content came from (see
+                fetch_if_changed); without them the next fetch is unconditional
+        """
+        validators = validators or {}
+        now = datetime.now().isoformat()
+        with self._lock:
+            self._db.execute("""
+                INSERT INTO pages (url, etag, last_modified, body_hash, content_hash, chunk_ids, checked_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    body_hash = excluded.body_hash,
+                    content_hash = excluded.content_hash,
+                    chunk_ids = excluded.chunk_ids,
+                    checked_at = excluded.checked_at,
+                    updated_at = excluded.updated_at
+            """, (url, validators.get("etag"), validators.get("last_modified"), validators.get("body_hash"),
+                  content_hash, json.dumps(chunk_ids), now, now))
+            self._db.commit()
+
+    def touch(self, url: str):
+        with self._lock:
+            self._db.execute("UPDATE pages SET checked_at = ? WHERE url = ?", (datetime.now().isoformat(), url))
+            self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+async def fetch_if_changed(client: httpx.AsyncClient, url: str,
+                           state: CrawlState) -> Tuple[bool, Optional[str], Optional[Dict[str, Optional[str]]]]:
+    """
+    Cheap conditional GET deciding whether a page needs to be rendered again.
+
+    Sends If-None-Match / If-Modified-Since from the last upload. A 304, or a
+    200 whose body hashes to the stored value, means the page is unchanged.
+
+    The validators of a changed page are returned rather than stored: they
+    are only valid once its content is in the knowledge base, so the caller
+    passes them to CrawlState.record_upload() after a successful upload.
+    Otherwise a failed or interrupted upload would make the next crawl get
+    a 304 for a page that was never stored.
+
+    Returns:
+        (changed, body, validators) where body is the fetched HTML when it was
+        downloaded and validators holds its etag, last_modified and body_hash
+    """
+    known = state.get(url)
+    headers = {}
+    if known and known["content_hash"]:
+        if known["etag"]:
+            headers["If-None-Match"] = known["etag"]
+        if known["last_modified"]:
+            headers["If-Modified-Since"] = known["last_modified"]
+
+    try:
+        response = await client.get(url, headers=headers)
+    except httpx.HTTPError as e:
+        # Can't tell; fall back to rendering the page
+        logger.warning(f"Conditional fetch failed for {url}: {str(e)}")
+        return True, None, None
+
+    if response.status_code == 304:
+        state.touch(url)
+        logger.info(f"Unchanged (304): {url}")
+        return False, None, None
+    if response.status_code >= 400:
+        return True, None, None
+
+    validators = {
+        "etag": response.headers.get("etag"),
+        "last_modified": response.headers.get("last-modified"),
+        "body_hash": hashlib.sha256(response.content).hexdigest(),
+    }
+    if known and known["content_hash"] and known["body_hash"] == validators["body_hash"]:
+        # The stored content came from this very body, so the validators are safe to keep
+        state.record_fetch(url, **validators)
+        logger.info(f"Unchanged (same body): {url}")
+        return False, response.text, None
+    return True, response.text, validators
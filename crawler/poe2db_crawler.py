@@ -2,17 +2,34 @@ import requests
 from bs4 import BeautifulSoup
 import logging
 from datetime import datetime
+import json
 import os
+import re
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 import asyncio
+import httpx
 from playwright.async_api import async_playwright
 import argparse
+try:
+    from .crawl_state import CrawlState, content_hash, fetch_if_changed
+    from .static_extract import extract_page, looks_js_rendered
+    from .uploader import BatchUploader
+except ImportError:
+    # Run as a script from crawler/ (cli.py) rather than as the package
+    from crawl_state import CrawlState, content_hash, fetch_if_changed
+    from static_extract import extract_page, looks_js_rendered
+    from uploader import BatchUploader
 
 # Setup paths
 CRAWLER_DIR = Path(__file__).parent
 LOG_DIR = CRAWLER_DIR / "logs"
 DATA_DIR = CRAWLER_DIR / "data"
 
+# Uploads go to the indexer, the one API process that writes to the store
+# (port 8001 in docker-compose.yml); read-only query workers redirect them there
+KB_API_URL = os.environ.get("KB_API_URL", "http://localhost:8001").rstrip("/")
+
 # Create necessary directories
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 DATA_DIR.mkdir(parents=True, exist_ok=True)
@@ -29,15 +46,117 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class POE2DBCrawler:
-    def __init__(self):
+    def __init__(self, state_path: Optional[Path] = None, static_first: bool = True,
+                 max_connections: int = 16):
         self.base_url = "https://poe2db.tw/us"
         self.data_dir = DATA_DIR
+        self.kb_url = os.environ.get("KB_UPDATE_URL", f"{KB_API_URL}/update")
+        self.state = CrawlState(state_path or Path(os.environ.get("CRAWL_STATE_PATH", DATA_DIR / "crawl_state.sqlite")))
+        self.static_first = static_first
+        self.max_connections = max_connections
+        self._http: Optional[httpx.AsyncClient] = None
+        # Bodies downloaded by the conditional GET, reused by the static path
+        self._prefetched: Dict[str, str] = {}
+        # Validators of changed pages, recorded once their content is stored
+        self._validators: Dict[str, Dict[str, Optional[str]]] = {}
+        # Validators of pages queued for a batch upload, recorded once it succeeds
+        self._uploading: Dict[str, Optional[Dict[str, Optional[str]]]] = {}
+        self.uploader: Optional[BatchUploader] = None
+
+    def start_batch_upload(self, batch_size: int = 50, **kwargs) -> BatchUploader:
+        """
+        Send pages to /update-batch in batches instead of one upload per page.
+
+        Args:
+            batch_size: Pages per request
+            **kwargs: Passed to BatchUploader
+        """
+        self.uploader = BatchUploader(
+            os.environ.get("KB_UPDATE_BATCH_URL", f"{KB_API_URL}/update-batch"),
+            batch_size=batch_size,
+            on_uploaded=lambda record, chunk_ids: self.state.record_upload(
+                record["url"], content_hash(record["content"]), chunk_ids, self._uploading.pop(record["url"], None)),
+            on_failed=lambda record: self._uploading.pop(record["url"], None),
+            **kwargs
+        )
+        return self.uploader
+
+    def _client(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                follow_redirects=True,
+                timeout=30.0,
+                headers={"User-Agent": "Mozilla/5.0 (compatible; poe2db-crawler)"},
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections)
+            )
+        return self._http
+
+    async def needs_render(self, url: str) -> bool:
+        """Cheap conditional GET; False when the page is known to be unchanged."""
+        changed, body, validators = await fetch_if_changed(self._client(), url, self.state)
+        if validators is not None:
+            self._validators[url] = validators
+        if changed and body is not None and self.static_first:
+            self._prefetched[url] = body
+        return changed
+
+    def release(self, url: str):
+        """Drop what needs_render() kept for a page; the engine's on_finished hook."""
+        self._prefetched.pop(url, None)
+        self._validators.pop(url, None)
+
+    def has_prefetched(self, url: str) -> bool:
+        """Whether fetch_static() will reuse the body needs_render() downloaded."""
+        return url in self._prefetched
+
+    async def fetch_static(self, url: str, links: bool = False) -> Optional[Tuple[str, List[str]]]:
+        """
+        Fetch and extract a page without a browser.
+
+        Args:
+            url: Page URL
+            links: Also return the page's links
+
+        Returns:
+            (content, links), or None if the page has to be rendered in a browser
+        """
+        html = self._prefetched.pop(url, None)
+        if html is None:
+            try:
+                response = await self._client().get(url)
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                logger.warning(f"Static fetch failed for {url}: {str(e)}")
+                return None
+            html = response.text
+        
+        # Parsing is CPU-bound; keep it off the event loop
+        content, page_links = await asyncio.to_thread(extract_page, html, url, True, links)
+        if looks_js_rendered(content):
+            logger.info(f"Page looks JavaScript-rendered, falling back to the browser: {url}")
+            return None
+        return content, page_links
+
+    async def aclose(self):
+        if self.uploader is not None:
+            await self.uploader.close()
+            self.uploader = None
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        self.state.close()
 
     async def crawl_url(self, url: str) -> dict:
         """Crawl a specific URL and return the extracted content."""
         try:
             logger.info(f"Crawling URL: {url}")
             
+            if self.static_first:
+                result = await self.fetch_static(url)
+                if result is not None:
+                    return result[0]
+            
             async with async_playwright() as p:
                 # Launch browser
                 browser = await p.chromium.launch(headless=True)
@@ -52,126 +171,71 @@ class POE2DBCrawler:
                 # Close browser
                 await browser.close()
                 
-                # Parse with BeautifulSoup
-                soup = BeautifulSoup(content, 'html.parser')
-                
-                # Remove unwanted elements
-                for element in soup.find_all(['script', 'style', 'nav', 'footer', 'header']):
-                    element.decompose()
-                    
-                # Extract main content
-                content = []
-                
-                # Add metadata
-                content.append(f"# {soup.title.string if soup.title else 'Untitled Page'}")
-                content.append(f"Source: {url}")
-                content.append(f"Crawled at: {datetime.now().isoformat()}")
-                content.append("")  # Empty line after metadata
-                
-                # Get all text content, preserving headers and lists
-                for element in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'ul', 'ol', 'tr', "section"]):
-                    if element.name.startswith('h'):
-                        # Add appropriate markdown heading level
-                        level = element.name[1]
-                        heading_text = element.get_text(strip=True)
-                        if heading_text:
-                            content.append(f"{'#' * int(level)} {heading_text}")
-                            content.append("")
-                    elif element.name == 'p':
-                        paragraph_text = element.get_text(strip=True)
-                        if paragraph_text:
-                            content.append(paragraph_text)
-                            content.append("")
-                    elif element.name in ['ul', 'ol']:
-                        for li in element.find_all('li'):
-                            item_text = li.get_text(strip=True)
-                            if item_text:
-                                content.append(f"- {item_text}")
-                        content.append("")
-                    elif element.name in ['tr']:
-                        for li in element.find_all(['td', 'th']):
-                            item_text = li.get_text(strip=True)
-                            if item_text:
-                                content.append(f"- {item_text}")
-                        content.append("")
-                    elif element.name in ["section"]:
-                        content.append(f"## {element.get_text(strip=True)}")
-                        content.append("")  
-                
-                # Join all content with newlines
-                processed_content = "\n".join(content)
-                
-                logger.debug(f"Extracted content: {processed_content[:500]}...")  # Log first 500 chars
-                
-                return processed_content
+            return extract_page(content, url)[0]
             
         except Exception as e:
             logger.error(f"Error crawling {url}: {str(e)}")
             return None
 
-    def save_to_file(self, content: str, filename: str) -> Path:
-        """Save crawled content to a text file."""
-        try:
-            filepath = self.data_dir / filename
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(content)
-            logger.info(f"Saved content to {filepath}")
-            return filepath
-        except Exception as e:
-            logger.error(f"Error saving content: {str(e)}")
-            return None
+    def extract_content(self, html: str, url: str) -> str:
+        """
+        Convert a rendered page to the crawler's markdown format.
 
-    def update_knowledge_base(self, filepath: Path) -> bool:
-        """Update the knowledge base with the crawled content."""
-        try:
-            # Prepare the file for upload
-            files = {
-                'file': (filepath.name, open(filepath, 'rb'), 'text/plain')
-            }
-            
-            # Send to the knowledge base update endpoint
-            response = requests.post('http://localhost:8000/update', files=files)
-            response.raise_for_status()
-            
-            logger.info("Successfully updated knowledge base")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error updating knowledge base: {str(e)}")
-            return False
-
-    async def process_url(self, url: str) -> bool:
-        """Process a URL: crawl, save, and update knowledge base."""
-        # Extract filename from URL
-        filename = url.split('/')[-1].lower() + f"_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+        This is the original BeautifulSoup implementation, kept as the
+        reference for ``static_extract.extract_page``, which the crawler uses.
+        """
+        # Parse with BeautifulSoup
+        soup = BeautifulSoup(html, 'html.parser')
         
-        # Crawl the URL
-        content = await self.crawl_url(url)
-        if not content:
-            return False
+        # Remove unwanted elements
+        for element in soup.find_all(['script', 'style', 'nav', 'footer', 'header']):
+            element.decompose()
             
-        # Save to file
-        filepath = self.save_to_file(content, filename)
-        if not filepath:
-            return False
-            
-        # Update knowledge base
-        return self.update_knowledge_base(filepath)
-
-async def main():
-    parser = argparse.ArgumentParser(description='POE2DB Crawler')
-    parser.add_argument('url', help='URL to crawl')
-    args = parser.parse_args()
-    
-    crawler = POE2DBCrawler()
-    success = await crawler.process_url(args.url)
-    if success:
-        logger.info("Crawling process completed successfully")
-    else:
-        logger.error("Crawling process failed")
-
-if __name__ == "__main__":
-    asyncio.run(main()) 
+        # Extract main content
+        content = []
+        
+        # Add metadata
+        content.append(f"# {soup.title.string if soup.title else 'Untitled Page'}")
+        content.append(f"Source: {url}")
+        content.append(f"Crawled at: {datetime.now().isoformat()}")
+        content.append("")  # Empty line after metadata
+        
+        # Get all text content, preserving headers and lists
+        for element in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'ul', 'ol', 'tr', "section"]):
+            if element.name.startswith('h'):
+                # Add appropriate markdown heading level
+                level = element.name[1]
+                heading_text = element.get_text(strip=True)
+                if heading_text:
+                    content.append(f"{'#' * int(level)} {heading_text}")
+                    content.append("")
+            elif element.name == 'p':
+                paragraph_text = element.get_text(strip=True)
+                if paragraph_text:
+                    content.append(paragraph_text)
+                    content.append("")
+            elif element.name in ['ul', 'ol']:
+                for li in element.find_all('li'):
+                    item_text = li.get_text(strip=True)
+                    if item_text:
+                        content.append(f"- {item_text}")
+                content.append("")
+            elif element.name in ['tr']:
+                for li in element.find_all(['td', 'th']):
+                    item_text = li.get_text(strip=True)
+                    if item_text:
+                        content.append(f"- {item_text}")
+                content.append("")
+            elif element.name in ["section"]:
+                content.append(f"## {element.get_text(strip=True)}")
+                content.append("")  
+        
+        # Join all content with newlines
+        processed_content = "\n".join(content)
+        
+        logger.debug(f"Extracted content: {processed_content[:500]}...")  # Log first 500 chars
+        
+        return processed_content
 
     def save_to_file(self, content: str, filename: str) -> Path:
         """Save crawled content to a text file."""
@@ -185,42 +249,73 @@ if __name__ == "__main__":
             logger.error(f"Error saving content: {str(e)}")
             return None
 
-    def update_knowledge_base(self, filepath: Path) -> bool:
-        """Update the knowledge base with the crawled content."""
+    def update_knowledge_base(self, filepath: Path) -> Optional[dict]:
+        """Upload a saved page to the knowledge base and return the server's response."""
         try:
-            # Prepare the file for upload
-            files = {
-                'file': (filepath.name, open(filepath, 'rb'), 'text/plain')
-            }
-            
-            # Send to the knowledge base update endpoint
-            response = requests.post('http://localhost:8000/update', files=files)
+            mime_type = 'application/json' if filepath.suffix == '.json' else 'text/plain'
+            with open(filepath, 'rb') as f:
+                files = {
+                    'file': (filepath.name, f, mime_type)
+                }
+                
+                # Send to the knowledge base update endpoint and wait for it to be indexed
+                response = requests.post(self.kb_url, files=files, params={'wait': 'true'})
             response.raise_for_status()
             
             logger.info("Successfully updated knowledge base")
-            return True
+            return response.json()
             
         except Exception as e:
             logger.error(f"Error updating knowledge base: {str(e)}")
-            return False
+            return None
 
     async def process_url(self, url: str) -> bool:
         """Process a URL: crawl, save, and update knowledge base."""
-        # Extract filename from URL
-        filename = url.split('/')[-1].lower() + f"_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+        if not await self.needs_render(url):
+            return True
         
-        # Crawl the URL
-        content = await self.crawl_url(url)
-        if not content:
-            return False
-            
-        # Save to file
-        filepath = self.save_to_file(content['content'], filename)
-        if not filepath:
+        try:
+            # Crawl the URL
+            content = await self.crawl_url(url)
+            if not content:
+                return False
+            return await self.store_content(url, content)
+        finally:
+            self.release(url)
+
+    async def store_content(self, url: str, content: str) -> bool:
+        """Save crawled content and, if it changed, replace it in the knowledge base."""
+        digest = content_hash(content)
+        known = self.state.get(url)
+        if known and known["content_hash"] == digest:
+            logger.info(f"Content unchanged, skipping upload: {url}")
+            validators = self._validators.pop(url, None)
+            if validators is not None:
+                # The stored content matches this fetch
+                self.state.record_fetch(url, **validators)
+            else:
+                self.state.touch(url)
+            return True
+        
+        # One file per URL, overwritten on every change
+        slug = re.sub(r'[^a-z0-9]+', '_', url.split('://')[-1].lower()).strip('_')
+        payload = {"url": url, "content": content, "timestamp": datetime.now().isoformat()}
+        filepath = self.save_to_file(json.dumps(payload, ensure_ascii=False), f"{slug}.json")
+        if self.uploader is not None:
+            # Crawl state is recorded once the batch has been stored
+            self._uploading[url] = self._validators.pop(url, None)
+            await self.uploader.add(payload)
+            return True
+        result = None
+        if filepath:
+            # Update knowledge base without blocking other crawl workers
+            result = await asyncio.to_thread(self.update_knowledge_base, filepath)
+        validators = self._validators.pop(url, None)
+        if result is None:
+            # The validators are dropped, so the next conditional GET can't skip a page that never made it in
             return False
-            
-        # Update knowledge base
-        return self.update_knowledge_base(filepath)
+        self.state.record_upload(url, digest, result.get("chunk_ids", {}).get(url, []), validators)
+        return True
 
 async def main():
     parser = argparse.ArgumentParser(description='POE2DB Crawler')
@@ -228,11 +323,14 @@ async def main():
     args = parser.parse_args()
     
     crawler = POE2DBCrawler()
-    success = await crawler.process_url(args.url)
+    try:
+        success = await crawler.process_url(args.url)
+    finally:
+        await crawler.aclose()
     if success:
         logger.info("Crawling process completed successfully")
     else:
         logger.error("Crawling process failed")
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main())
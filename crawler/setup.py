@@ -8,6 +8,9 @@ setup(
         "requests>=2.31.0",
         "beautifulsoup4>=4.12.3",
         "pyppeteer>=1.0.2",
+        "playwright>=1.40.0",
+        "httpx>=0.25.0",
+        "lxml>=4.9.0",
         "asyncio>=3.4.3",
     ],
     entry_points={
@@ -0,0 +1,36 @@
+import asyncio
+from crawl_engine import CrawlEngine
+
+
+class CountingLimiter:
+    def __init__(self):
+        self.waits = 0
+
+    async def wait(self, host: str):
+        self.waits += 1
+
+
+def crawl(prefetched):
+    async def should_render(url):
+        return True
+
+    async def static_page(url, want_links):
+        return f"# {url}", []
+
+    async def on_page(url, content):
+        pass
+
+    engine = CrawlEngine(extract=lambda html, url: html, should_render=should_render,
+                         static_page=static_page, prefetched=prefetched)
+    engine.rate_limiter = CountingLimiter()
+    stats = asyncio.run(engine.crawl(["https://poe2db.tw/us/a", "https://poe2db.tw/us/b"], on_page))
+    return stats, engine.rate_limiter.waits
+
+
+def test_prefetched_pages_take_one_rate_limit_slot():
+    stats, waits = crawl(prefetched=lambda url: True)
+    assert stats.static_pages == 2 and waits == 2
+
+    # Without the body from the conditional GET the static fetch is a second request
+    _, waits = crawl(prefetched=lambda url: False)
+    assert waits == 4
@@ -0,0 +1,131 @@
+import asyncio
+import subprocess
+import sys
+from pathlib import Path
+import httpx
+import pytest
+from crawl_engine import CrawlEngine
+from crawl_state import CrawlState, content_hash, fetch_if_changed
+from poe2db_crawler import POE2DBCrawler
+
+URL = "https://poe2db.tw/us/Widowhail"
+
+
+class Site:
+    """Serves one page with an ETag and honours If-None-Match."""
+
+    def __init__(self, body: str = "<html>Widowhail</html>", etag: str = '"v1"'):
+        self.body = body
+        self.etag = etag
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if request.headers.get("if-none-match") == self.etag:
+            return httpx.Response(304)
+        return httpx.Response(200, text=self.body, headers={"ETag": self.etag})
+
+
+def client(site: Site) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.MockTransport(site))
+
+
+def test_content_hash_ignores_crawl_timestamp():
+    page = "# Widowhail\nCrawled at: {}\nUnique bow"
+
+    assert content_hash(page.format("2024-01-01T00:00:00")) == content_hash(page.format("2025-06-01T12:00:00"))
+    assert content_hash(page.format("2024-01-01T00:00:00")) != content_hash("# Widowhail\nUnique quiver")
+
+
+def test_conditional_fetch_skips_pages_unchanged_since_upload(tmp_path):
+    site = Site()
+    state = CrawlState(tmp_path / "state.sqlite")
+
+    async def crawl():
+        async with client(site) as http:
+            changed, body, validators = await fetch_if_changed(http, URL, state)
+            assert changed and body == site.body and validators["etag"] == '"v1"'
+            # Nothing is remembered until the content is stored
+            assert state.get(URL) is None
+            state.record_upload(URL, content_hash("# Widowhail"), ["chunk"], validators)
+            assert await fetch_if_changed(http, URL, state) == (False, None, None)
+            site.etag, site.body = '"v2"', "<html>Widowhail, changed</html>"
+            return await fetch_if_changed(http, URL, state)
+
+    changed, body, _ = asyncio.run(crawl())
+
+    assert site.requests[1].headers["if-none-match"] == '"v1"'
+    assert changed and body == site.body
+    state.close()
+
+
+@pytest.fixture
+def crawler(tmp_path):
+    crawler = POE2DBCrawler(state_path=tmp_path / "state.sqlite")
+    crawler.data_dir = tmp_path
+    yield crawler
+    asyncio.run(crawler.aclose())
+
+
+def test_store_content_skips_unchanged_and_replaces_changed(crawler, monkeypatch):
+    uploads = []
+    monkeypatch.setattr(crawler, "update_knowledge_base",
+                        lambda filepath: uploads.append(filepath.read_text()) or {"chunk_ids": {URL: ["c"]}})
+
+    async def store(content):
+        return await crawler.store_content(URL, content)
+
+    assert asyncio.run(store("# Widowhail\nCrawled at: 1\nUnique bow"))
+    assert asyncio.run(store("# Widowhail\nCrawled at: 2\nUnique bow"))
+    assert len(uploads) == 1
+    assert asyncio.run(store("# Widowhail\nCrawled at: 3\nUnique bow, buffed"))
+    assert len(uploads) == 2
+    assert crawler.state.get(URL)["content_hash"] == content_hash("# Widowhail\nUnique bow, buffed")
+
+
+def test_failed_upload_keeps_next_fetch_unconditional(crawler, monkeypatch):
+    site = Site()
+    crawler._http = client(site)
+    monkeypatch.setattr(crawler, "update_knowledge_base", lambda filepath: None)
+
+    async def crawl():
+        assert await crawler.needs_render(URL)
+        assert not await crawler.store_content(URL, "# Widowhail\nUnique bow")
+        return await crawler.needs_render(URL)
+
+    assert asyncio.run(crawl())
+    assert "if-none-match" not in site.requests[1].headers
+    assert crawler.state.get(URL) is None
+
+    # Once stored, the validators of that fetch make the next one conditional
+    monkeypatch.setattr(crawler, "update_knowledge_base", lambda filepath: {"chunk_ids": {URL: ["c"]}})
+
+    async def recrawl():
+        assert await crawler.store_content(URL, "# Widowhail\nUnique bow")
+        return await crawler.needs_render(URL)
+
+    assert not asyncio.run(recrawl())
+    assert site.requests[2].headers["if-none-match"] == '"v1"'
+
+
+def test_pages_that_fail_after_the_conditional_get_are_released(crawler):
+    crawler._http = client(Site())
+
+    async def broken_static_page(url, want_links):
+        raise RuntimeError("extraction failed")
+
+    async def on_page(url, content):
+        pass
+
+    engine = CrawlEngine(extract=lambda html, url: html, should_render=crawler.needs_render,
+                         static_page=broken_static_page, on_finished=crawler.release)
+    stats = asyncio.run(engine.crawl([URL], on_page))
+
+    assert stats.failures == 1
+    assert crawler._validators == {} and crawler._prefetched == {}
+
+
+def test_imports_as_package_and_from_the_crawler_directory():
+    root = Path(__file__).resolve().parents[2]
+    for cwd, module in [(root, "crawler"), (root / "crawler", "poe2db_crawler")]:
+        subprocess.run([sys.executable, "-c", f"import {module}"], cwd=cwd, check=True)
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import httpx
+from uploader import BatchUploader
+
+INDEXER = "http://indexer:8001/update-batch"
+
+
+def pages(count: int):
+    return [{"url": f"https://poe2db.tw/us/page{i}", "content": f"# Page {i}"} for i in range(count)]
+
+
+def upload(records, handler, **kwargs):
+    """Upload records through a mock server; returns (uploaded, failed, uploader)."""
+    uploaded, failed = [], []
+
+    async def run():
+        uploader = BatchUploader(
+            "http://api:8000/update-batch", backoff=0,
+            on_uploaded=lambda record, chunk_ids: uploaded.append((record["url"], chunk_ids)),
+            on_failed=lambda record: failed.append(record["url"]),
+            **kwargs
+        )
+        uploader._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        for record in records:
+            await uploader.add(record)
+        await uploader.close()
+        return uploader
+
+    return uploaded, failed, asyncio.run(run())
+
+
+async def stored(request: httpx.Request) -> httpx.Response:
+    urls = [json.loads(line)["url"] for line in (await request.aread()).decode().splitlines()]
+    return httpx.Response(200, json={"chunks": len(urls), "chunk_ids": {url: [url[-5:]] for url in urls}})
+
+
+def test_transient_errors_are_retried():
+    responses = [httpx.Response(503), httpx.Response(502)]
+
+    async def flaky(request):
+        return responses.pop(0) if responses else await stored(request)
+
+    uploaded, failed, uploader = upload(pages(2), flaky, batch_size=2)
+
+    assert uploaded == [("https://poe2db.tw/us/page0", ["page0"]), ("https://poe2db.tw/us/page1", ["page1"])]
+    assert failed == [] and uploader.requests == 3
+
+
+def test_exhausted_retries_and_client_errors_fail_the_batch():
+    async def down(request):
+        return httpx.Response(503)
+
+    uploaded, failed, uploader = upload(pages(3), down, batch_size=2, retries=2)
+    assert uploaded == [] and len(failed) == 3
+    # Two batches, three attempts each
+    assert uploader.requests == 6
+
+    async def rejected(request):
+        return httpx.Response(422)
+
+    _, failed, uploader = upload(pages(1), rejected)
+    assert len(failed) == 1 and uploader.requests == 1
+
+
+def test_batches_in_flight_are_bounded():
+    in_flight, peak = 0, 0
+
+    async def slow(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return await stored(request)
+
+    uploaded, _, uploader = upload(pages(10), slow, batch_size=2, max_in_flight=2)
+
+    assert len(uploaded) == 10 and uploader.requests == 5
+    assert peak == 2
+
+
+def test_read_only_worker_redirect_is_followed():
+    seen = []
+
+    async def api(request):
+        seen.append(str(request.url))
+        if request.url.host == "api":
+            return httpx.Response(307, headers={"Location": INDEXER})
+        return await stored(request)
+
+    uploaded, failed, uploader = upload(pages(4), api, batch_size=2, max_in_flight=1)
+
+    assert len(uploaded) == 4 and failed == []
+    # Later batches go straight to the indexer
+    assert seen == ["http://api:8000/update-batch", INDEXER, INDEXER]
+    assert uploader.url == INDEXER
+
+    async def moved(request):
+        return httpx.Response(302, headers={"Location": INDEXER})
+
+    _, failed, uploader = upload(pages(1), moved)
+    assert len(failed) == 1 and uploader.requests == 1
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import logging
+import random
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Transient failures worth another attempt; the endpoint is idempotent
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# Redirects that keep the method and body, e.g. a read-only API worker
+# pointing writes at the indexer
+FOLLOWED_REDIRECTS = {307, 308}
+MAX_REDIRECTS = 5
+
+class BatchUploader:
+    """
+    Upload crawled pages to the knowledge base's /update-batch endpoint.
+
+    Pages are collected into batches of ``batch_size`` (or ``max_batch_bytes``
+    of content) and sent as NDJSON over one pooled connection. Up to
+    ``max_in_flight`` batches are uploaded concurrently; add() waits when that
+    many are already in flight, so memory stays bounded however large the
+    crawl. Failed requests are retried with jittered exponential backoff.
+
+    307/308 redirects are followed, and later batches go straight to the new
+    URL. The streamed body can't be replayed by httpx, so this is done here
+    rather than with ``follow_redirects``.
+    """
+
+    def __init__(self, url: str, batch_size: int = 50, max_batch_bytes: int = 8 * 1024 * 1024,
+                 max_in_flight: int = 2, retries: int = 4, backoff: float = 0.5,
+                 timeout: float = 300.0,
+                 on_uploaded: Optional[Callable[[Dict[str, Any], List[str]], None]] = None,
+                 on_failed: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.url = url
+        self.batch_size = batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.retries = retries
+        self.backoff = backoff
+        self.on_uploaded = on_uploaded
+        self.on_failed = on_failed
+        self.uploaded = 0
+        self.failed = 0
+        self.requests = 0
+        self._client = httpx.AsyncClient(timeout=timeout)
+        self._batch: List[Dict[str, Any]] = []
+        self._batch_bytes = 0
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def add(self, record: Dict[str, Any]):
+        """
+        Queue a page for upload.
+
+        Args:
+            record: {"url", "content", "timestamp"}, as in the crawler's JSON files
+        """
+        self._batch.append(record)
+        self._batch_bytes += len(record.get("content", ""))
+        if len(self._batch) >= self.batch_size or self._batch_bytes >= self.max_batch_bytes:
+            await self.flush()
+
+    async def flush(self):
+        """Start uploading the current batch, waiting if too many are in flight."""
+        if not self._batch:
+            return
+        batch, self._batch, self._batch_bytes = self._batch, [], 0
+        await self._slots.acquire()
+        task = asyncio.create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def close(self):
+        """Upload what is left and wait for every batch to finish."""
+        await self.flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._client.aclose()
+        logger.info(f"Uploader finished: {self.uploaded} pages uploaded, {self.failed} failed, {self.requests} requests")
+
+    async def _send(self, batch: List[Dict[str, Any]]):
+        try:
+            result = await self._post(batch)
+        except Exception as e:
+            logger.error(f"Batch upload of {len(batch)} pages failed: {str(e)}")
+            self.failed += len(batch)
+            for record in batch:
+                self._notify(self.on_failed, record)
+            return
+        finally:
+            self._slots.release()
+
+        chunk_ids = result.get("chunk_ids", {})
+        self.uploaded += len(batch)
+        logger.info(f"Uploaded {len(batch)} pages, {result.get('chunks', 0)} chunks")
+        for record in batch:
+            self._notify(self.on_uploaded, record, chunk_ids.get(record.get("url"), []))
+
+    async def _post(self, batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+        attempt = redirects = 0
+        while True:
+            try:
+                self.requests += 1
+                response = await self._client.post(
+                    self.url,
+                    content=self._ndjson(batch),
+                    headers={"Content-Type": "application/x-ndjson"}
+                )
+                if response.status_code in FOLLOWED_REDIRECTS and "location" in response.headers:
+                    redirects += 1
+                    if redirects > MAX_REDIRECTS:
+                        raise httpx.TooManyRedirects(f"More than {MAX_REDIRECTS} redirects from {self.url}",
+                                                     request=response.request)
+                    location = str(response.url.join(response.headers["location"]))
+                    logger.warning(f"{self.url} redirects to {location}; uploading there")
+                    self.url = location
+                    continue
+                if response.is_redirect:
+                    raise httpx.HTTPStatusError(
+                        f"Upload endpoint {self.url} answered {response.status_code} "
+                        f"(redirect to {response.headers.get('location')}); point the uploader at the indexer",
+                        request=response.request, response=response
+                    )
+                if response.status_code not in RETRYABLE_STATUS:
+                    response.raise_for_status()
+                    return response.json()
+                error: Exception = httpx.HTTPStatusError(
+                    f"Server returned {response.status_code}", request=response.request, response=response
+                )
+            except httpx.TransportError as e:
+                error = e
+            if attempt == self.retries:
+                raise error
+            delay = random.uniform(0, self.backoff * 2 ** attempt)
+            attempt += 1
+            logger.warning(f"Batch upload failed ({str(error)}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    async def _ndjson(batch: List[Dict[str, Any]]) -> AsyncIterator[bytes]:
+        # Serialized one line at a time instead of building the whole body
+        for record in batch:
+            yield (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+    @staticmethod
+    def _notify(callback: Optional[Callable], *args):
+        if callback is None:
+            return
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.error(f"Upload callback failed: {str(e)}")
@@ -1,18 +1,111 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import Depends, FastAPI, File, UploadFile, HTTPException, Request
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
+from typing import Any, Dict, List, Optional, Tuple
+from contextlib import asynccontextmanager
+from functools import partial
+from pathlib import Path
+import asyncio
 import logging
 import json
+import os
+import tempfile
+import time
+import uuid
 from rag_agent import app as rag_agent, Message, streaming_app
-from knowledge_base import ChromaDBKnowledgeBase
-from llm_wrapper import OpenAIAdapter
+import rag_agent as rag_graph
+from knowledge_base import open_knowledge_base, get_knowledge_base, close_knowledge_base
+from llm_wrapper import close_llms, metrics as llm_metrics
+from response_cache import ResponseCache
+from jobs import Job, JobManager
+from ingest import SUPPORTED_SUFFIXES, index_file, record_metadata
+from checkpoints import aprune_checkpoints
+import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the vector store once and share it across requests
+    open_knowledge_base()
+    janitor = asyncio.create_task(_sweep_checkpoints())
+    yield
+    janitor.cancel()
+    jobs.shutdown()
+    await close_llms()
+    if rag_graph.retrieval_scheduler is not None:
+        rag_graph.retrieval_scheduler.close()
+    if rag_graph.query_expander is not None:
+        rag_graph.query_expander.close()
+    close_knowledge_base()
+
+app = FastAPI(lifespan=lifespan)
+
+# Background indexing of uploads
+jobs = JobManager.from_env()
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR") or None
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Conversations idle for CHECKPOINT_TTL seconds are dropped by a periodic sweep
+CHECKPOINT_TTL = float(os.environ.get("CHECKPOINT_TTL", "86400"))
+CHECKPOINT_SWEEP_INTERVAL = float(os.environ.get("CHECKPOINT_SWEEP_INTERVAL", "300"))
+
+async def _sweep_checkpoints():
+    while True:
+        await asyncio.sleep(CHECKPOINT_SWEEP_INTERVAL)
+        try:
+            pruned = await aprune_checkpoints(rag_graph.checkpointer, CHECKPOINT_TTL)
+            if pruned["threads"] or pruned["checkpoints"]:
+                logger.info(f"Pruned {pruned['threads']} idle threads and {pruned['checkpoints']} old checkpoints")
+        except Exception as e:
+            logger.error(f"Checkpoint sweep failed: {str(e)}")
+
+# Answers for repeated questions, dropped whenever the knowledge base changes
+response_cache = ResponseCache.from_env(
+    embed=lambda texts: get_knowledge_base().embedding_function(texts)
+)
+# Store generation the cached answers were generated against
+_cache_store_generation: Optional[int] = None
+
+def _sync_response_cache():
+    """Drop cached answers when the store changed, including writes by another process."""
+    global _cache_store_generation
+    generation = get_knowledge_base().generation()
+    if _cache_store_generation is not None and generation != _cache_store_generation:
+        response_cache.invalidate()
+    _cache_store_generation = generation
+
+# Read-only workers (KB_READ_ONLY) redirect writes to the single indexer process
+INDEXER_URL = os.environ.get("INDEXER_URL")
+
+def _require_writer(request: Request):
+    if not get_knowledge_base().read_only:
+        return
+    if INDEXER_URL:
+        location = INDEXER_URL.rstrip("/") + request.url.path
+        if request.url.query:
+            location += "?" + request.url.query
+        raise HTTPException(status_code=307, detail="Writes go to the indexer", headers={"Location": location})
+    raise HTTPException(status_code=403, detail="This worker is read-only")
+
+# Opt-in cProfile sampling of requests (PROFILE_SAMPLE_RATE)
+profiler = metrics.SamplingProfiler.from_env()
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    started = time.perf_counter()
+    with profiler.maybe_profile(request.url.path):
+        response = await call_next(request)
+    # Label by route template so IDs in paths do not multiply the series
+    route = request.scope.get("route")
+    metrics.REQUEST_SECONDS.labels(
+        request.method, getattr(route, "path", "unmatched"), str(response.status_code)
+    ).observe(time.perf_counter() - started)
+    return response
 
 # Configure CORS
 app.add_middleware(
@@ -26,50 +119,137 @@ app.add_middleware(
 
 class Query(BaseModel):
     message: str
-    thread_id: str = "default"
+    # Without a thread_id the query is answered without conversation history
+    thread_id: Optional[str] = None
+    # Optional retrieval filters
+    source: Optional[str] = None
+    section: Optional[str] = None
+    max_age_days: Optional[float] = None
+
+    def filters(self) -> Optional[Dict[str, Any]]:
+        """The filters as a vector store ``where`` clause, or None when unfiltered."""
+        conditions: List[Dict[str, Any]] = []
+        if self.source:
+            conditions.append({"source": self.source})
+        if self.section:
+            conditions.append({"section": self.section})
+        if self.max_age_days is not None:
+            conditions.append({"crawled_at": {"$gte": time.time() - self.max_age_days * 86400}})
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+async def _start_conversation(query: Query) -> Tuple[Dict[str, Any], bool]:
+    """
+    Checkpoint config for the query, and whether its answer may come from or
+    go to the response cache.
+
+    Cached answers were generated without history or filters. Queries
+    without a thread_id run on a one-off thread that _end_conversation deletes.
+    """
+    _sync_response_cache()
+    if query.thread_id is None:
+        config = {"configurable": {"thread_id": f"oneshot-{uuid.uuid4().hex}"}}
+        return config, not query.filters()
+    config = {"configurable": {"thread_id": query.thread_id}}
+    if query.filters():
+        return config, False
+    state = await rag_agent.aget_state(config)
+    return config, not state.values.get("messages")
+
+async def _end_conversation(query: Query, config: Dict[str, Any]):
+    if query.thread_id is None:
+        await rag_graph.checkpointer.adelete_thread(config["configurable"]["thread_id"])
+
+async def _record_cached_turn(query: Query, config: Dict[str, Any], answer: str):
+    """Append a turn answered from the cache to the thread, as if the graph had run."""
+    if query.thread_id is None:
+        return
+    messages: List[Message] = [
+        {"role": "user", "content": query.message},
+        {"role": "assistant", "content": answer},
+    ]
+    await rag_agent.aupdate_state(config, {"messages": messages}, as_node="generator")
 
 @app.post("/query")
 async def query(query: Query):
+    config = None
     try:
-        logger.info(f"Received query: {query.message}")
+        logger.debug("Received query: %s", query.message)
+        filters = query.filters()
+        config, cacheable = await _start_conversation(query)
+        cached = await run_in_threadpool(response_cache.get, query.message) if cacheable else None
+        if cached is not None:
+            await _record_cached_turn(query, config, cached)
+            return {"response": cached, "cached": True}
+
+        generation = response_cache.generation
+        started = time.perf_counter()
         initial_message: Message = {"role": "user", "content": query.message}
-        final_state = rag_agent.invoke(
-            {"messages": [initial_message], "stream": False},
-            config={"configurable": {"thread_id": query.thread_id}}
+        final_state = await rag_agent.ainvoke(
+            {"messages": [initial_message], "stream": False, "filters": filters},
+            config=config
         )
-        logger.info(f"Final state: {final_state}")
-        return {"response": final_state["messages"][-1]["content"]}
+        logger.debug("Final state: %s", final_state)
+        answer = final_state["messages"][-1]["content"]
+        if cacheable:
+            # Embeds the query when RESPONSE_CACHE_SIMILARITY is set, like get()
+            await run_in_threadpool(response_cache.put, query.message, answer, time.perf_counter() - started,
+                                    generation)
+        return {"response": answer}
     except Exception as e:
         logger.error(f"Error in query endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if config is not None:
+            await _end_conversation(query, config)
 
 @app.post("/query-stream")
 async def query_stream(query: Query):
     try:
-        logger.info(f"Received streaming query: {query.message}")
+        logger.debug("Received streaming query: %s", query.message)
         initial_message: Message = {"role": "user", "content": query.message}
+        filters = query.filters()
         
         async def generate():
+            config = None
             try:
-                response = streaming_app.invoke(
-                    {"messages": [initial_message], "stream": True},
-                    config={"configurable": {"thread_id": query.thread_id}}
-                )
-                messages = response.get("messages", [])
-                if not messages:
+                config, cacheable = await _start_conversation(query)
+                cached = await run_in_threadpool(response_cache.get, query.message) if cacheable else None
+                if cached is not None:
+                    await _record_cached_turn(query, config, cached)
+                    yield f"id: 0\nevent: message\ndata: {json.dumps({'content': cached, 'cached': True})}\n\n"
+                    yield "event: done\ndata: [DONE]\n\n"
+                    return
+
+                generation = response_cache.generation
+                started = time.perf_counter()
+                answer = []
+                async for chunk in streaming_app.astream(
+                    {"messages": [initial_message], "stream": True, "filters": filters},
+                    config=config,
+                    stream_mode="custom"
+                ):
+                    answer.append(chunk["content"])
+                    yield f"id: {len(answer) - 1}\nevent: message\ndata: {json.dumps({'content': chunk['content']})}\n\n"
+
+                if not answer:
                     error_msg = json.dumps({"error": "No messages in response"})
                     yield f"event: error\ndata: {error_msg}\n\n"
-                    yield f"event: done\ndata: [DONE]\n\n"
+                    yield "event: done\ndata: [DONE]\n\n"
                     return
 
-                for i, message in enumerate(messages):
-                    if message["role"] == "assistant":
-                        yield f"id: {i}\nevent: message\ndata: {json.dumps({'content': message['content']})}\n\n"
-                yield f"event: done\ndata: [DONE]\n\n"
+                if cacheable:
+                    await run_in_threadpool(response_cache.put, query.message, "".join(answer),
+                                            time.perf_counter() - started, generation)
+                yield "event: done\ndata: [DONE]\n\n"
             except Exception as e:
                 error_msg = json.dumps({"error": str(e)})
                 yield f"event: error\ndata: {error_msg}\n\n"
-                yield f"event: done\ndata: [DONE]\n\n"
+                yield "event: done\ndata: [DONE]\n\n"
+            finally:
+                if config is not None:
+                    await _end_conversation(query, config)
         
         return StreamingResponse(
             generate(),
@@ -113,59 +293,195 @@ async def query_options():
         }
     )
 
-@app.post("/update")
-async def update(file: UploadFile = File(...)):
+@app.get("/health")
+async def health():
     try:
-        logger.info(f"Received file: {file.filename}")
-        kb = ChromaDBKnowledgeBase()
-        content = await file.read()
-        
-        if file.filename.endswith(".txt"):
-            # Read plain text
-            text_content = content.decode('utf-8')
-            logger.info(f"Text content: {text_content[:100]}...")
-            kb.add_documents([text_content])
-            return {"message": "Knowledge base updated successfully with text content"}
-            
-        elif file.filename.endswith(".json"):
-            # Parse JSON content
-            try:
-                json_data = json.loads(content.decode('utf-8'))
-                
-                # Handle our crawler's JSON format
-                if isinstance(json_data, dict) and 'content' in json_data:
-                    text_content = json_data['content']
-                    source_url = json_data.get('url', 'Unknown source')
-                    timestamp = json_data.get('timestamp', 'Unknown time')
-                    
-                    logger.info(f"Processing JSON from {source_url} at {timestamp}")
-                    logger.info(f"Content preview: {text_content[:100]}...")
-                    
-                    kb.add_documents([text_content])
-                    return {
-                        "message": "Knowledge base updated successfully with JSON content",
-                        "source": source_url,
-                        "timestamp": timestamp
-                    }
-                else:
-                    # Handle array of text or other JSON formats
-                    if isinstance(json_data, list):
-                        text_content = [str(item) for item in json_data]
-                    else:
-                        text_content = [json.dumps(json_data, ensure_ascii=False)]
-                    
-                    kb.add_documents(text_content)
-                    return {"message": "Knowledge base updated successfully with JSON content"}
-                    
-            except json.JSONDecodeError as e:
-                raise HTTPException(status_code=400, detail=f"Invalid JSON format: {str(e)}")
-                
-        elif file.filename.endswith(".pdf"):
-            # Extract text from PDF
-            return {"message": "PDF support coming soon"}
+        return get_knowledge_base().health()
+    except Exception as e:
+        logger.error(f"Error in health endpoint: {str(e)}")
+        return JSONResponse(
+            status_code=503,
+            content={"status": "error", "error": str(e)}
+        )
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return response_cache.stats()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Stage, request and LLM latency histograms in the Prometheus text format."""
+    body, content_type = metrics.exposition()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/llm/stats")
+async def llm_stats():
+    return llm_metrics.stats()
+
+@app.get("/rerank/stats")
+async def rerank_stats():
+    if rag_graph.reranker is None:
+        return {"enabled": False}
+    return {"enabled": True, **rag_graph.reranker.stats()}
+
+@app.get("/retrieval/stats")
+async def retrieval_stats():
+    if rag_graph.retrieval_scheduler is None:
+        return {"enabled": False}
+    return {"enabled": True, **rag_graph.retrieval_scheduler.stats()}
+
+@app.get("/expansion/stats")
+async def expansion_stats():
+    if rag_graph.query_expander is None:
+        return {"enabled": False}
+    return {"enabled": True, **rag_graph.query_expander.stats()}
+
+# Documents embedded and written together by /update-batch
+UPDATE_BATCH_SIZE = int(os.environ.get("UPDATE_BATCH_SIZE", "64"))
+
+@app.post("/update-batch", dependencies=[Depends(_require_writer)])
+async def update_batch(request: Request):
+    """
+    Ingest many documents from an NDJSON request body.
+
+    Each line is a JSON object with ``content`` and optionally ``url`` and
+    ``timestamp``, like the crawler's JSON files. The body is read as a
+    stream and indexed in batches of UPDATE_BATCH_SIZE, so memory use does
+    not grow with the request size. Documents with a ``url`` replace what
+    was stored for that URL; the timestamp is stored as ``crawled_at``.
+    """
+    kb = get_knowledge_base()
+    pages = {}
+    metadata = {}
+    unsourced = []
+    chunk_ids = {}
+    errors = []
+    stats = {"documents": 0, "chunks": 0}
+
+    async def flush():
+        if pages:
+            stored = await run_in_threadpool(kb.replace_sources, dict(pages), dict(metadata))
+            chunk_ids.update(stored)
+            stats["chunks"] += sum(len(ids) for ids in stored.values())
+            pages.clear()
+            metadata.clear()
+        if unsourced:
+            ids = await run_in_threadpool(kb.add_documents, list(unsourced))
+            stats["chunks"] += len(ids)
+            unsourced.clear()
+
+    async def handle(line_number: int, line: bytes):
+        if not line.strip():
+            return
+        try:
+            record = json.loads(line)
+            content = record["content"]
+            if not isinstance(content, str):
+                raise ValueError("content must be a string")
+        except (ValueError, KeyError, TypeError) as e:
+            errors.append({"line": line_number, "error": str(e)})
+            return
+        stats["documents"] += 1
+        if record.get("url"):
+            pages[record["url"]] = content
+            metadata[record["url"]] = record_metadata(record)
         else:
-            raise HTTPException(status_code=400, detail="Unsupported file format")
-            
+            unsourced.append(content)
+        if len(pages) + len(unsourced) >= UPDATE_BATCH_SIZE:
+            await flush()
+
+    try:
+        buffer = b""
+        line_number = 0
+        async for data in request.stream():
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                line_number += 1
+                await handle(line_number, line)
+        await handle(line_number + 1, buffer)
+        await flush()
     except Exception as e:
-        logger.error(f"Error in update endpoint: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        logger.error(f"Error in update-batch endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if stats["chunks"]:
+            response_cache.invalidate()
+
+    logger.info(f"Batch update: {stats['documents']} documents, {stats['chunks']} chunks, {len(errors)} bad lines")
+    return {
+        "message": "Knowledge base updated successfully with batch content",
+        "documents": stats["documents"],
+        "chunks": stats["chunks"],
+        "chunk_ids": chunk_ids,
+        "errors": errors
+    }
+
+@app.delete("/documents", dependencies=[Depends(_require_writer)])
+async def delete_documents(source: str):
+    """Remove everything stored for a source (e.g. a page that no longer exists)."""
+    try:
+        deleted = await run_in_threadpool(get_knowledge_base().delete_source, source)
+    except Exception as e:
+        logger.error(f"Error in delete endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if deleted:
+        response_cache.invalidate()
+    return {"source": source, "deleted": deleted}
+
+@app.post("/update", dependencies=[Depends(_require_writer)])
+async def update(file: UploadFile = File(...), wait: bool = False):
+    """
+    Index an uploaded .txt, .json, .ndjson/.jsonl or .pdf file.
+
+    The upload is streamed to disk and indexed by a background job, so large
+    files neither sit in memory nor hold the request open. The response
+    carries the job ID to poll at /jobs/{id}; with ``wait=true`` it is sent
+    once the job has finished, with the job's result.
+    """
+    logger.info(f"Received file: {file.filename}")
+    suffix = Path(file.filename or "").suffix.lower()
+    if suffix not in SUPPORTED_SUFFIXES:
+        raise HTTPException(status_code=400, detail="Unsupported file format")
+
+    path = None
+    try:
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=UPLOAD_DIR)
+        with os.fdopen(fd, "wb") as out:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await run_in_threadpool(out.write, chunk)
+        # The job deletes the file once it has run or been cancelled
+        job = jobs.submit("update", _index_upload, Path(path), suffix, description=file.filename,
+                          cleanup=partial(Path(path).unlink, missing_ok=True))
+    except Exception as e:
+        logger.error(f"Error receiving upload: {str(e)}")
+        if path is not None:
+            Path(path).unlink(missing_ok=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if not wait:
+        return JSONResponse(status_code=202, content={
+            "message": "Upload accepted for indexing",
+            "job_id": job.id,
+            "status": job.status
+        })
+
+    await asyncio.wrap_future(job.future)
+    if job.status == "failed":
+        status_code = 400 if isinstance(job.exception, ValueError) else 500
+        raise HTTPException(status_code=status_code, detail=job.error)
+    return {"message": "Knowledge base updated successfully", "job_id": job.id, **job.result}
+
+def _index_upload(job: Job, path: Path, suffix: str):
+    try:
+        return index_file(get_knowledge_base(), path, suffix, batch_size=UPDATE_BATCH_SIZE, progress=job.update)
+    finally:
+        response_cache.invalidate()
+
+@app.get("/jobs/{job_id}", dependencies=[Depends(_require_writer)])
+async def job_status(job_id: str):
+    """Progress and outcome of a background indexing job; jobs run on the indexer."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job.as_dict()
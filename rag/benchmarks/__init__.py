@@ -0,0 +1,4 @@
+"""
+Benchmarks for the RAG service. Run from the rag/ directory, e.g.
+``python -m benchmarks.bench_ingest``.
+"""
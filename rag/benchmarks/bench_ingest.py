@@ -0,0 +1,68 @@
+"""
+Per-document ingest time as the collection grows.
+
+Pre-fills a scratch collection to each target size with random vectors, then
+times add_documents() for a fixed sample of new documents. With
+content-addressed IDs the per-document time should stay flat as the stored
+chunk count grows.
+
+    python -m benchmarks.bench_ingest --sizes 1000,10000,100000,1000000
+"""
+import argparse
+import json
+import tempfile
+import time
+import numpy as np
+from knowledge_base import ChromaDBKnowledgeBase
+from benchmarks.fake_embeddings import FakeEmbeddingFunction
+
+
+def prefill(kb: ChromaDBKnowledgeBase, target: int, dim: int, rng: np.random.Generator):
+    batch_size = kb.client.get_max_batch_size()
+    current = kb.collection.count()
+    while current < target:
+        n = min(batch_size, target - current)
+        embeddings = rng.standard_normal((n, dim), dtype=np.float32)
+        kb.collection.add(
+            ids=[f"prefill_{current + i}" for i in range(n)],
+            embeddings=embeddings,
+            documents=[f"prefill chunk {current + i}" for i in range(n)]
+        )
+        current += n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest time vs. collection size")
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000",
+                        help="Comma-separated stored chunk counts to measure at")
+    parser.add_argument("--sample", type=int, default=200, help="Documents timed per size")
+    parser.add_argument("--dim", type=int, default=384, help="Embedding dimension")
+    args = parser.parse_args()
+
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    rng = np.random.default_rng(0)
+    results = []
+
+    with tempfile.TemporaryDirectory() as storage:
+        kb = ChromaDBKnowledgeBase(path=storage, embedding_function=FakeEmbeddingFunction(args.dim))
+        for size in sizes:
+            prefill(kb, size, args.dim, rng)
+            documents = [f"benchmark document {size} {i} ranger witch monk" for i in range(args.sample)]
+            started = time.perf_counter()
+            for document in documents:
+                kb.add_documents([document])
+            elapsed = time.perf_counter() - started
+            result = {
+                "stored_chunks": size,
+                "sample": args.sample,
+                "ms_per_document": round(elapsed / args.sample * 1000, 3),
+            }
+            results.append(result)
+            print(json.dumps(result))
+        kb.close()
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Chroma vs. the quantized memory-mapped backend on the benchmark corpus.
+
+Builds the same corpus (fake embeddings) with both backends, then for each
+opens the store in a fresh process and runs the same dense queries,
+reporting recall@k against exact search over the float vectors, query
+latency, resident memory, open time and size on disk. The fake embeddings
+produce many tied scores, so a result counts towards recall when its
+exact score is at least that of the k-th exact neighbour.
+
+    python -m benchmarks.bench_quantized --chunks 100k --queries 500
+    python -m benchmarks.bench_quantized --chunks 1M --storage /tmp/bench-quantized --nprobe 8,16,32
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+import numpy as np
+from knowledge_base import create_knowledge_base
+from benchmarks import corpus
+from benchmarks.fake_embeddings import FakeEmbeddingFunction
+from benchmarks.load_test import percentile_ms
+
+def directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+def rss_mb() -> float:
+    """Current resident set size (Linux), else the peak."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        # ru_maxrss is in kilobytes on Linux, bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def measure(backend: str, path: str, queries: np.ndarray, k: int, options: dict, results):
+    """Open one store and time its dense queries; runs in a child process so memory is its own."""
+    baseline = rss_mb()
+    started = time.perf_counter()
+    kb = create_knowledge_base(backend, path=path, embedding_function=FakeEmbeddingFunction(queries.shape[1]),
+                               read_only=True, **options)
+    open_seconds = time.perf_counter() - started
+    latencies, ids = [], []
+    for query in queries:
+        started = time.perf_counter()
+        ids.append(kb.collection.query(query_embeddings=query[None, :], n_results=k)["ids"][0])
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    rss = rss_mb() - baseline
+    kb.close()
+    results.put({
+        "open_ms": round(open_seconds * 1000, 1),
+        "p50_ms": percentile_ms(latencies, 0.5),
+        "p95_ms": percentile_ms(latencies, 0.95),
+        "rss_mb": round(rss, 1),
+        "ids": ids,
+    })
+
+def run(backend: str, path: str, queries: np.ndarray, k: int, options: dict) -> dict:
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    child = context.Process(target=measure, args=(backend, path, queries, k, options, results))
+    child.start()
+    result = results.get()
+    child.join()
+    return result
+
+def exact_scores(path: str, queries: np.ndarray, k: int, found: list) -> tuple:
+    """
+    Brute force over the float vectors the quantized store keeps.
+
+    Returns:
+        (score of the k-th exact neighbour per query, exact score of every
+        ID in ``found`` per query)
+    """
+    kb = create_knowledge_base("quantized", path=path, embedding_function=FakeEmbeddingFunction(queries.shape[1]),
+                               read_only=True)
+    collection = kb.collection
+    slot_of = dict(collection._db.execute("SELECT id, slot FROM chunks"))
+    slots = np.array(sorted(slot_of.values()))
+    normalized = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    best = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    for start in range(0, len(slots), 65536):
+        scores = normalized @ np.asarray(collection._vectors[slots[start:start + 65536]]).T
+        best = -np.partition(-np.hstack([best, scores]), k - 1, axis=1)[:, :k]
+    thresholds = best.min(axis=1)
+    found_scores = [
+        [float(normalized[i] @ collection._vectors[slot_of[chunk_id]]) for chunk_id in ids]
+        for i, ids in enumerate(found)
+    ]
+    kb.close()
+    return thresholds, found_scores
+
+def recall(thresholds: np.ndarray, found_scores: list, k: int) -> float:
+    """Tie-aware recall@k: share of the top k results scoring at least the k-th exact neighbour."""
+    return round(float(np.mean([
+        sum(score >= threshold - 1e-5 for score in scores[:k]) / k
+        for threshold, scores in zip(thresholds, found_scores)
+    ])), 4)
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall, latency and memory: Chroma vs. quantized backend")
+    parser.add_argument("--chunks", default="100k", help="Corpus size, e.g. 10k, 100k, 1M")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per query; recall is reported at 1, 5 and k")
+    parser.add_argument("--nprobe", default="16", help="Comma-separated QUANTIZED_NPROBE values to measure")
+    parser.add_argument("--rescore", type=int, default=10, help="QUANTIZED_RESCORE")
+    parser.add_argument("--ivf-min", type=int, default=50000,
+                        help="QUANTIZED_IVF_MIN; smaller corpora are scanned without inverted lists")
+    parser.add_argument("--storage", help="Directory for the two stores (reused between runs)")
+    args = parser.parse_args()
+
+    chunks = corpus.parse_count(args.chunks)
+    with tempfile.TemporaryDirectory() as scratch:
+        storage = args.storage or scratch
+        paths = {backend: os.path.join(storage, f"{backend}-{chunks}") for backend in ("chroma", "quantized")}
+        for backend, path in paths.items():
+            if backend == "quantized":
+                os.environ["QUANTIZED_IVF_MIN"] = str(args.ivf_min)
+            build = corpus.build_store(path, chunks, backend=backend)
+            print(json.dumps({"backend": backend, "build": build, "disk_mb": round(directory_bytes(path) / 1e6, 1)}),
+                  flush=True)
+
+        questions = corpus.questions(args.queries, corpus.pages_for_chunks(chunks), seed=1)
+        queries = np.asarray(FakeEmbeddingFunction()(questions), dtype=np.float32)
+        configurations = [("chroma", {})] + [
+            ("quantized", {"nprobe": int(nprobe), "rescore": args.rescore}) for nprobe in args.nprobe.split(",")
+        ]
+        for backend, options in configurations:
+            result = run(backend, paths[backend], queries, args.k, options)
+            found = result.pop("ids")
+            summary = {"backend": backend, **options, "chunks": chunks}
+            for k in sorted({1, 5, args.k}):
+                thresholds, found_scores = exact_scores(paths["quantized"], queries, k, found)
+                summary[f"recall@{k}"] = recall(thresholds, found_scores, k)
+            print(json.dumps({**summary, **result}), flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Retrieval throughput with and without the batching scheduler.
+
+Builds a corpus store (fake embeddings), then for each concurrency level
+runs the same questions from that many threads, first calling
+get_documents() directly and then through a RetrievalScheduler, and
+reports queries/sec and latency for both. The default embedding model is
+where batching pays off most; pass --real-embeddings to use it.
+
+    python -m benchmarks.bench_retrieval --chunks 100k --concurrency 1,8,32,64
+"""
+import argparse
+import json
+import tempfile
+import threading
+import time
+from knowledge_base import ChromaDBKnowledgeBase
+from retrieval_scheduler import RetrievalScheduler
+from benchmarks import corpus
+from benchmarks.fake_embeddings import FakeEmbeddingFunction
+from benchmarks.load_test import percentile_ms
+
+def drive(retrieve, questions, concurrency: int):
+    latencies = []
+    lock = threading.Lock()
+    remaining = iter(questions)
+
+    def worker():
+        while True:
+            with lock:
+                question = next(remaining, None)
+            if question is None:
+                return
+            started = time.perf_counter()
+            retrieve(question)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "queries_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": percentile_ms(latencies, 0.5),
+        "p95_ms": percentile_ms(latencies, 0.95),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched vs. per-query retrieval")
+    parser.add_argument("--chunks", default="10k", help="Corpus size, e.g. 10k, 100k, 1M")
+    parser.add_argument("--concurrency", default="1,8,32,64", help="Comma-separated thread counts")
+    parser.add_argument("--queries", type=int, default=512, help="Queries per level and mode")
+    parser.add_argument("--window-ms", type=float, default=5.0)
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--real-embeddings", action="store_true",
+                        help="Query with the default embedding model (the store keeps fake vectors)")
+    parser.add_argument("--storage", help="Reuse a corpus store built by benchmarks.corpus")
+    args = parser.parse_args()
+
+    chunks = corpus.parse_count(args.chunks)
+    with tempfile.TemporaryDirectory() as scratch:
+        storage = args.storage or scratch
+        print(json.dumps({"build": corpus.build_store(storage, chunks)}), flush=True)
+        kb = ChromaDBKnowledgeBase(path=storage, read_only=True,
+                                   embedding_function=None if args.real_embeddings else FakeEmbeddingFunction())
+        questions = corpus.questions(args.queries, corpus.pages_for_chunks(chunks))
+        for concurrency in [int(level) for level in args.concurrency.split(",")]:
+            kb.get_documents(questions[0])
+            direct = drive(kb.get_documents, questions, concurrency)
+            scheduler = RetrievalScheduler(window=args.window_ms / 1000, max_batch=args.max_batch,
+                                           kb_getter=lambda: kb)
+            batched = drive(scheduler.get_documents, questions, concurrency)
+            result = {
+                "concurrency": concurrency,
+                "direct": direct,
+                "batched": {**batched, "avg_batch_size": scheduler.stats()["avg_batch_size"]},
+                "speedup": round(batched["queries_per_sec"] / direct["queries_per_sec"], 2),
+            }
+            scheduler.close()
+            print(json.dumps(result), flush=True)
+        kb.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+/query throughput as the number of API worker processes grows.
+
+Builds a scratch store with the fake embedding function, starts the fake
+LLM, then for each worker count runs the API read-only with that many
+uvicorn workers over the shared store and drives it with load_test at a
+fixed concurrency. The response cache is disabled so every request is
+retrieved and generated.
+
+    python -m benchmarks.bench_workers --workers 1,2,4,8 --concurrency 32 --requests 512
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from knowledge_base import ChromaDBKnowledgeBase
+from benchmarks.fake_embeddings import FakeEmbeddingFunction
+from benchmarks.load_test import run_level
+
+CLASSES = ["ranger", "witch", "monk", "warrior", "sorceress", "mercenary"]
+
+def build_store(path: str, documents: int):
+    kb = ChromaDBKnowledgeBase(path=path, embedding_function=FakeEmbeddingFunction())
+    pages = {
+        f"https://poe2db.tw/us/Page_{i}": f"# Page {i}\n## {CLASSES[i % len(CLASSES)]}\n"
+                                          f"- Item {i} grants {i % 97} {CLASSES[(i * 7) % len(CLASSES)]} damage"
+        for i in range(documents)
+    }
+    kb.replace_sources(pages)
+    kb.close()
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} did not start")
+
+def stop(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+async def drive(url: str, concurrency: int, requests: int):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=600, limits=limits) as client:
+        # Warm every worker's store and model before measuring
+        await run_level(client, url, concurrency, concurrency, "/query")
+        return await run_level(client, url, concurrency, requests, "/query")
+
+def main():
+    parser = argparse.ArgumentParser(description="QPS scaling across API worker processes")
+    parser.add_argument("--workers", default="1,2,4,8", help="Comma-separated worker counts")
+    parser.add_argument("--documents", type=int, default=5000, help="Pages in the scratch store")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=512, help="Measured requests per worker count")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Fake LLM seconds before answering")
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as storage:
+        build_store(storage, args.documents)
+        llm_port = args.port + 1
+        llm = subprocess.Popen([sys.executable, "-m", "benchmarks.fake_llm", "--port", str(llm_port),
+                                "--latency", str(args.llm_latency), "--tokens", "16", "--tokens-per-sec", "1e6"])
+        env = dict(
+            os.environ,
+            LLM_BASE_URL=f"http://127.0.0.1:{llm_port}/v1",
+            LLM_API_KEY="benchmark",
+            RESPONSE_CACHE_SIZE="0",
+            CHECKPOINT_BACKEND="memory",
+        )
+        results = []
+        try:
+            wait_ready(f"http://127.0.0.1:{llm_port}/docs", llm)
+            for workers in [int(n) for n in args.workers.split(",")]:
+                api = subprocess.Popen(
+                    [sys.executable, "-m", "benchmarks.serve", "--port", str(args.port), "--storage", storage,
+                     "--fake-embeddings", "--read-only", "--workers", str(workers)],
+                    env=env
+                )
+                try:
+                    url = f"http://127.0.0.1:{args.port}"
+                    wait_ready(f"{url}/health", api)
+                    result = asyncio.run(drive(url, args.concurrency, args.requests))
+                finally:
+                    stop(api)
+                result["workers"] = workers
+                results.append(result)
+                print(json.dumps(result), flush=True)
+        finally:
+            stop(llm)
+
+    base = results[0]["requests_per_sec"] if results else 0
+    for result in results:
+        speedup = result["requests_per_sec"] / base if base else 0.0
+        print(f"{result['workers']} workers: {result['requests_per_sec']} req/s ({speedup:.2f}x), "
+              f"p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, {result['errors']} errors")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Synthetic poe2db-like corpus for benchmarks.
+
+Pages look like the crawler's output for poe2db.tw item, skill and
+ascendancy pages: a title and source header followed by a few headed
+sections of mods and properties. Every page is unique and chunks into
+CHUNKS_PER_PAGE chunks, so a store of a given chunk count can be built
+reproducibly from a seed. The same pages can be rendered as HTML for
+extraction benchmarks, and questions are drawn from the page names.
+
+    python -m benchmarks.corpus --chunks 100k --output /tmp/corpus.ndjson
+    python -m benchmarks.corpus --chunks 1M --storage /tmp/bench-1m
+"""
+import argparse
+import html
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List
+from knowledge_base import create_knowledge_base
+from benchmarks.fake_embeddings import FakeEmbeddingFunction
+
+CLASSES = ["Ranger", "Witch", "Monk", "Warrior", "Sorceress", "Mercenary", "Huntress", "Druid"]
+BASES = ["Bow", "Crossbow", "Quarterstaff", "Sceptre", "Wand", "Spear", "Mace", "Flail", "Talisman", "Focus"]
+STATS = ["Physical Damage", "Fire Damage", "Cold Damage", "Lightning Damage", "Chaos Damage", "Attack Speed",
+         "Cast Speed", "Critical Hit Chance", "maximum Life", "maximum Mana", "Evasion Rating", "Armour",
+         "Energy Shield", "Movement Speed", "Spirit", "Projectile Speed", "Area of Effect", "Stun Threshold"]
+SKILLS = ["Lightning Arrow", "Ice Shot", "Tempest Flurry", "Spark", "Fireball", "Raise Zombie", "Boneshatter",
+          "Rolling Slam", "Explosive Grenade", "Frost Bomb", "Twister", "Whirling Assault"]
+SYLLABLES = ["ka", "dor", "vel", "ith", "mor", "zan", "qua", "rhe", "tul", "ash", "gol", "een", "syl", "vorn"]
+KINDS = ["item", "skill", "ascendancy"]
+
+# A header chunk plus one chunk per section
+SECTIONS_PER_PAGE = 3
+CHUNKS_PER_PAGE = SECTIONS_PER_PAGE + 1
+
+CRAWL_START = datetime(2025, 1, 1)
+
+def parse_count(value: str) -> int:
+    """Parse counts such as ``1000``, ``100k`` or ``1M``."""
+    value = value.strip().lower()
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    return int(float(value.rstrip("km")) * multiplier)
+
+def page(index: int, seed: int = 0) -> Dict[str, Any]:
+    """
+    The ``index``-th page of the corpus, the same for a given seed.
+
+    Returns:
+        A crawler-style document: ``url``, ``title``, ``content`` (markdown),
+        ``timestamp`` and the ``sections`` it was rendered from
+    """
+    rng = random.Random(seed * 1_000_003 + index)
+    kind = KINDS[index % len(KINDS)]
+    name = "".join(rng.choice(SYLLABLES) for _ in range(3)).capitalize()
+    if kind == "item":
+        title = f"{name} {rng.choice(BASES)}"
+    elif kind == "skill":
+        title = f"{name} {rng.choice(SKILLS)}"
+    else:
+        title = f"{name} {rng.choice(CLASSES)} Ascendancy"
+    # The index keeps titles, and so every chunk, unique
+    title = f"{title} {index}"
+    slug = title.replace(" ", "_")
+
+    sections = []
+    for heading in rng.sample(["Properties", "Modifiers", "Requirements", "Notes", "Drop Sources", "Variants"],
+                              SECTIONS_PER_PAGE):
+        lines = []
+        for _ in range(rng.randint(3, 6)):
+            low = rng.randint(1, 40)
+            lines.append(f"{low}-{low + rng.randint(5, 60)}% increased {rng.choice(STATS)}")
+        lines.append(f"Used by the {rng.choice(CLASSES)} with {rng.choice(SKILLS)}")
+        sections.append((heading, lines))
+
+    timestamp = (CRAWL_START + timedelta(minutes=index)).isoformat()
+    content = [f"# {title} - PoE2DB", f"Source: https://poe2db.tw/us/{slug}", f"Crawled at: {timestamp}", ""]
+    for heading, lines in sections:
+        content.append(f"## {heading}")
+        content.extend(f"- {line}" for line in lines)
+        content.append("")
+    return {
+        "url": f"https://poe2db.tw/us/{slug}",
+        "title": title,
+        "content": "\n".join(content),
+        "timestamp": timestamp,
+        "sections": sections,
+    }
+
+def pages(count: int, start: int = 0, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    for index in range(start, start + count):
+        yield page(index, seed)
+
+def pages_for_chunks(chunks: int) -> int:
+    return -(-chunks // CHUNKS_PER_PAGE)
+
+def render_html(document: Dict[str, Any]) -> str:
+    """Render a page the way poe2db serves it, with site chrome the extractor must skip."""
+    body = [f"<h1>{html.escape(document['title'])}</h1>"]
+    for heading, lines in document["sections"]:
+        body.append(f"<section><h2>{html.escape(heading)}</h2>")
+        if heading == "Modifiers":
+            body.append("<table>" + "".join(f"<tr><td>{html.escape(line)}</td></tr>" for line in lines) + "</table>")
+        else:
+            body.append("<ul>" + "".join(f"<li>{html.escape(line)}</li>" for line in lines) + "</ul>")
+        body.append("</section>")
+    return (
+        f"<html><head><title>{html.escape(document['title'])} - PoE2DB</title>"
+        "<script>window.dataLayer = [];</script><style>td { padding: 2px }</style></head><body>"
+        "<header><nav><a href='/us/'>Home</a><a href='/us/Items'>Items</a><a href='/us/Gems'>Gems</a></nav></header>"
+        f"<main>{''.join(body)}</main>"
+        "<footer><p>Path of Exile 2 database</p></footer></body></html>"
+    )
+
+def questions(count: int, pages_in_corpus: int, seed: int = 0) -> List[str]:
+    """Questions about random pages of a corpus of ``pages_in_corpus`` pages."""
+    rng = random.Random(seed)
+    templates = [
+        "What does {title} do?",
+        "Which modifiers can {title} roll?",
+        "What are the requirements of {title}?",
+        "Is {title} good for a {cls}?",
+    ]
+    result = []
+    for _ in range(count):
+        title = page(rng.randrange(pages_in_corpus), seed)["title"]
+        result.append(rng.choice(templates).format(title=title, cls=rng.choice(CLASSES)))
+    return result
+
+def build_store(path: str, chunks: int, seed: int = 0, dim: int = 384,
+                batch_size: int = 1024, backend: str = "chroma") -> Dict[str, Any]:
+    """
+    Fill the store at ``path`` with at least ``chunks`` corpus chunks.
+
+    Uses the fake embedding function, so the store must be served with
+    ``--fake-embeddings``. A store that already holds enough chunks is
+    reused as is, which keeps the 1M-chunk store a one-off cost.
+    ``backend`` is a KB_BACKEND value.
+
+    Returns:
+        Stored chunk and page counts and the build time in seconds
+    """
+    started = time.perf_counter()
+    kb = create_knowledge_base(backend, path=path, embedding_function=FakeEmbeddingFunction(dim))
+    try:
+        stored = kb.collection.count()
+        if stored < chunks:
+            # Pages are added in order, so the stored ones are a prefix of the corpus
+            start = stored // CHUNKS_PER_PAGE
+            documents = (document["content"] for document in
+                         pages(pages_for_chunks(chunks) - start, start=start, seed=seed))
+            kb.bulk_add(documents, batch_size=batch_size)
+        stored = kb.collection.count()
+    finally:
+        kb.close()
+    return {
+        "chunks": stored,
+        "pages": pages_for_chunks(stored),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+def write_ndjson(path: str, count: int, start: int = 0, seed: int = 0):
+    """Write pages as NDJSON crawler documents, the format /update and /update-batch accept."""
+    with open(path, "w", encoding="utf-8") as out:
+        for document in pages(count, start=start, seed=seed):
+            out.write(json.dumps({key: document[key] for key in ("url", "content", "timestamp")}) + "\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic poe2db-like corpus")
+    parser.add_argument("--chunks", default="1k", help="Corpus size in chunks, e.g. 1k, 100k, 1M")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the pages as NDJSON to this file")
+    parser.add_argument("--storage", help="Build a store (fake embeddings) at this path")
+    parser.add_argument("--backend", default="chroma", help="KB_BACKEND of the store: chroma or quantized")
+    args = parser.parse_args()
+    if not args.output and not args.storage:
+        parser.error("Pass --output and/or --storage")
+
+    chunks = parse_count(args.chunks)
+    if args.output:
+        write_ndjson(args.output, pages_for_chunks(chunks), seed=args.seed)
+        print(json.dumps({"output": args.output, "pages": pages_for_chunks(chunks)}))
+    if args.storage:
+        print(json.dumps(build_store(args.storage, chunks, seed=args.seed, backend=args.backend)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import hashlib
+import numpy as np
+from chromadb.api.types import EmbeddingFunction
+
+
+class FakeEmbeddingFunction(EmbeddingFunction):
+    """
+    Cheap deterministic embedding function for benchmarks.
+
+    Hashes words into a fixed number of buckets so benchmarks measure the
+    storage path rather than the cost of a real embedding model.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def __call__(self, input):
+        vectors = []
+        for text in input:
+            vector = np.zeros(self.dim, dtype=np.float32)
+            for word in text.lower().split():
+                digest = hashlib.md5(word.encode("utf-8")).digest()
+                vector[int.from_bytes(digest[:4], "little") % self.dim] += 1.0
+            vector[0] += 1e-3
+            vectors.append(vector / np.linalg.norm(vector))
+        return vectors
+
+    @staticmethod
+    def name() -> str:
+        return "benchmark-fake"
+
+    def get_config(self):
+        return {"dim": self.dim}
+
+    @staticmethod
+    def build_from_config(config):
+        return FakeEmbeddingFunction(config.get("dim", 384))
@@ -0,0 +1,76 @@
+"""
+Local OpenAI-compatible stand-in for the LLM server.
+
+Answers /v1/chat/completions (streaming and non-streaming) after a fixed
+latency and at a fixed token rate, so API benchmarks measure the service
+rather than the model.
+
+    python -m benchmarks.fake_llm --port 9000 --latency 0.5 --tokens-per-sec 50
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+import uvicorn
+
+def create_app(latency: float = 0.5, tokens_per_sec: float = 50.0, tokens: int = 64) -> FastAPI:
+    app = FastAPI()
+    words = [f"token{i} " for i in range(tokens)]
+
+    def chunk(completion_id: str, model: str, content=None, finish_reason=None) -> str:
+        delta = {"content": content} if content is not None else {}
+        return json.dumps({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        })
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        await asyncio.sleep(latency)
+
+        if body.get("stream"):
+            async def stream():
+                for word in words:
+                    yield f"data: {chunk(completion_id, model, word)}\n\n"
+                    await asyncio.sleep(1 / tokens_per_sec)
+                yield f"data: {chunk(completion_id, model, finish_reason='stop')}\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(stream(), media_type="text/event-stream")
+
+        await asyncio.sleep(tokens / tokens_per_sec)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(words)},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": tokens, "total_tokens": tokens},
+        }
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--tokens", type=int, default=64, help="Tokens per answer")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency, args.tokens_per_sec, args.tokens), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
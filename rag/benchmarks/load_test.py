@@ -0,0 +1,164 @@
+"""
+Concurrent /query load test against a running API.
+
+Every request carries a unique question so the response cache never
+answers it, unless a list of questions is passed in. /query-stream levels
+also report time to the first streamed token and tokens/sec per request.
+Start the fake LLM and point the API at it to measure how throughput
+scales with concurrency inside one worker:
+
+    python -m benchmarks.fake_llm --port 9000 &
+    LLM_BASE_URL=http://127.0.0.1:9000/v1 LLM_API_KEY=x python -m benchmarks.serve --port 8000 --fake-embeddings &
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --concurrency 1,4,16,64
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+import uuid
+from typing import Iterator, List, Optional, Sequence
+import httpx
+
+def percentile_ms(values: List[float], fraction: float) -> Optional[float]:
+    """Percentile of latencies in seconds, in milliseconds; ``values`` must be sorted."""
+    if not values:
+        return None
+    return round(values[int(fraction * (len(values) - 1))] * 1000, 1)
+
+def _messages(questions: Optional[Sequence[str]]) -> Iterator[str]:
+    if questions:
+        return itertools.cycle(questions)
+    return (f"benchmark question {uuid.uuid4().hex}" for _ in itertools.count())
+
+def _request_queue(requests_per_level: int) -> asyncio.Queue:
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(requests_per_level):
+        queue.put_nowait(None)
+    return queue
+
+async def run_level(client: httpx.AsyncClient, url: str, concurrency: int, requests_per_level: int, endpoint: str,
+                    questions: Optional[Sequence[str]] = None):
+    if endpoint == "/query-stream":
+        return await run_stream_level(client, url, concurrency, requests_per_level, questions)
+    latencies = []
+    errors = 0
+    messages = _messages(questions)
+    queue = _request_queue(requests_per_level)
+
+    async def worker():
+        nonlocal errors
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            payload = {"message": next(messages), "thread_id": uuid.uuid4().hex}
+            started = time.perf_counter()
+            try:
+                response = await client.post(f"{url}{endpoint}", json=payload)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+            except httpx.HTTPError:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": requests_per_level,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": percentile_ms(latencies, 0.5),
+        "p95_ms": percentile_ms(latencies, 0.95),
+    }
+
+async def run_stream_level(client: httpx.AsyncClient, url: str, concurrency: int, requests_per_level: int,
+                           questions: Optional[Sequence[str]] = None):
+    """Like run_level for /query-stream, timing the first token and the token rate of each answer."""
+    latencies, first_tokens, token_rates = [], [], []
+    errors = tokens = 0
+    messages = _messages(questions)
+    queue = _request_queue(requests_per_level)
+
+    async def worker():
+        nonlocal errors, tokens
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            payload = {"message": next(messages), "thread_id": uuid.uuid4().hex}
+            started = time.perf_counter()
+            first_token_at = None
+            count = 0
+            try:
+                async with client.stream("POST", f"{url}/query-stream", json=payload) as response:
+                    response.raise_for_status()
+                    event = None
+                    async for line in response.aiter_lines():
+                        if line.startswith("event: "):
+                            event = line[len("event: "):]
+                        elif line.startswith("data: ") and event == "message":
+                            first_token_at = first_token_at or time.perf_counter()
+                            count += 1
+                        elif line.startswith("data: ") and event == "error":
+                            raise httpx.HTTPError(line[len("data: "):])
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            finished = time.perf_counter()
+            latencies.append(finished - started)
+            tokens += count
+            if first_token_at is not None:
+                first_tokens.append(first_token_at - started)
+                if count > 1 and finished > first_token_at:
+                    token_rates.append((count - 1) / (finished - first_token_at))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    first_tokens.sort()
+    token_rates.sort()
+    return {
+        "endpoint": "/query-stream",
+        "concurrency": concurrency,
+        "requests": requests_per_level,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": percentile_ms(latencies, 0.5),
+        "p95_ms": percentile_ms(latencies, 0.95),
+        "ttft_p50_ms": percentile_ms(first_tokens, 0.5),
+        "ttft_p95_ms": percentile_ms(first_tokens, 0.95),
+        "tokens_per_sec": round(tokens / elapsed, 1) if elapsed else 0.0,
+        "request_tokens_per_sec_p50": round(token_rates[len(token_rates) // 2], 1) if token_rates else None,
+    }
+
+async def run(url: str, levels, requests_per_level: int, endpoint: str):
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    results = []
+    async with httpx.AsyncClient(timeout=600, limits=limits) as client:
+        for concurrency in levels:
+            result = await run_level(client, url, concurrency, max(requests_per_level, concurrency), endpoint)
+            results.append(result)
+            print(json.dumps(result))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test for the RAG API")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoint", default="/query")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per concurrency level")
+    args = parser.parse_args()
+    levels = [int(level) for level in args.concurrency.split(",")]
+    asyncio.run(run(args.url, levels, args.requests, args.endpoint))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Run the API for benchmarking.
+
+Opens the shared knowledge base before the app starts so a benchmark can
+use a scratch storage path and, optionally, the fake embedding function
+instead of downloading the real model. With ``--workers`` above 1 each
+uvicorn worker process builds the app through create_app().
+
+    python -m benchmarks.serve --port 8000 --storage /tmp/bench-storage --fake-embeddings
+    python -m benchmarks.serve --port 8000 --storage /tmp/bench-storage --fake-embeddings --workers 4 --read-only
+"""
+import argparse
+import os
+import uvicorn
+from knowledge_base import open_knowledge_base
+from benchmarks.fake_embeddings import FakeEmbeddingFunction
+
+def create_app():
+    """App factory for uvicorn workers, configured by main() through the environment."""
+    open_knowledge_base(
+        path=os.environ.get("BENCH_STORAGE", "./storage"),
+        embedding_function=FakeEmbeddingFunction() if os.environ.get("BENCH_FAKE_EMBEDDINGS") else None
+    )
+    import api
+    return api.app
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the RAG API for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--storage", default="./storage", help="Chroma storage path")
+    parser.add_argument("--fake-embeddings", action="store_true", help="Use the hashing embedding function")
+    parser.add_argument("--workers", type=int, default=1, help="Uvicorn worker processes")
+    parser.add_argument("--read-only", action="store_true", help="Open the store read-only (KB_READ_ONLY)")
+    args = parser.parse_args()
+
+    os.environ["BENCH_STORAGE"] = args.storage
+    if args.fake_embeddings:
+        os.environ["BENCH_FAKE_EMBEDDINGS"] = "1"
+    if args.read_only:
+        os.environ["KB_READ_ONLY"] = "true"
+    if args.workers > 1:
+        uvicorn.run("benchmarks.serve:create_app", factory=True, host=args.host, port=args.port,
+                    workers=args.workers, log_level="warning")
+    else:
+        uvicorn.run(create_app(), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+End-to-end benchmark suite with machine-readable results.
+
+For each corpus size a store is built from the synthetic corpus (fake
+embeddings), the API is started against it and the local fake LLM, and the
+selected scenarios are run:
+
+- ``query``: /query throughput and latency per concurrency level
+- ``query_stream``: /query-stream time to first token, tokens/sec and latency
+- ``update``: /update ingest rate for an NDJSON upload of new pages
+- ``extract``: crawler extraction pages/sec on saved and synthetic HTML
+
+The response cache is disabled so every query is retrieved and generated.
+Results, the mean time per pipeline stage from /metrics and the run's
+environment are written as JSON; ``--compare`` reports the change against a
+previous run and can fail on regressions.
+
+    python -m benchmarks.suite --chunks 1k,100k --output results.json
+    python -m benchmarks.suite --chunks 1k --compare baseline.json --max-regression 10
+    python -m benchmarks.suite --chunks 1M --storage /tmp/bench-1m --scenarios query,query_stream
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+import httpx
+from benchmarks import corpus
+from benchmarks.bench_workers import stop, wait_ready
+from benchmarks.load_test import run_level
+
+SCENARIOS = ["query", "query_stream", "update", "extract"]
+CRAWLER_DIR = Path(__file__).resolve().parents[2] / "crawler"
+
+# Metrics compared between runs and whether higher values are better
+METRICS = {
+    "requests_per_sec": True,
+    "tokens_per_sec": True,
+    "request_tokens_per_sec_p50": True,
+    "docs_per_sec": True,
+    "chunks_per_sec": True,
+    "pages_per_sec": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "ttft_p50_ms": False,
+    "ttft_p95_ms": False,
+}
+
+def environment(args: argparse.Namespace) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).parent, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": vars(args),
+    }
+
+@contextmanager
+def process(args: List[str], ready_url: str, env: Optional[Dict[str, str]] = None) -> Iterator[subprocess.Popen]:
+    proc = subprocess.Popen([sys.executable, "-m", *args], env=env)
+    try:
+        wait_ready(ready_url, proc)
+        yield proc
+    finally:
+        stop(proc)
+
+def stage_means(url: str) -> Dict[str, float]:
+    """Mean milliseconds per pipeline stage, from the API's /metrics."""
+    text = httpx.get(f"{url}/metrics", timeout=30).text
+    totals: Dict[str, Dict[str, float]] = {}
+    for name, stage, value in re.findall(r'^rag_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$', text, re.M):
+        totals.setdefault(stage, {})[name] = float(value)
+    return {
+        stage: round(1000 * values["sum"] / values["count"], 3)
+        for stage, values in sorted(totals.items()) if values.get("count")
+    }
+
+async def run_queries(url: str, endpoint: str, levels: List[int], requests: int,
+                      questions: List[str]) -> List[Dict[str, Any]]:
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    results = []
+    async with httpx.AsyncClient(timeout=600, limits=limits) as client:
+        # Warm up the store, the embedding path and the LLM connection pool
+        await run_level(client, url, max(levels), max(levels), endpoint, questions)
+        for concurrency in levels:
+            results.append(await run_level(client, url, concurrency, max(requests, concurrency), endpoint, questions))
+    return results
+
+def run_update(url: str, documents: int, start: int, seed: int) -> Dict[str, Any]:
+    """Upload ``documents`` new pages to /update and wait for them to be indexed, then remove them."""
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, "update.ndjson")
+        corpus.write_ndjson(path, documents, start=start, seed=seed)
+        started = time.perf_counter()
+        with open(path, "rb") as upload:
+            response = httpx.post(f"{url}/update", params={"wait": "true"}, timeout=3600,
+                                  files={"file": ("update.ndjson", upload, "application/x-ndjson")})
+        elapsed = time.perf_counter() - started
+        response.raise_for_status()
+        result = response.json()
+    # Keep the store at its corpus size so runs against a reused store compare
+    for document in corpus.pages(documents, start=start, seed=seed):
+        httpx.delete(f"{url}/documents", params={"source": document["url"]}, timeout=60).raise_for_status()
+    return {
+        "documents": result["documents"],
+        "chunks": result["chunks"],
+        "seconds": round(elapsed, 3),
+        "docs_per_sec": round(result["documents"] / elapsed, 2),
+        "chunks_per_sec": round(result["chunks"] / elapsed, 2),
+    }
+
+def run_extract(fixtures: Path, synthetic_pages: int, iterations: int, seed: int) -> Dict[str, Any]:
+    """Crawler extraction throughput (static_extract) on saved fixtures plus rendered corpus pages."""
+    sys.path.insert(0, str(CRAWLER_DIR))
+    from static_extract import extract_page
+
+    pages = [(f"https://poe2db.tw/us/{path.stem}", path.read_text(encoding="utf-8"))
+             for path in sorted(fixtures.glob("*.html"))]
+    pages += [(document["url"], corpus.render_html(document))
+              for document in corpus.pages(synthetic_pages, seed=seed)]
+    size = sum(len(html.encode("utf-8")) for _, html in pages)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for url, html in pages:
+            extract_page(html, url)
+    elapsed = time.perf_counter() - started
+    return {
+        "pages": len(pages),
+        "iterations": iterations,
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(len(pages) * iterations / elapsed, 1),
+        "mb_per_sec": round(size * iterations / elapsed / 1e6, 2),
+    }
+
+def run_size(args: argparse.Namespace, chunks: int, storage: str, llm_url: str) -> List[Dict[str, Any]]:
+    build = corpus.build_store(storage, chunks, seed=args.seed)
+    results = [{"scenario": "build", **build, "chunks": chunks, "stored_chunks": build["chunks"]}]
+    print(json.dumps(results[-1]), flush=True)
+    env = dict(
+        os.environ,
+        LLM_BASE_URL=f"{llm_url}/v1",
+        LLM_API_KEY=os.environ.get("LLM_API_KEY", "benchmark"),
+        RESPONSE_CACHE_SIZE="0",
+        CHECKPOINT_BACKEND="memory",
+        PROFILE_SAMPLE_RATE="0",
+    )
+    url = f"http://127.0.0.1:{args.port}"
+    levels = [int(level) for level in args.concurrency.split(",")]
+    questions = corpus.questions(max(args.requests, 256), corpus.pages_for_chunks(build["chunks"]), seed=args.seed)
+    with process(["benchmarks.serve", "--port", str(args.port), "--storage", storage, "--fake-embeddings"],
+                 f"{url}/health", env):
+        for scenario, endpoint in (("query", "/query"), ("query_stream", "/query-stream")):
+            if scenario in args.scenarios:
+                for result in asyncio.run(run_queries(url, endpoint, levels, args.requests, questions)):
+                    results.append({"scenario": scenario, "chunks": chunks, **result})
+                    print(json.dumps(results[-1]), flush=True)
+        if "update" in args.scenarios:
+            update = run_update(url, args.update_documents, corpus.pages_for_chunks(build["chunks"]), args.seed + 1)
+            results.append({"scenario": "update", **update, "chunks": chunks, "uploaded_chunks": update["chunks"]})
+            print(json.dumps(results[-1]), flush=True)
+        results.append({"scenario": "stages", "chunks": chunks, "mean_ms": stage_means(url)})
+        print(json.dumps(results[-1]), flush=True)
+    return results
+
+def result_key(result: Dict[str, Any]) -> tuple:
+    return result["scenario"], result.get("chunks"), result.get("concurrency")
+
+def compare(baseline: Dict[str, Any], results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Relative change of every compared metric against a baseline run.
+
+    Returns:
+        One entry per metric, with ``regression_pct`` positive when the
+        metric got worse
+    """
+    previous = {result_key(result): result for result in baseline.get("results", [])}
+    changes = []
+    for result in results:
+        before = previous.get(result_key(result))
+        if before is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            changes.append({
+                "scenario": result["scenario"],
+                "chunks": result.get("chunks"),
+                "concurrency": result.get("concurrency"),
+                "metric": metric,
+                "baseline": old,
+                "value": new,
+                "change_pct": round(change, 1),
+                "regression_pct": round(-change if higher_is_better else change, 1),
+            })
+    return changes
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end RAG benchmark suite")
+    parser.add_argument("--chunks", default="1k", help="Comma-separated corpus sizes, e.g. 1k,100k,1M")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated subset of {SCENARIOS}")
+    parser.add_argument("--concurrency", default="1,8", help="Comma-separated concurrency levels for queries")
+    parser.add_argument("--requests", type=int, default=64, help="Queries per concurrency level")
+    parser.add_argument("--update-documents", type=int, default=500, help="Pages uploaded by the update scenario")
+    parser.add_argument("--extract-pages", type=int, default=200, help="Synthetic HTML pages for the extract scenario")
+    parser.add_argument("--extract-iterations", type=int, default=20)
+    parser.add_argument("--fixtures", default=str(CRAWLER_DIR / "benchmarks" / "fixtures"),
+                        help="Directory of saved .html pages for the extract scenario")
+    parser.add_argument("--storage", help="Directory for the corpus stores (reused between runs); "
+                                          "a temporary directory by default")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-latency", type=float, default=0.1, help="Fake LLM seconds before the first token")
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--llm-tokens", type=int, default=64, help="Tokens per fake LLM answer")
+    parser.add_argument("--port", type=int, default=8200, help="API port; the fake LLM listens on the next one")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Results JSON of a previous run to compare against")
+    parser.add_argument("--max-regression", type=float,
+                        help="Exit with status 1 if any metric is this many percent worse than --compare")
+    args = parser.parse_args()
+    args.scenarios = [scenario.strip() for scenario in args.scenarios.split(",")]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {sorted(unknown)}")
+
+    run = {"environment": environment(args), "results": []}
+    results = run["results"]
+    if "extract" in args.scenarios:
+        results.append({"scenario": "extract", **run_extract(Path(args.fixtures), args.extract_pages,
+                                                             args.extract_iterations, args.seed)})
+        print(json.dumps(results[-1]), flush=True)
+
+    sizes = [corpus.parse_count(size) for size in args.chunks.split(",")]
+    if set(args.scenarios) - {"extract"}:
+        llm_url = f"http://127.0.0.1:{args.port + 1}"
+        with tempfile.TemporaryDirectory() as scratch, process(
+                ["benchmarks.fake_llm", "--port", str(args.port + 1), "--latency", str(args.llm_latency),
+                 "--tokens-per-sec", str(args.llm_tokens_per_sec), "--tokens", str(args.llm_tokens)],
+                f"{llm_url}/docs"):
+            for chunks in sizes:
+                storage = os.path.join(args.storage or scratch, f"corpus-{chunks}-seed{args.seed}")
+                results.extend(run_size(args, chunks, storage, llm_url))
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            run["comparison"] = compare(json.load(f), results)
+        for change in run["comparison"]:
+            print(f"{change['scenario']} chunks={change['chunks']} concurrency={change['concurrency']} "
+                  f"{change['metric']}: {change['baseline']} -> {change['value']} ({change['change_pct']:+.1f}%)")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+
+    if args.compare and args.max_regression is not None:
+        regressions = [change for change in run["comparison"] if change["regression_pct"] > args.max_regression]
+        if regressions:
+            print(f"{len(regressions)} metrics regressed by more than {args.max_regression}%")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
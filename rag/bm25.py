@@ -0,0 +1,169 @@
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; keeps item, skill and mod names matchable verbatim."""
+    return _TOKEN_RE.findall(text.lower())
+
+class BM25Index:
+    """
+    Persistent inverted index scored with Okapi BM25.
+
+    Postings live in SQLite next to the vector store and are updated
+    incrementally as chunks are written or deleted, so the index never has to
+    be rebuilt from scratch. Chunk IDs are content-addressed, so adding an ID
+    that is already indexed is a no-op.
+
+    With ``read_only`` the file is opened without creating or changing it;
+    until the writer has created it the index is empty (``in_memory``).
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75, read_only: bool = False):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.read_only = read_only
+        self.in_memory = read_only and not os.path.exists(path)
+        self._lock = threading.Lock()
+        if self.in_memory:
+            self._db = sqlite3.connect(":memory:", check_same_thread=False)
+        elif read_only:
+            self._db = sqlite3.connect(f"{Path(os.path.abspath(path)).as_uri()}?mode=ro", uri=True,
+                                       check_same_thread=False)
+        else:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA cache_size=-65536")
+        if read_only and not self.in_memory:
+            return
+        # Postings reference documents by integer key to keep rows small; each
+        # document keeps its term list so deletes need no secondary index
+        self._db.execute("CREATE TABLE IF NOT EXISTS docs (key INTEGER PRIMARY KEY, id TEXT UNIQUE, length INTEGER, terms TEXT)")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT, doc INTEGER, tf INTEGER, PRIMARY KEY (term, doc)
+            ) WITHOUT ROWID
+        """)
+        self._db.execute("CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER) WITHOUT ROWID")
+        self._db.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)")
+        self._db.execute("INSERT OR IGNORE INTO stats VALUES ('docs', 0), ('length', 0)")
+        self._db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._stat("docs")
+
+    def add(self, ids: List[str], texts: List[str]):
+        """Index chunks; IDs already present are skipped."""
+        if not ids:
+            return
+        with self._lock:
+            present = {row[0] for row in self._select_in("SELECT id FROM docs WHERE id IN ({})", ids)}
+            next_key = self._db.execute("SELECT COALESCE(MAX(key), 0) + 1 FROM docs").fetchone()[0]
+            docs: List[Tuple[int, str, int, str]] = []
+            postings: List[Tuple[str, int, int]] = []
+            df: Counter = Counter()
+            for chunk_id, text in zip(ids, texts):
+                if chunk_id in present:
+                    continue
+                present.add(chunk_id)
+                counts = Counter(tokenize(text))
+                key = next_key + len(docs)
+                docs.append((key, chunk_id, sum(counts.values()), " ".join(counts)))
+                postings.extend((term, key, tf) for term, tf in counts.items())
+                df.update(counts.keys())
+            if not docs:
+                return
+            self._db.executemany("INSERT INTO docs VALUES (?, ?, ?, ?)", docs)
+            self._db.executemany("INSERT INTO postings VALUES (?, ?, ?)", postings)
+            self._db.executemany(
+                "INSERT INTO terms VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+                df.items()
+            )
+            self._bump(len(docs), sum(doc[2] for doc in docs))
+            self._db.commit()
+
+    def delete(self, ids: List[str]):
+        """Remove chunks from the index."""
+        if not ids:
+            return
+        with self._lock:
+            docs = self._select_in("SELECT key, length, terms FROM docs WHERE id IN ({})", ids)
+            if not docs:
+                return
+            postings = [(term, key) for key, _, terms in docs for term in terms.split()]
+            df = Counter(term for term, _ in postings)
+            self._db.executemany("DELETE FROM postings WHERE term = ? AND doc = ?", postings)
+            self._db.executemany("UPDATE terms SET df = df - ? WHERE term = ?", [(n, term) for term, n in df.items()])
+            self._db.execute("DELETE FROM terms WHERE df <= 0")
+            self._execute_in("DELETE FROM docs WHERE key IN ({})", [key for key, _, _ in docs])
+            self._bump(-len(docs), -sum(length for _, length, _ in docs))
+            self._db.commit()
+
+    def search(self, query: str, k: int = 20) -> List[Tuple[str, float]]:
+        """
+        Score chunks against the query.
+
+        Returns:
+            Up to k (chunk id, BM25 score) pairs, best first
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or k <= 0:
+            return []
+        with self._lock:
+            n_docs = self._stat("docs")
+            if n_docs == 0:
+                return []
+            avg_length = self._stat("length") / n_docs
+            df = dict(self._select_in("SELECT term, df FROM terms WHERE term IN ({})", terms))
+            # Terms in most chunks barely move the ranking but dominate the
+            # postings to read; drop them unless nothing else matches
+            selective = [term for term in df if df[term] <= n_docs / 2]
+            terms = selective or list(df)
+            rows = self._select_in(
+                "SELECT p.term, d.id, p.tf, d.length FROM postings p JOIN docs d ON d.key = p.doc "
+                "WHERE p.term IN ({})", terms
+            )
+
+        scores: Dict[str, float] = {}
+        for term, doc_id, tf, length in rows:
+            idf = math.log(1 + (n_docs - df[term] + 0.5) / (df[term] + 0.5))
+            norm = tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / avg_length))
+            scores[doc_id] = scores.get(doc_id, 0.0) + idf * norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _stat(self, name: str) -> int:
+        return self._db.execute("SELECT value FROM stats WHERE name = ?", (name,)).fetchone()[0]
+
+    def _bump(self, docs: int, length: int):
+        self._db.execute("UPDATE stats SET value = value + ? WHERE name = 'docs'", (docs,))
+        self._db.execute("UPDATE stats SET value = value + ? WHERE name = 'length'", (length,))
+
+    def _select_in(self, sql: str, values: Iterable[str]) -> List[tuple]:
+        values = list(values)
+        rows: List[tuple] = []
+        for start in range(0, len(values), 500):
+            part = values[start:start + 500]
+            rows.extend(self._db.execute(sql.format(",".join("?" * len(part))), part).fetchall())
+        return rows
+
+    def _execute_in(self, sql: str, values: list):
+        for start in range(0, len(values), 500):
+            part = values[start:start + 500]
+            self._db.execute(sql.format(",".join("?" * len(part))), part)
@@ -0,0 +1,143 @@
+from typing import Any, AsyncIterator, Dict, Optional
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.memory import InMemorySaver
+
+logger = logging.getLogger(__name__)
+
+# UUIDv6 timestamps count 100ns intervals from the Gregorian epoch (1582-10-15)
+_GREGORIAN_OFFSET = 0x01B21DD213814000
+
+def checkpoint_time(checkpoint_id: str) -> float:
+    """Creation time (epoch seconds) of a checkpoint, from its UUIDv6 id."""
+    value = uuid.UUID(checkpoint_id).int
+    timestamp = ((value >> 80) << 12) | ((value >> 64) & 0x0FFF)
+    return (timestamp - _GREGORIAN_OFFSET) / 1e7
+
+class _ThreadedAsync:
+    """
+    Async checkpoint methods for a synchronous saver, run on worker threads.
+
+    Lets one saver serve both invoke() and ainvoke() without blocking the
+    event loop on its I/O.
+    """
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None) -> AsyncIterator[Any]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+def create_checkpointer(backend: Optional[str] = None) -> BaseCheckpointSaver:
+    """
+    Create the conversation checkpointer selected by CHECKPOINT_BACKEND.
+
+    - ``memory`` (default): in-process; history is lost on restart
+    - ``sqlite``: CHECKPOINT_PATH on local disk, shared by the API workers of
+      one host (requires langgraph-checkpoint-sqlite)
+    - ``redis``: CHECKPOINT_REDIS_URL, shared across hosts, with CHECKPOINT_TTL
+      applied by Redis itself (requires langgraph-checkpoint-redis)
+    """
+    backend = (backend or os.environ.get("CHECKPOINT_BACKEND", "memory")).lower()
+    if backend == "memory":
+        return InMemorySaver()
+    if backend == "sqlite":
+        from langgraph.checkpoint.sqlite import SqliteSaver
+
+        path = os.environ.get("CHECKPOINT_PATH", "./storage/checkpoints.sqlite")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        saver = type("ThreadedSqliteSaver", (_ThreadedAsync, SqliteSaver), {})(conn)
+        saver.setup()
+        logger.info(f"Checkpoints stored in {path}")
+        return saver
+    if backend == "redis":
+        from langgraph.checkpoint.redis import RedisSaver
+
+        ttl_minutes = float(os.environ.get("CHECKPOINT_TTL", "86400")) / 60
+        saver = type("ThreadedRedisSaver", (_ThreadedAsync, RedisSaver), {})(
+            redis_url=os.environ.get("CHECKPOINT_REDIS_URL", "redis://localhost:6379"),
+            ttl={"default_ttl": ttl_minutes, "refresh_on_read": True}
+        )
+        saver.setup()
+        return saver
+    raise ValueError(f"Unknown CHECKPOINT_BACKEND: {backend}")
+
+def prune_checkpoints(saver: BaseCheckpointSaver, ttl: float) -> Dict[str, int]:
+    """
+    Bound checkpoint storage.
+
+    Threads idle for more than ``ttl`` seconds are deleted and the other
+    threads keep only their latest checkpoint, which is all a conversation
+    needs to continue. Backends that expire entries themselves are left alone.
+
+    Returns:
+        Counts of evicted threads and removed checkpoints
+    """
+    if isinstance(saver, InMemorySaver):
+        return _prune_memory(saver, ttl)
+    if hasattr(saver, "cursor") and hasattr(saver, "conn"):
+        return _prune_sqlite(saver, ttl)
+    return {"threads": 0, "checkpoints": 0}
+
+async def aprune_checkpoints(saver: BaseCheckpointSaver, ttl: float) -> Dict[str, int]:
+    if isinstance(saver, InMemorySaver):
+        # Not thread-safe; runs between graph steps on the event loop instead
+        return _prune_memory(saver, ttl)
+    return await asyncio.to_thread(prune_checkpoints, saver, ttl)
+
+def _prune_memory(saver: InMemorySaver, ttl: float) -> Dict[str, int]:
+    cutoff = time.time() - ttl
+    evicted = removed = 0
+    for thread_id in list(saver.storage):
+        namespaces = saver.storage[thread_id]
+        latest_ids = [max(checkpoints) for checkpoints in namespaces.values() if checkpoints]
+        if not latest_ids or checkpoint_time(max(latest_ids)) < cutoff:
+            saver.delete_thread(thread_id)
+            evicted += 1
+            continue
+        for checkpoint_ns, checkpoints in namespaces.items():
+            latest = max(checkpoints)
+            for checkpoint_id in [cid for cid in checkpoints if cid != latest]:
+                del checkpoints[checkpoint_id]
+                saver.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+                removed += 1
+            # Keep only the channel values the latest checkpoint points at
+            versions = saver.serde.loads_typed(checkpoints[latest][0]).get("channel_versions", {})
+            for key in [k for k in saver.blobs if k[0] == thread_id and k[1] == checkpoint_ns]:
+                if versions.get(key[2]) != key[3]:
+                    del saver.blobs[key]
+    return {"threads": evicted, "checkpoints": removed}
+
+def _prune_sqlite(saver: Any, ttl: float) -> Dict[str, int]:
+    cutoff = time.time() - ttl
+    with saver.cursor() as cur:
+        rows = cur.execute("SELECT thread_id, MAX(checkpoint_id) FROM checkpoints GROUP BY thread_id").fetchall()
+    idle = [thread_id for thread_id, latest in rows if checkpoint_time(latest) < cutoff]
+    for thread_id in idle:
+        saver.delete_thread(thread_id)
+    with saver.cursor() as cur:
+        latest = """
+            SELECT MAX(c.checkpoint_id) FROM checkpoints c
+            WHERE c.thread_id = {table}.thread_id AND c.checkpoint_ns = {table}.checkpoint_ns
+        """
+        cur.execute(f"DELETE FROM checkpoints WHERE checkpoint_id < ({latest.format(table='checkpoints')})")
+        removed = cur.rowcount
+        cur.execute(f"DELETE FROM writes WHERE checkpoint_id < ({latest.format(table='writes')})")
+    return {"threads": len(idle), "checkpoints": removed}
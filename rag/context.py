@@ -0,0 +1,127 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+import logging
+import os
+import re
+from knowledge_base import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Context windows of common model families, matched by prefix of LLM_MODEL
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+    "llama-3": 8192,
+    "llama3": 8192,
+    "qwen": 32768,
+    "mistral": 32768,
+    "mixtral": 32768,
+    "gemma": 8192,
+    "phi-3": 4096,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+DEFAULT_CONTEXT_BUDGET = 2048
+
+PASSAGE_SEPARATOR = "\n\n---\n\n"
+_WORD_RE = re.compile(r"\w+")
+
+def context_window(model: Optional[str]) -> int:
+    """Context window of the model, by longest matching family prefix."""
+    name = (model or "").lower().split("/")[-1]
+    matches = [prefix for prefix in MODEL_CONTEXT_WINDOWS if name.startswith(prefix)]
+    return MODEL_CONTEXT_WINDOWS[max(matches, key=len)] if matches else DEFAULT_CONTEXT_WINDOW
+
+def context_budget(model: Optional[str] = None) -> int:
+    """
+    Tokens of retrieved context to send with each prompt.
+
+    CONTEXT_MAX_TOKENS wins when set; otherwise DEFAULT_CONTEXT_BUDGET, capped
+    at half the model's context window to leave room for history and answer.
+    """
+    configured = os.environ.get("CONTEXT_MAX_TOKENS")
+    if configured:
+        return int(configured)
+    model = model if model is not None else os.environ.get("LLM_MODEL")
+    return min(DEFAULT_CONTEXT_BUDGET, context_window(model) // 2)
+
+@dataclass
+class AssembledContext:
+    text: str
+    tokens: int = 0
+    passages: int = 0
+    duplicates: int = 0
+    dropped_passages: int = 0
+    dropped_tokens: int = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "tokens": self.tokens,
+            "passages": self.passages,
+            "duplicates": self.duplicates,
+            "dropped_passages": self.dropped_passages,
+            "dropped_tokens": self.dropped_tokens,
+        }
+
+def assemble_context(passages: List[str], budget: int, similarity_threshold: float = 0.8,
+                     shingle_size: int = 3) -> AssembledContext:
+    """
+    Build the prompt context from retrieved passages.
+
+    Passages are taken in relevance order (as retrieved). Near-duplicates of
+    an already chosen passage, by Jaccard similarity of word shingles, are
+    skipped, and passages that no longer fit in the token budget are dropped
+    while smaller, less relevant ones may still fill the remaining space.
+
+    Args:
+        passages: Retrieved chunk texts, most relevant first
+        budget: Maximum context tokens
+        similarity_threshold: Shingle overlap above which a passage is a duplicate
+        shingle_size: Words per shingle
+
+    Returns:
+        The context text and what was kept and dropped
+    """
+    chosen: List[str] = []
+    chosen_shingles: List[Set[str]] = []
+    separator_tokens = count_tokens(PASSAGE_SEPARATOR)
+    used = duplicates = dropped_passages = dropped_tokens = 0
+
+    for passage in passages:
+        passage = passage.strip()
+        if not passage:
+            continue
+        shingles = _shingles(passage, shingle_size)
+        if any(_jaccard(shingles, other) >= similarity_threshold for other in chosen_shingles):
+            duplicates += 1
+            continue
+        tokens = count_tokens(passage) + (separator_tokens if chosen else 0)
+        if used + tokens > budget:
+            dropped_passages += 1
+            dropped_tokens += tokens
+            continue
+        chosen.append(passage)
+        chosen_shingles.append(shingles)
+        used += tokens
+
+    return AssembledContext(
+        text=PASSAGE_SEPARATOR.join(chosen),
+        tokens=used,
+        passages=len(chosen),
+        duplicates=duplicates,
+        dropped_passages=dropped_passages,
+        dropped_tokens=dropped_tokens
+    )
+
+def _shingles(text: str, size: int) -> Set[str]:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
@@ -0,0 +1,246 @@
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingCache:
+    """
+    On-disk cache of embeddings keyed by content hash and model id.
+
+    Vectors live in a memory-mapped float32 file of fixed-size slots and a
+    small SQLite index maps each key to its slot and last access time. When
+    ``capacity`` slots are in use the least recently used entries are evicted
+    and their slots reused.
+
+    Access times from lookups are kept in memory and written in batches (at
+    the latest before the next eviction), so a hit costs one SELECT. Evicted
+    slots go to a free list in the same transaction that drops their keys,
+    and a slot is only mapped to its new key after the vector is written, so
+    a crash in between never leaves a key pointing at another text's vector.
+
+    The vector file holds one dimension. Vectors of another dimension (a
+    different embedding model in the same storage) replace the whole cache.
+    """
+
+    _GROWTH_ROWS = 4096
+    # Pending access times written at once
+    _TOUCH_BATCH = 1024
+
+    def __init__(self, path: str, capacity: int = 200_000):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # key -> last access time not yet written to the index
+        self._touched: Dict[str, float] = {}
+        self._db = sqlite3.connect(str(self.path / "index.sqlite"), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER UNIQUE, last_used REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS free_slots (slot INTEGER PRIMARY KEY)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._db.commit()
+        row = self._db.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        self.dim: Optional[int] = int(row[0]) if row else None
+        self._vectors: Optional[np.memmap] = None
+        if self.dim is not None:
+            self._open_vectors()
+
+    @staticmethod
+    def key(model_id: str, text: str) -> str:
+        return hashlib.sha256(f"{model_id}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Return cached vectors for the keys that are present."""
+        if not keys:
+            return {}
+        with self._lock:
+            found: Dict[str, np.ndarray] = {}
+            if self._vectors is not None:
+                for key, slot in self._lookup_slots(keys):
+                    found[key] = np.array(self._vectors[slot])
+                if found:
+                    now = time.time()
+                    self._touched.update(dict.fromkeys(found, now))
+                    if len(self._touched) >= self._TOUCH_BATCH:
+                        self._write_touched()
+                        self._db.commit()
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+            return found
+
+    def put_many(self, items: Dict[str, np.ndarray]):
+        """Store vectors, evicting least recently used entries when full."""
+        if not items or self.capacity <= 0:
+            return
+        with self._lock:
+            dim = len(next(iter(items.values())))
+            if dim != self.dim:
+                self._reset(dim)
+            now = time.time()
+            existing = dict(self._lookup_slots(list(items)))
+            # Refresh recent hits and existing entries first so eviction never
+            # picks them; a key's vector never changes, so they are not rewritten
+            self._touched.update(dict.fromkeys(existing, now))
+            self._write_touched()
+            new_keys = [key for key in items if key not in existing]
+            slots = self._allocate(len(new_keys))
+            # More new entries than the cache can hold: keep the last ones
+            new_keys = new_keys[len(new_keys) - len(slots):]
+            # Evicted keys are gone before their slots are overwritten
+            self._db.commit()
+            if not new_keys:
+                return
+            rows = list(zip(new_keys, slots))
+            for key, slot in rows:
+                self._vectors[slot] = np.asarray(items[key], dtype=np.float32)
+            self._vectors.flush()
+            self._db.executemany(
+                "INSERT OR REPLACE INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                [(key, slot, now) for key, slot in rows]
+            )
+            self._db.executemany("DELETE FROM free_slots WHERE slot = ?", [(slot,) for slot in slots])
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "size": size,
+            "capacity": self.capacity,
+        }
+
+    def close(self):
+        with self._lock:
+            self._write_touched()
+            self._db.commit()
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._vectors = None
+            self._db.close()
+
+    def _open_vectors(self, rows: Optional[int] = None):
+        vectors_path = self.path / "vectors.f32"
+        row_bytes = self.dim * 4
+        current_rows = vectors_path.stat().st_size // row_bytes if vectors_path.exists() else 0
+        rows = max(rows or 0, current_rows, min(self._GROWTH_ROWS, self.capacity))
+        if rows > current_rows:
+            with open(vectors_path, "ab") as f:
+                f.truncate(rows * row_bytes)
+        if self._vectors is not None:
+            self._vectors.flush()
+        self._vectors = np.memmap(vectors_path, dtype=np.float32, mode="r+", shape=(rows, self.dim))
+
+    def _reset(self, dim: int):
+        """Drop every entry and start a vector file of a new dimension."""
+        if self.dim is not None:
+            logger.warning(f"Embedding dimension changed from {self.dim} to {dim}; clearing the embedding cache")
+        self._touched.clear()
+        self._db.execute("DELETE FROM entries")
+        self._db.execute("DELETE FROM free_slots")
+        self._db.execute("INSERT OR REPLACE INTO meta VALUES ('dim', ?)", (str(dim),))
+        # No key maps into the old file before it is truncated
+        self._db.commit()
+        self._vectors = None
+        with open(self.path / "vectors.f32", "wb"):
+            pass
+        self.dim = dim
+        self._open_vectors()
+
+    def _lookup_slots(self, keys: List[str]) -> List[Tuple[str, int]]:
+        rows: List[Tuple[str, int]] = []
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            rows.extend(self._db.execute(
+                f"SELECT key, slot FROM entries WHERE key IN ({','.join('?' * len(part))})",
+                part
+            ).fetchall())
+        return rows
+
+    def _allocate(self, n: int) -> List[int]:
+        """Return n free slots, growing the vector file or evicting as needed."""
+        if n == 0:
+            return []
+        # Slots freed by an eviction that was never followed by a write
+        free = [slot for (slot,) in self._db.execute("SELECT slot FROM free_slots LIMIT ?", (n,))]
+        # Slots are otherwise handed out contiguously and evicted slots are
+        # reused immediately, so the highest slot marks the used region
+        used = self._db.execute(
+            "SELECT COALESCE(MAX(slot) + 1, 0) FROM (SELECT slot FROM entries UNION ALL SELECT slot FROM free_slots)"
+        ).fetchone()[0]
+        fresh = list(range(used, min(used + n - len(free), self.capacity)))
+        if fresh and fresh[-1] >= len(self._vectors):
+            self._open_vectors(min(self.capacity, max(fresh[-1] + 1, 2 * len(self._vectors))))
+        n_evict = min(n - len(free) - len(fresh), self.capacity - len(free) - len(fresh))
+        if n_evict <= 0:
+            return free + fresh
+        victims = self._db.execute(
+            "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (n_evict,)
+        ).fetchall()
+        self._db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in victims])
+        self._db.executemany("INSERT INTO free_slots (slot) VALUES (?)", [(slot,) for _, slot in victims])
+        self.evictions += len(victims)
+        return free + fresh + [slot for _, slot in victims]
+
+    def _write_touched(self):
+        """Write pending access times; the caller commits."""
+        if self._touched:
+            self._db.executemany(
+                "UPDATE entries SET last_used = ? WHERE key = ?",
+                [(used, key) for key, used in self._touched.items()]
+            )
+            self._touched.clear()
+
+
+class CachedEmbeddingFunction:
+    """Embedding function wrapper that consults an EmbeddingCache first."""
+
+    def __init__(self, embedding_function, cache: EmbeddingCache):
+        self.embedding_function = embedding_function
+        self.cache = cache
+        self.model_id = model_id(embedding_function)
+
+    def __call__(self, input):
+        vectors = self.lookup(list(input))
+        missing = [text for text, vector in zip(input, vectors) if vector is None]
+        if missing:
+            unique = list(dict.fromkeys(missing))
+            computed = dict(zip(unique, np.asarray(self.embedding_function(unique), dtype=np.float32)))
+            self.store(computed)
+            vectors = [computed[text] if vector is None else vector for text, vector in zip(input, vectors)]
+        return vectors
+
+    def lookup(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Cached vector for each text, or None on a miss."""
+        keys = [EmbeddingCache.key(self.model_id, text) for text in texts]
+        found = self.cache.get_many(keys)
+        return [found.get(key) for key in keys]
+
+    def store(self, vectors: Dict[str, np.ndarray]):
+        """Cache text -> vector pairs."""
+        self.cache.put_many({
+            EmbeddingCache.key(self.model_id, text): vector for text, vector in vectors.items()
+        })
+
+
+def model_id(embedding_function) -> str:
+    """Identify an embedding model by its name and config."""
+    try:
+        config = json.dumps(embedding_function.get_config(), sort_keys=True, default=str)
+    except Exception:
+        config = ""
+    return f"{embedding_function.name()}:{config}"
@@ -0,0 +1,88 @@
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Iterable, Iterator, Tuple, Optional
+import logging
+import numpy as np
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+from embedding_cache import CachedEmbeddingFunction
+
+logger = logging.getLogger(__name__)
+
+def default_embedding_function():
+    """Chroma's bundled all-MiniLM-L6-v2 ONNX model (CPU only)."""
+    return DefaultEmbeddingFunction()
+
+def embed_matrix(embedding_function, texts: List[str]) -> np.ndarray:
+    """Embed texts into a (len(texts), dim) float32 matrix."""
+    return np.asarray(embedding_function(texts), dtype=np.float32)
+
+# Embedding function owned by each pool worker, set by _init_worker
+_worker_embedding_function = None
+
+def _init_worker(embedding_function):
+    global _worker_embedding_function
+    _worker_embedding_function = embedding_function
+
+def _embed_in_worker(texts: List[str]) -> np.ndarray:
+    return embed_matrix(_worker_embedding_function, texts)
+
+class BatchEmbedder:
+    """
+    Embed batches of texts across a process pool with bounded backpressure.
+
+    Batches are submitted in order and at most ``max_pending`` of them are in
+    flight at once, so a fast producer cannot queue the whole corpus in
+    memory while the pool catches up. When the embedding function is backed
+    by an embedding cache, only cache misses are sent to the pool.
+    """
+
+    def __init__(self, embedding_function, workers: int = 1, max_pending: Optional[int] = None):
+        self.embedding_function = embedding_function
+        self.workers = workers
+        self.max_pending = max_pending or max(2, 2 * workers)
+        self.cached = embedding_function if isinstance(embedding_function, CachedEmbeddingFunction) else None
+        self.model = self.cached.embedding_function if self.cached else embedding_function
+
+    def embed_batches(self, batches: Iterable[Tuple[List[str], List[str]]]) -> Iterator[Tuple[List[str], List[str], np.ndarray]]:
+        """
+        Embed (ids, texts) batches.
+
+        Args:
+            batches: Iterable of (ids, texts) pairs
+
+        Yields:
+            (ids, texts, embeddings) for each batch as soon as it is embedded
+        """
+        if self.workers <= 1:
+            for ids, texts in batches:
+                yield ids, texts, embed_matrix(self.embedding_function, texts)
+            return
+
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.model,)
+        ) as pool:
+            pending: dict = {}
+            for ids, texts in batches:
+                vectors = self.cached.lookup(texts) if self.cached else [None] * len(texts)
+                missing = [i for i, vector in enumerate(vectors) if vector is None]
+                if not missing:
+                    yield ids, texts, np.vstack(vectors)
+                    continue
+                if len(pending) >= self.max_pending:
+                    yield from self._drain(pending)
+                future = pool.submit(_embed_in_worker, [texts[i] for i in missing])
+                pending[future] = (ids, texts, vectors, missing)
+            while pending:
+                yield from self._drain(pending)
+
+    def _drain(self, pending: dict) -> Iterator[Tuple[List[str], List[str], np.ndarray]]:
+        done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+        for future in done:
+            ids, texts, vectors, missing = pending.pop(future)
+            computed = future.result()
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+            if self.cached:
+                self.cached.store({texts[i]: vectors[i] for i in missing})
+            yield ids, texts, np.vstack(vectors)
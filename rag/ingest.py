@@ -0,0 +1,253 @@
+import argparse
+from datetime import datetime
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple, Union
+from knowledge_base import ChromaDBKnowledgeBase, Document, create_knowledge_base, default_storage_path
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SUPPORTED_SUFFIXES = {".txt", ".json", ".ndjson", ".jsonl", ".pdf"}
+JSON_SUFFIXES = {".json", ".ndjson", ".jsonl"}
+_NUMBER_CHARS = set("0123456789.eE+-")
+
+def _lines(path: Path) -> Iterator[str]:
+    with open(path, encoding="utf-8") as f:
+        yield from f
+
+def iter_json_values(f: TextIO, buffer_size: int = 1 << 16, max_value_size: int = 64 << 20) -> Iterator[Any]:
+    """
+    Parse a JSON stream one value at a time.
+
+    A top-level array yields its elements; otherwise every top-level value is
+    yielded, which covers single objects and NDJSON. Only the value being
+    decoded is held in memory, and at most ``max_value_size`` characters of it.
+
+    Raises:
+        json.JSONDecodeError: On malformed input, with the line and character
+            offset in the whole stream
+    """
+    decoder = json.JSONDecoder()
+    buffer = f.read(buffer_size)
+    eof = not buffer
+    pos = 0
+    # Characters and lines dropped from the front of the buffer so far
+    consumed = lines = 0
+    in_array = False
+    started = False
+
+    def error(msg: str, at: int) -> json.JSONDecodeError:
+        line = lines + buffer.count("\n", 0, at) + 1
+        e = json.JSONDecodeError(msg, buffer, at)
+        e.pos, e.lineno = consumed + at, line
+        e.args = (f"{msg}: line {line} (char {consumed + at})",)
+        return e
+
+    while True:
+        # Skip whitespace (and commas between array elements), refilling as needed
+        while True:
+            while pos < len(buffer) and (buffer[pos].isspace() or (in_array and buffer[pos] == ",")):
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            consumed, lines = consumed + len(buffer), lines + buffer.count("\n")
+            buffer, pos = f.read(buffer_size), 0
+            eof = not buffer
+        if pos >= len(buffer):
+            if in_array:
+                raise error("Unterminated array", pos)
+            return
+        if not started:
+            started = True
+            if buffer[pos] == "[":
+                in_array = True
+                pos += 1
+                continue
+        if in_array and buffer[pos] == "]":
+            return
+
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+            # A number touching the end of the buffer, or followed by what could
+            # be the rest of it, may have been cut short
+            complete = eof or (end < len(buffer) and buffer[end] not in _NUMBER_CHARS)
+        except json.JSONDecodeError as e:
+            # Only an error at the end of the buffer, or an open string, can be
+            # cured by reading more; anything earlier is malformed
+            if eof or (e.pos < len(buffer) - 64 and not e.msg.startswith("Unterminated string")):
+                raise error(e.msg, e.pos) from None
+            complete = False
+        if not complete:
+            if len(buffer) - pos > max_value_size:
+                raise error(f"Value longer than {max_value_size} characters", pos)
+            # Grow geometrically so one large value is not re-parsed too often
+            more = f.read(max(buffer_size, len(buffer) - pos))
+            consumed, lines = consumed + pos, lines + buffer.count("\n", 0, pos)
+            buffer, pos = buffer[pos:] + more, 0
+            eof = not more
+            continue
+        yield value
+        pos = end
+        if pos > buffer_size:
+            consumed, lines = consumed + pos, lines + buffer.count("\n", 0, pos)
+            buffer, pos = buffer[pos:], 0
+
+def record_document(value: Any) -> Tuple[Optional[str], str]:
+    """
+    Map a parsed JSON value to (source, text).
+
+    The crawler's {"url", "content", "timestamp"} objects keep their URL as the
+    source; strings are used as-is and anything else is stored as JSON.
+    """
+    if isinstance(value, dict) and "content" in value:
+        return value.get("url"), str(value["content"])
+    if isinstance(value, str):
+        return None, value
+    return None, json.dumps(value, ensure_ascii=False)
+
+def record_metadata(value: Any) -> Dict[str, Any]:
+    """
+    Document metadata of a parsed JSON value.
+
+    The crawler's ISO ``timestamp`` becomes ``crawled_at`` in epoch seconds,
+    so retrieval can filter on freshness with a numeric comparison.
+    """
+    if not isinstance(value, dict):
+        return {}
+    try:
+        return {"crawled_at": datetime.fromisoformat(value["timestamp"]).timestamp()}
+    except (KeyError, TypeError, ValueError):
+        return {}
+
+def iter_pdf_lines(path: Path) -> Iterator[str]:
+    """Text lines of a PDF, extracted one page at a time."""
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTTextContainer
+
+    for page in extract_pages(str(path)):
+        for element in page:
+            if isinstance(element, LTTextContainer):
+                yield from element.get_text().splitlines()
+
+def iter_documents(paths: Iterable[str]) -> Iterator[Union[Iterator[str], Document]]:
+    """
+    Yield documents from files and directories.
+
+    Text and PDF files are streamed line by line; JSON files may hold the
+    crawler's {"url", "content", "timestamp"} object, an array or NDJSON and
+    are parsed one value at a time, keeping the URL as the source and the
+    timestamp as ``crawled_at``.
+    """
+    for path in map(Path, paths):
+        files: List[Path] = sorted(p for p in path.rglob("*") if p.suffix in SUPPORTED_SUFFIXES) if path.is_dir() else [path]
+        for file in files:
+            if file.suffix == ".txt":
+                yield _lines(file)
+            elif file.suffix == ".pdf":
+                yield iter_pdf_lines(file)
+            elif file.suffix in JSON_SUFFIXES:
+                with open(file, encoding="utf-8") as f:
+                    for value in iter_json_values(f):
+                        source, text = record_document(value)
+                        yield Document(text, source, record_metadata(value))
+            else:
+                logger.warning(f"Skipping unsupported file: {file}")
+
+def index_file(kb: ChromaDBKnowledgeBase, path: Path, suffix: str, batch_size: int = 64,
+               progress: Optional[Callable[..., None]] = None) -> Dict[str, Any]:
+    """
+    Index an uploaded file without loading it into memory.
+
+    JSON documents are indexed in batches of ``batch_size``; those with a
+    URL replace what was stored for it.
+
+    Args:
+        kb: Knowledge base to write to
+        path: The file on disk
+        suffix: File type (".txt", ".json", ".ndjson", ".jsonl" or ".pdf")
+        batch_size: JSON documents per write
+        progress: Called as progress(documents=..., chunks=...) after each write
+
+    Returns:
+        Document and chunk counts and the chunk IDs stored per URL
+    """
+    stats: Dict[str, Any] = {"documents": 0, "chunks": 0, "chunk_ids": {}}
+
+    def report():
+        if progress:
+            progress(documents=stats["documents"], chunks=stats["chunks"])
+
+    if suffix == ".txt":
+        stats["chunks"] = len(kb.add_documents([_lines(path)]))
+        stats["documents"] = 1
+    elif suffix == ".pdf":
+        stats["chunks"] = len(kb.add_documents([iter_pdf_lines(path)]))
+        stats["documents"] = 1
+    elif suffix in JSON_SUFFIXES:
+        pages: Dict[str, str] = {}
+        metadata: Dict[str, Dict[str, Any]] = {}
+        unsourced: List[str] = []
+
+        def flush():
+            if pages:
+                stored = kb.replace_sources(dict(pages), dict(metadata))
+                stats["chunk_ids"].update(stored)
+                stats["chunks"] += sum(len(ids) for ids in stored.values())
+                pages.clear()
+                metadata.clear()
+            if unsourced:
+                stats["chunks"] += len(kb.add_documents(list(unsourced)))
+                unsourced.clear()
+            report()
+
+        with open(path, encoding="utf-8") as f:
+            for value in iter_json_values(f):
+                source, text = record_document(value)
+                if source:
+                    pages[source] = text
+                    metadata[source] = record_metadata(value)
+                else:
+                    unsourced.append(text)
+                stats["documents"] += 1
+                if len(pages) + len(unsourced) >= batch_size:
+                    flush()
+        flush()
+    else:
+        raise ValueError(f"Unsupported file type: {suffix}")
+
+    report()
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk (re)index documents into the knowledge base')
+    parser.add_argument('paths', nargs='+', help='Files or directories to ingest (.txt, .json, .ndjson, .jsonl, .pdf)')
+    parser.add_argument('--storage', default=default_storage_path(),
+                        help='Storage path (backend per KB_BACKEND), default CHROMA_PERSIST_DIRECTORY or ./storage. '
+                             'This process writes to the store: stop the API or rebuild through the indexer, '
+                             'never next to running read-only workers')
+    parser.add_argument('--batch-size', type=int, default=256, help='Chunks per embedding batch')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='Embedding worker processes')
+    parser.add_argument('--write-batch-size', type=int, default=4096, help='Chunks per upsert')
+    args = parser.parse_args()
+
+    kb = create_knowledge_base(path=args.storage)
+    try:
+        stats = kb.bulk_add(
+            iter_documents(args.paths),
+            batch_size=args.batch_size,
+            workers=args.workers,
+            write_batch_size=args.write_batch_size
+        )
+    finally:
+        kb.close()
+
+    print(json.dumps(stats))
+    print(f"Ingested {stats['documents']} documents ({stats['chunks']} chunks) "
+          f"in {stats['seconds']}s: {stats['docs_per_sec']} docs/sec")
+
+if __name__ == "__main__":
+    main()
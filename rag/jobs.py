@@ -0,0 +1,150 @@
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+import logging
+import os
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+class Job:
+    """A unit of background work and its progress."""
+
+    def __init__(self, kind: str, description: str = ""):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.description = description
+        self.status = "queued"
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.progress: Dict[str, Any] = {}
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.exception: Optional[BaseException] = None
+        self.future: Optional[Future] = None
+        # Releases the job's resources, e.g. its upload's temp file
+        self.cleanup: Optional[Callable[[], None]] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def update(self, **progress):
+        """Record progress counters, e.g. update(documents=10, chunks=120)."""
+        self.progress.update(progress)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "description": self.description,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "progress": dict(self.progress),
+            "result": self.result,
+            "error": self.error,
+        }
+
+class JobManager:
+    """
+    Run jobs on a small thread pool and remember their outcome.
+
+    Finished jobs are kept for lookup until ``history`` newer jobs have been
+    submitted.
+    """
+
+    def __init__(self, workers: int = 1, history: int = 1000):
+        self.workers = workers
+        self.history = history
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "JobManager":
+        return cls(
+            workers=int(os.environ.get("INDEX_WORKERS", "1")),
+            history=int(os.environ.get("JOB_HISTORY", "1000"))
+        )
+
+    def submit(self, kind: str, fn: Callable[..., Optional[Dict[str, Any]]], *args,
+               description: str = "", cleanup: Optional[Callable[[], None]] = None) -> Job:
+        """
+        Queue fn(job, *args); its return value becomes the job's result.
+
+        Args:
+            kind: Job type, e.g. "update"
+            fn: The work
+            description: Shown in the job's status
+            cleanup: Called once the job has finished, failed or been
+                cancelled at shutdown
+
+        Returns:
+            The queued job
+        """
+        job = Job(kind, description)
+        job.cleanup = cleanup
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                oldest = next(iter(self._jobs.values()))
+                if not oldest.done:
+                    break
+                self._jobs.popitem(last=False)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+            job.future = self._executor.submit(self._run, job, fn, args)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self):
+        """Drop queued jobs and wait for running ones; later submits start a new pool."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            cancelled = [job for job in self._jobs.values()
+                         if job.future is not None and job.future.cancelled() and not job.done]
+            for job in cancelled:
+                job.status = "failed"
+                job.error = "Cancelled at shutdown"
+        for job in cancelled:
+            self._cleanup(job)
+
+    @staticmethod
+    def _run(job: Job, fn: Callable, args) -> Optional[Dict[str, Any]]:
+        job.status = "running"
+        job.started_at = datetime.now()
+        logger.info(f"Job {job.id} started: {job.kind} {job.description}")
+        try:
+            job.result = fn(job, *args)
+            job.status = "succeeded"
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {str(e)}")
+            job.error = str(e)
+            job.exception = e
+            job.status = "failed"
+        finally:
+            job.finished_at = datetime.now()
+            JobManager._cleanup(job)
+        logger.info(f"Job {job.id} {job.status} in {(job.finished_at - job.started_at).total_seconds():.2f}s")
+        return job.result
+
+    @staticmethod
+    def _cleanup(job: Job):
+        cleanup, job.cleanup = job.cleanup, None
+        if cleanup is None:
+            return
+        try:
+            cleanup()
+        except Exception as e:
+            logger.error(f"Cleanup of job {job.id} failed: {str(e)}")
@@ -1,44 +1,798 @@
 from abc import ABC, abstractmethod
-from typing import List
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Dict, Any, NamedTuple, Optional, Iterable, Iterator, Tuple, Union
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import numpy as np
 import chromadb
-from chromadb.config import Settings
+from embeddings import BatchEmbedder, default_embedding_function, embed_matrix
+from embedding_cache import EmbeddingCache, CachedEmbeddingFunction
+from bm25 import BM25Index
+from metrics import observe, span, timed
+
+logger = logging.getLogger(__name__)
+
+def document_id(document: str, source: Optional[str] = None) -> str:
+    """
+    Content-addressed ID, stable across processes and restarts.
+
+    Chunks from a known source are namespaced by it, so replacing one page
+    never touches an identical chunk that belongs to another page.
+    """
+    key = document if source is None else f"{source}\0{document}"
+    return "doc_" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+class Document(NamedTuple):
+    """A document with where it came from, for bulk_add()."""
+    text: Union[str, Iterable[str]]
+    source: Optional[str] = None
+    metadata: Optional[Dict[str, Any]] = None
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*)$")
+# Page header lines the crawler writes under the title; they change on every crawl
+_PAGE_METADATA_RE = re.compile(r"^(Source|Crawled at):\s")
+
+def count_tokens(text: str) -> int:
+    """Approximate token count: words and punctuation marks."""
+    return len(_TOKEN_RE.findall(text))
+
+class MarkdownChunker:
+    """
+    Split crawler markdown into heading-aware chunks before embedding.
+
+    Chunks never cross a heading boundary, table rows and list items
+    (``- `` lines) are kept whole where possible, and every chunk starts
+    with the heading path it belongs to so it can be understood on its own.
+    The crawler's page header (``Source:`` and ``Crawled at:`` under the
+    title) is dropped, so the title only heads the sections that follow.
+    """
+
+    def __init__(self, max_tokens: int = 256, overlap_tokens: int = 32):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+    @classmethod
+    def from_env(cls) -> "MarkdownChunker":
+        return cls(
+            max_tokens=int(os.environ.get("CHUNK_MAX_TOKENS", "256")),
+            overlap_tokens=int(os.environ.get("CHUNK_OVERLAP_TOKENS", "32"))
+        )
+
+    def split(self, text: Union[str, Iterable[str]]) -> Iterator[str]:
+        """
+        Split a document into chunks.
+
+        Args:
+            text: The document, either as a string or as an iterable of lines
+                (e.g. an open file) so large inputs are never held in memory
+
+        Yields:
+            Chunk texts, each prefixed with its heading path
+        """
+        for _, chunk in self.split_sections(text):
+            yield chunk
+
+    def split_sections(self, text: Union[str, Iterable[str]]) -> Iterator[Tuple[str, str]]:
+        """
+        split(), also yielding the section each chunk belongs to.
+
+        Yields:
+            (section, chunk) where section is the innermost heading's text,
+            or "" before the first heading
+        """
+        lines = text.splitlines() if isinstance(text, str) else text
+        headings: List[Tuple[int, str]] = []
+        units: List[Tuple[str, int]] = []
+        body_tokens = 0
+        in_header = True
+
+        for raw_line in lines:
+            line = raw_line.rstrip("\n").strip()
+            if not line:
+                continue
+            if in_header and _PAGE_METADATA_RE.match(line):
+                continue
+            heading = _HEADING_RE.match(line)
+            # The crawler emits whole <section> texts as "## ..." lines;
+            # only short lines are treated as real headings
+            if heading and count_tokens(line) <= self.max_tokens // 4:
+                if units:
+                    yield self._section(headings), self._render(headings, units)
+                units, body_tokens = [], 0
+                level = len(heading.group(1))
+                headings = [h for h in headings if h[0] < level] + [(level, line)]
+                continue
+            in_header = False
+
+            for piece in self._pieces(line):
+                tokens = count_tokens(piece)
+                budget = self.max_tokens - self._prefix_tokens(headings)
+                if units and body_tokens + tokens > budget:
+                    yield self._section(headings), self._render(headings, units)
+                    units = self._overlap(units)
+                    body_tokens = sum(t for _, t in units)
+                    if body_tokens + tokens > budget:
+                        units, body_tokens = [], 0
+                units.append((piece, tokens))
+                body_tokens += tokens
+
+        if units:
+            yield self._section(headings), self._render(headings, units)
+
+    @staticmethod
+    def _section(headings: List[Tuple[int, str]]) -> str:
+        return _HEADING_RE.match(headings[-1][1]).group(2).strip() if headings else ""
+
+    def _pieces(self, line: str) -> Iterator[str]:
+        """Break a single over-long line into word windows."""
+        if count_tokens(line) <= self.max_tokens // 2:
+            yield line
+            return
+        words = line.split()
+        piece: List[str] = []
+        piece_tokens = 0
+        for word in words:
+            tokens = count_tokens(word)
+            if piece and piece_tokens + tokens > self.max_tokens // 2:
+                yield " ".join(piece)
+                piece, piece_tokens = [], 0
+            piece.append(word)
+            piece_tokens += tokens
+        if piece:
+            yield " ".join(piece)
+
+    def _overlap(self, units: List[Tuple[str, int]]) -> List[Tuple[str, int]]:
+        """Trailing units of the previous chunk carried into the next one."""
+        carried: List[Tuple[str, int]] = []
+        total = 0
+        for unit in reversed(units):
+            if total + unit[1] > self.overlap_tokens:
+                break
+            carried.insert(0, unit)
+            total += unit[1]
+        return carried
+
+    def _prefix(self, headings: List[Tuple[int, str]]) -> List[str]:
+        prefix = [line for _, line in headings]
+        # Keep at least half of the budget for the chunk body
+        while len(prefix) > 1 and count_tokens("\n".join(prefix)) > self.max_tokens // 2:
+            prefix.pop(0)
+        return prefix
+
+    def _prefix_tokens(self, headings: List[Tuple[int, str]]) -> int:
+        return count_tokens("\n".join(self._prefix(headings)))
+
+    def _render(self, headings: List[Tuple[int, str]], units: List[Tuple[str, int]]) -> str:
+        return "\n".join(self._prefix(headings) + [text for text, _ in units])
 
 class KnowledgeBase(ABC):
     @abstractmethod
-    def add_documents(self, documents: List[str]):
+    def add_documents(self, documents: List[str], source: Optional[str] = None,
+                      metadata: Optional[Dict[str, Any]] = None):
         pass
 
     @abstractmethod
-    def update_documents(self, documents: List[str]):
+    def update_documents(self, documents: List[str], source: Optional[str] = None,
+                         metadata: Optional[Dict[str, Any]] = None):
         pass
 
     @abstractmethod
-    def get_documents(self, query: str) -> List[str]:
+    def get_documents(self, query: str, where: Optional[Dict[str, Any]] = None,
+                      n_results: Optional[int] = None) -> List[str]:
         pass
 
+def default_storage_path() -> str:
+    """Storage directory: CHROMA_PERSIST_DIRECTORY, else ./storage."""
+    return os.environ.get("CHROMA_PERSIST_DIRECTORY") or "./storage"
+
+class ReadOnlyError(RuntimeError):
+    """A write was attempted on a read-only knowledge base."""
+
 class ChromaDBKnowledgeBase(KnowledgeBase):
-    def __init__(self):
-        self.client = chromadb.PersistentClient(path="./storage")
+    """
+    Chroma-backed knowledge base.
+
+    One process writes (``read_only=False``, the default) and any number of
+    API workers may open the same storage with ``read_only=True``
+    (KB_READ_ONLY), which never creates or changes the lexical index or the
+    generation marker. Every write bumps the marker; read-only instances
+    check it at most every ``refresh_interval`` seconds. With CHROMA_HOST
+    set the collection lives on a Chroma server and every worker sees
+    writes immediately; this is the supported multi-process layout.
+    Without it, each reader opens Chroma's local store itself and reloads
+    it whole when the marker changes, during which its queries wait.
+    Chroma's embedded client is not safe to share between processes, so
+    that is only meant for a single host with a small store.
+    """
+
+    def __init__(self, path: Optional[str] = None, embedding_function=None,
+                 chunker: Optional[MarkdownChunker] = None,
+                 embedding_cache: Optional[EmbeddingCache] = None,
+                 n_results: Optional[int] = None, vector_k: Optional[int] = None,
+                 bm25_k: Optional[int] = None, rrf_k: Optional[int] = None,
+                 read_only: Optional[bool] = None, refresh_interval: Optional[float] = None):
+        started = time.perf_counter()
+        self.path = path or default_storage_path()
+        os.makedirs(self.path, exist_ok=True)
+        self.read_only = read_only if read_only is not None else \
+            os.environ.get("KB_READ_ONLY", "").lower() in ("1", "true", "yes")
+        self.refresh_interval = refresh_interval if refresh_interval is not None else \
+            float(os.environ.get("KB_REFRESH_INTERVAL", "2"))
+        self._generation_path = os.path.join(self.path, "generation")
+        self._generation = self.generation()
+        self._checked_at = time.monotonic()
+        self._refresh_lock = threading.Lock()
+        # Queries using the collection; a refresh waits for them before closing it
+        self._readers = 0
+        self._reopening = False
+        self._readers_changed = threading.Condition()
+        self._model = embedding_function or default_embedding_function()
+        self.client, self.collection = self._connect()
+        # Documents and queries are embedded here rather than by Chroma, so
+        # the embedding cache is consulted for both ingestion and retrieval.
+        # Its slots are allocated by one process, so readers go without it.
+        cache_size = int(os.environ.get("EMBEDDING_CACHE_SIZE", "200000"))
+        if embedding_cache is None and cache_size > 0 and not self.read_only:
+            embedding_cache = EmbeddingCache(
+                os.environ.get("EMBEDDING_CACHE_DIR", os.path.join(self.path, "embedding_cache")),
+                capacity=cache_size
+            )
+        self.embedding_cache = embedding_cache
+        self.embedding_function = CachedEmbeddingFunction(self._model, embedding_cache) if embedding_cache else self._model
+        self.chunker = chunker or MarkdownChunker.from_env()
+        self.write_batch_size = int(os.environ.get("CHUNK_WRITE_BATCH_SIZE", "64"))
+        # Hybrid retrieval: dense and BM25 candidates merged by reciprocal rank fusion
+        self.n_results = n_results if n_results is not None else int(os.environ.get("RETRIEVAL_K", "5"))
+        self.vector_k = vector_k if vector_k is not None else int(os.environ.get("VECTOR_K", "20"))
+        self.bm25_k = bm25_k if bm25_k is not None else int(os.environ.get("BM25_K", "20"))
+        self.rrf_k = rrf_k if rrf_k is not None else int(os.environ.get("RRF_K", "60"))
+        self.lexical_index = BM25Index(os.path.join(self.path, "bm25.sqlite"), read_only=self.read_only) \
+            if self.bm25_k > 0 else None
+        # Queries are safe to run concurrently, writes are serialized
+        self._write_lock = threading.Lock()
+        if (not self.read_only and self.lexical_index is not None
+                and len(self.lexical_index) == 0 and self.collection.count() > 0):
+            self.rebuild_lexical_index()
+        self.opened_at = datetime.now()
+        self.open_time = time.perf_counter() - started
+        observe("kb_open", self.open_time)
+        mode = "read-only" if self.read_only else "read-write"
+        logger.info(f"Opened knowledge base at {self.path} ({mode}) in {self.open_time * 1000:.1f} ms")
+
+    def _connect(self):
+        host = os.environ.get("CHROMA_HOST")
+        if host:
+            client = chromadb.HttpClient(host=host, port=int(os.environ.get("CHROMA_PORT", "8000")))
+        else:
+            client = chromadb.PersistentClient(path=self.path)
+        collection = client.get_or_create_collection("knowledge_base", embedding_function=self._model)
+        return client, collection
+
+    def generation(self) -> int:
+        """Counts the writes by any process to the store (0 before the first write)."""
         try:
-            self.collection = self.client.get_collection("knowledge_base")
-        except:
-            self.collection = self.client.create_collection("knowledge_base")
-
-    def add_documents(self, documents: List[str]):
-        # Add documents with unique IDs
-        current_count = len(self.collection.get()['ids']) if self.collection.get()['ids'] else 0
-        self.collection.add(
-            documents=documents,
-            ids=[f"doc_{current_count + i}" for i in range(len(documents))]
-        )
+            with open(self._generation_path) as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
 
-    def update_documents(self, documents: List[str]):
-        # For simplicity, we'll just add new documents
-        self.add_documents(documents)
+    def refresh(self) -> bool:
+        """
+        Reopen the local store if another process wrote to it since it was opened.
 
-    def get_documents(self, query: str) -> List[str]:
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=5
-        )
-        return results['documents'][0] if results['documents'] else [] 
\ No newline at end of file
+        The old client is closed first, once the queries already running on
+        it have finished; queries arriving meanwhile wait for the new one.
+        Concurrent callers of refresh() do not wait for the reopen.
+
+        Returns:
+            Whether the store was reopened
+        """
+        generation = self.generation()
+        if generation == self._generation:
+            return False
+        if self.lexical_index is not None and self.lexical_index.in_memory:
+            # Opened before the indexer created it
+            self.lexical_index = BM25Index(self.lexical_index.path, read_only=True)
+        if os.environ.get("CHROMA_HOST"):
+            self._generation = generation
+            return False
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            started = time.perf_counter()
+            with self._readers_changed:
+                self._reopening = True
+                self._readers_changed.wait_for(lambda: self._readers == 0)
+                try:
+                    self.client.close()
+                    self.client, self.collection = self._connect()
+                    self._generation = generation
+                finally:
+                    self._reopening = False
+                    self._readers_changed.notify_all()
+        finally:
+            self._refresh_lock.release()
+        observe("kb_refresh", time.perf_counter() - started)
+        logger.info(f"Reopened knowledge base after an external write in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return True
+
+    def _check_writable(self):
+        if self.read_only:
+            raise ReadOnlyError("Knowledge base is open read-only; send writes to the indexer")
+
+    def _mark_changed(self):
+        # Readers compare the marker's counter; call with the write lock held.
+        # A counter rather than the file's mtime, which two writes within one
+        # filesystem timestamp tick would leave unchanged
+        temporary = f"{self._generation_path}.{os.getpid()}"
+        with open(temporary, "w") as f:
+            f.write(str(self.generation() + 1))
+        os.replace(temporary, self._generation_path)
+
+    @contextmanager
+    def _reading(self) -> Iterator[Any]:
+        """The current collection, kept open until the block exits."""
+        with self._readers_changed:
+            self._readers_changed.wait_for(lambda: not self._reopening)
+            self._readers += 1
+            collection = self.collection
+        try:
+            yield collection
+        finally:
+            with self._readers_changed:
+                self._readers -= 1
+                self._readers_changed.notify_all()
+
+    def add_documents(self, documents: Iterable[Union[str, Iterable[str]]],
+                      source: Optional[str] = None,
+                      metadata: Optional[Dict[str, Any]] = None) -> List[str]:
+        """
+        Chunk documents and store the chunks.
+
+        Every chunk is stored with the document's metadata, its ``section``
+        (innermost heading), ``source`` and, for string documents, the
+        document's ``content_hash``.
+
+        Args:
+            documents: Document texts, or iterables of lines for large inputs
+            source: Where the documents came from (e.g. the crawled URL);
+                stored on every chunk so the source can be replaced later
+            metadata: Extra document metadata, e.g. {"crawled_at": epoch seconds}
+
+        Returns:
+            IDs of the stored chunks
+        """
+        self._check_writable()
+        ids: List[str] = []
+        seen = set()
+        batch: Dict[str, str] = {}
+        metadatas: List[Dict[str, Any]] = []
+        for document in documents:
+            document_metadata = self._document_metadata(document, source, metadata)
+            for section, chunk in self.chunker.split_sections(document):
+                # IDs are derived from content, so re-ingesting a document is a
+                # no-op and no collection scan is needed to allocate them
+                chunk_id = document_id(chunk, source)
+                if chunk_id in seen:
+                    continue
+                seen.add(chunk_id)
+                batch[chunk_id] = chunk
+                metadatas.append({**document_metadata, "section": section})
+                ids.append(chunk_id)
+                if len(batch) >= self.write_batch_size:
+                    self._upsert(batch, metadatas)
+                    batch, metadatas = {}, []
+        if batch:
+            self._upsert(batch, metadatas)
+        return ids
+
+    @staticmethod
+    def _document_metadata(document: Union[str, Iterable[str]], source: Optional[str],
+                           metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        # The store rejects None values
+        result = {key: value for key, value in (metadata or {}).items() if value is not None}
+        if source:
+            result["source"] = source
+        if isinstance(document, str):
+            result["content_hash"] = hashlib.sha256(document.encode("utf-8")).hexdigest()
+        return result
+
+    def bulk_add(self, documents: Iterable[Union[str, Iterable[str], Document]], batch_size: int = 256,
+                 workers: int = 1, write_batch_size: int = 4096) -> Dict[str, Any]:
+        """
+        Re-index a large corpus with batched, parallel embedding.
+
+        Chunks are grouped into fixed-size batches, embedded across a process
+        pool into float32 matrices and written back in large upserts. The
+        number of batches in flight is bounded so memory stays flat. Chunks
+        get the same IDs and metadata as add_documents() would give them, so
+        update_documents() can later replace a source that was bulk loaded.
+
+        Args:
+            documents: Document texts, iterables of lines for large inputs, or
+                Documents carrying their source and metadata
+            batch_size: Chunks per embedding batch
+            workers: Embedding processes; 1 embeds in the calling process
+            write_batch_size: Chunks per collection upsert
+
+        Returns:
+            Ingest statistics, including documents and chunks per second
+        """
+        self._check_writable()
+        started = time.perf_counter()
+        stats = {"documents": 0, "chunks": 0}
+        # Chunk ID -> metadata, from chunking until the chunk is written
+        chunk_metadata: Dict[str, Dict[str, Any]] = {}
+
+        def batches():
+            ids: List[str] = []
+            texts: List[str] = []
+            seen = set()
+            for document in documents:
+                stats["documents"] += 1
+                if not isinstance(document, Document):
+                    document = Document(document)
+                document_metadata = self._document_metadata(document.text, document.source, document.metadata)
+                for section, chunk in self.chunker.split_sections(document.text):
+                    chunk_id = document_id(chunk, document.source)
+                    if chunk_id in seen:
+                        continue
+                    seen.add(chunk_id)
+                    ids.append(chunk_id)
+                    texts.append(chunk)
+                    chunk_metadata[chunk_id] = {**document_metadata, "section": section}
+                    if len(ids) == batch_size:
+                        yield ids, texts
+                        ids, texts = [], []
+                # Bound the dedupe window; upserts are idempotent anyway
+                if len(seen) > 16 * write_batch_size:
+                    seen.clear()
+            if ids:
+                yield ids, texts
+
+        write_batch_size = min(write_batch_size, self.client.get_max_batch_size())
+        embedder = BatchEmbedder(self.embedding_function, workers=workers)
+        pending: Dict[str, Tuple[str, np.ndarray, Dict[str, Any]]] = {}
+
+        def flush():
+            if not pending:
+                return
+            with self._write_lock:
+                self.collection.upsert(
+                    ids=list(pending.keys()),
+                    documents=[text for text, _, _ in pending.values()],
+                    embeddings=np.vstack([vector for _, vector, _ in pending.values()]),
+                    metadatas=[metadata for _, _, metadata in pending.values()]
+                )
+                if self.lexical_index is not None:
+                    self.lexical_index.add(list(pending.keys()), [text for text, _, _ in pending.values()])
+                self._mark_changed()
+            stats["chunks"] += len(pending)
+            pending.clear()
+
+        for ids, texts, embeddings in embedder.embed_batches(batches()):
+            for chunk_id, text, vector in zip(ids, texts, embeddings):
+                metadata = chunk_metadata.pop(chunk_id, None)
+                if metadata is None:
+                    # A repeat of a chunk an earlier batch already wrote or queued
+                    continue
+                pending[chunk_id] = (text, vector, metadata)
+            if len(pending) >= write_batch_size:
+                flush()
+        flush()
+
+        elapsed = time.perf_counter() - started
+        stats["seconds"] = round(elapsed, 3)
+        stats["docs_per_sec"] = round(stats["documents"] / elapsed, 2) if elapsed else 0.0
+        stats["chunks_per_sec"] = round(stats["chunks"] / elapsed, 2) if elapsed else 0.0
+        logger.info(f"Bulk ingest: {stats}")
+        return stats
+
+    def _upsert(self, chunks: Dict[str, str], metadatas: Optional[List[Dict[str, Any]]] = None):
+        """Embed and write chunks, with one metadata dict per chunk."""
+        with span("embed_documents"):
+            embeddings = embed_matrix(self.embedding_function, list(chunks.values()))
+        with self._write_lock:
+            self.collection.upsert(
+                documents=list(chunks.values()),
+                embeddings=embeddings,
+                metadatas=metadatas,
+                ids=list(chunks.keys())
+            )
+            if self.lexical_index is not None:
+                self.lexical_index.add(list(chunks.keys()), list(chunks.values()))
+            self._mark_changed()
+
+    def update_documents(self, documents: List[str], source: Optional[str] = None,
+                         metadata: Optional[Dict[str, Any]] = None) -> List[str]:
+        """
+        Replace everything previously stored for ``source`` with ``documents``.
+
+        New chunks are written before stale ones are deleted, so readers never
+        see the source disappear. Unchanged chunks keep their IDs and are not
+        re-embedded (the embedding cache answers them).
+
+        Returns:
+            IDs of the chunks now stored for the source
+        """
+        if source is None:
+            return self.add_documents(documents, metadata=metadata)
+        ids = self.add_documents(documents, source=source, metadata=metadata)
+        with self._write_lock:
+            existing = self.collection.get(where={"source": source}, include=[])["ids"]
+            stale = sorted(set(existing) - set(ids))
+            self._delete(stale)
+        logger.info(f"Replaced {source}: {len(ids)} chunks stored, {len(stale)} stale chunks removed")
+        return ids
+
+    def replace_sources(self, pages: Dict[str, str],
+                        metadata: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, List[str]]:
+        """
+        update_documents() for many sources at once.
+
+        Chunks from all sources are embedded and written together in
+        ``write_batch_size`` upserts, then stale chunks of every source are
+        removed with one lookup.
+
+        Args:
+            pages: Source (e.g. URL) -> document text
+            metadata: Source -> extra document metadata
+
+        Returns:
+            Source -> IDs of the chunks now stored for it
+        """
+        self._check_writable()
+        ids: Dict[str, List[str]] = {}
+        batch: Dict[str, str] = {}
+        metadatas: List[Dict[str, Any]] = []
+        sources: Dict[str, str] = {}
+        for source, document in pages.items():
+            source_ids = ids.setdefault(source, [])
+            document_metadata = self._document_metadata(document, source, (metadata or {}).get(source))
+            for section, chunk in self.chunker.split_sections(document):
+                chunk_id = document_id(chunk, source)
+                if chunk_id in sources:
+                    continue
+                sources[chunk_id] = source
+                batch[chunk_id] = chunk
+                metadatas.append({**document_metadata, "section": section})
+                source_ids.append(chunk_id)
+                if len(batch) >= self.write_batch_size:
+                    self._upsert(batch, metadatas)
+                    batch, metadatas = {}, []
+        if batch:
+            self._upsert(batch, metadatas)
+
+        stale: List[str] = []
+        source_list = list(pages)
+        with self._write_lock:
+            for start in range(0, len(source_list), 500):
+                part = source_list[start:start + 500]
+                existing = self.collection.get(where={"source": {"$in": part}}, include=[])["ids"]
+                stale.extend(chunk_id for chunk_id in existing if chunk_id not in sources)
+            self._delete(stale)
+        logger.info(f"Replaced {len(pages)} sources: {len(sources)} chunks stored, {len(stale)} stale chunks removed")
+        return ids
+
+    def _delete(self, ids: List[str]):
+        """Delete chunks from the collection and the lexical index; call with the write lock held."""
+        if not ids:
+            return
+        self.collection.delete(ids=ids)
+        if self.lexical_index is not None:
+            self.lexical_index.delete(ids)
+        self._mark_changed()
+
+    def delete_source(self, source: str) -> int:
+        """
+        Remove every chunk stored for a source.
+
+        Returns:
+            Number of chunks removed
+        """
+        self._check_writable()
+        with self._write_lock:
+            ids = self.collection.get(where={"source": source}, include=[])["ids"]
+            self._delete(ids)
+        logger.info(f"Deleted {source}: {len(ids)} chunks removed")
+        return len(ids)
+
+    def rebuild_lexical_index(self, page_size: int = 5000):
+        """Index every stored chunk in the BM25 index, e.g. for a store created before it existed."""
+        if self.lexical_index is None:
+            return
+        started = time.perf_counter()
+        total = self.collection.count()
+        for offset in range(0, total, page_size):
+            page = self.collection.get(limit=page_size, offset=offset, include=["documents"])
+            self.lexical_index.add(page["ids"], page["documents"])
+        logger.info(f"Built BM25 index over {total} chunks in {time.perf_counter() - started:.1f}s")
+
+    def get_documents(self, query: str, where: Optional[Dict[str, Any]] = None,
+                      n_results: Optional[int] = None) -> List[str]:
+        """
+        Retrieve the chunks most relevant to the query.
+
+        Dense (``vector_k``) and BM25 (``bm25_k``) candidates are merged with
+        reciprocal rank fusion, which rewards chunks ranked high by either
+        retriever, so exact item, skill and mod names are found even when the
+        embedding misses them.
+
+        Args:
+            query: The user query
+            where: Optional metadata filter in the vector store's syntax, e.g.
+                {"section": "Bows Unique"} or {"crawled_at": {"$gte": 1700000000}};
+                applied inside the store to both dense and lexical candidates
+            n_results: Chunks to return, e.g. more candidates for a reranker
+                (defaults to ``self.n_results``)
+
+        Returns:
+            Up to ``n_results`` chunk texts, best first
+        """
+        return self.get_documents_batch([query], where=where, n_results=n_results)[0]
+
+    @timed("kb_query")
+    def get_documents_batch(self, queries: List[str], where: Optional[Dict[str, Any]] = None,
+                            n_results: Optional[int] = None) -> List[List[str]]:
+        """
+        Retrieve chunks for several queries sharing one filter and result count.
+
+        The queries are embedded in one call and searched in one vector store
+        query, and the chunk texts the dense results miss are fetched in one
+        lookup, so a batch costs little more than a single query.
+
+        Args:
+            queries: User queries
+            where: Metadata filter applied to every query, see get_documents()
+            n_results: Chunks to return per query
+
+        Returns:
+            One result list per query, in order, as get_documents() returns it
+        """
+        if not queries:
+            return []
+        if self.read_only and time.monotonic() - self._checked_at >= self.refresh_interval:
+            self._checked_at = time.monotonic()
+            self.refresh()
+        n_results = n_results or self.n_results
+        dense_k = max(self.vector_k, n_results) if self.lexical_index is None else max(self.vector_k, n_results // 2)
+        bm25_k = max(self.bm25_k, n_results // 2)
+        with span("embed_query"):
+            query_embeddings = embed_matrix(self.embedding_function, queries)
+        # One handle per batch, so a concurrent refresh never closes it midway
+        with self._reading() as collection:
+            with span("vector_search"):
+                results = collection.query(query_embeddings=query_embeddings, n_results=dense_k, where=where or None)
+            dense_ids = results['ids'] or [[] for _ in queries]
+            texts: Dict[str, str] = {}
+            for ids, documents in zip(dense_ids, results['documents'] or []):
+                texts.update(zip(ids, documents))
+            if self.lexical_index is None:
+                return [[texts[chunk_id] for chunk_id in ids[:n_results]] for ids in dense_ids]
+
+            with span("bm25_search"):
+                lexical_ids = [
+                    [chunk_id for chunk_id, _ in self.lexical_index.search(query, bm25_k * (4 if where else 1))]
+                    for query in queries
+                ]
+            if where and any(lexical_ids):
+                # The lexical index has no metadata; let the store filter its candidates
+                candidates = list(dict.fromkeys(chunk_id for ids in lexical_ids for chunk_id in ids))
+                matching = collection.get(ids=candidates, where=where, include=["documents"])
+                texts.update(zip(matching['ids'], matching['documents']))
+                allowed = set(matching['ids'])
+                lexical_ids = [[chunk_id for chunk_id in ids if chunk_id in allowed][:bm25_k] for ids in lexical_ids]
+            rankings = [
+                reciprocal_rank_fusion([dense, lexical], self.rrf_k)[:n_results]
+                for dense, lexical in zip(dense_ids, lexical_ids)
+            ]
+            missing = list(dict.fromkeys(chunk_id for ranked in rankings for chunk_id in ranked if chunk_id not in texts))
+            if missing:
+                fetched = collection.get(ids=missing, include=["documents"])
+                texts.update(zip(fetched['ids'], fetched['documents']))
+            # A chunk can vanish between the index lookup and the fetch
+            return [[texts[chunk_id] for chunk_id in ranked if chunk_id in texts] for ranked in rankings]
+
+    def health(self) -> Dict[str, Any]:
+        """Report collection size and how long the store took to open."""
+        return {
+            "status": "ok",
+            "path": self.path,
+            "collection": self.collection.name,
+            "documents": self.collection.count(),
+            "opened_at": self.opened_at.isoformat(),
+            "open_time_ms": round(self.open_time * 1000, 2),
+            "embedding_cache": self.embedding_cache.stats() if self.embedding_cache else None,
+            "lexical_index": len(self.lexical_index) if self.lexical_index is not None else None,
+            "read_only": self.read_only,
+            "generation": self.generation(),
+        }
+
+    def close(self):
+        self.client.close()
+        if self.lexical_index is not None:
+            self.lexical_index.close()
+        if self.embedding_cache is not None:
+            self.embedding_cache.close()
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """
+    Merge ranked ID lists by summing 1 / (k + rank) across them.
+
+    Args:
+        rankings: ID lists, best first
+        k: Damping constant; larger values flatten the contribution of top ranks
+
+    Returns:
+        All IDs, best fused score first
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+# Process-wide knowledge base shared by the graph nodes and API endpoints
+_shared_kb: Optional[ChromaDBKnowledgeBase] = None
+_shared_kb_lock = threading.Lock()
+
+def create_knowledge_base(backend: Optional[str] = None, **kwargs) -> ChromaDBKnowledgeBase:
+    """
+    Open the knowledge base backend selected by KB_BACKEND.
+
+    - ``chroma`` (default): Chroma's HNSW index, held in memory
+    - ``quantized``: int8 codes in memory-mapped files with exact rescoring,
+      for corpora whose float index does not fit in RAM
+
+    Args:
+        backend: Overrides KB_BACKEND
+        **kwargs: Passed to the knowledge base
+    """
+    backend = (backend or os.environ.get("KB_BACKEND", "chroma")).lower()
+    if backend == "chroma":
+        return ChromaDBKnowledgeBase(**kwargs)
+    if backend == "quantized":
+        from quantized_store import QuantizedKnowledgeBase
+
+        return QuantizedKnowledgeBase(**kwargs)
+    raise ValueError(f"Unknown KB_BACKEND: {backend}")
+
+def open_knowledge_base(**kwargs) -> ChromaDBKnowledgeBase:
+    """
+    Open the shared knowledge base if it is not open yet.
+
+    Args:
+        **kwargs: Passed to create_knowledge_base() on first open
+
+    Returns:
+        The shared knowledge base
+    """
+    global _shared_kb
+    with _shared_kb_lock:
+        if _shared_kb is None:
+            _shared_kb = create_knowledge_base(**kwargs)
+        return _shared_kb
+
+def get_knowledge_base() -> ChromaDBKnowledgeBase:
+    """Return the shared knowledge base, opening it with defaults on first use."""
+    kb = _shared_kb
+    if kb is not None:
+        return kb
+    return open_knowledge_base()
+
+def close_knowledge_base():
+    """Close the shared knowledge base; the next get_knowledge_base() reopens it."""
+    global _shared_kb
+    with _shared_kb_lock:
+        if _shared_kb is not None:
+            _shared_kb.close()
+            _shared_kb = None
@@ -1,55 +1,408 @@
-from openai import OpenAI
-from typing import List, Dict, Generator, Union
+from openai import (
+    OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient,
+    APIConnectionError, APITimeoutError, RateLimitError, InternalServerError
+)
+from typing import List, Dict, Generator, AsyncGenerator, Any, Optional, Union
+import asyncio
+import httpx
 import logging
 import os
+import random
+import threading
+import time
+from metrics import GenerationTimer
 
 logger = logging.getLogger(__name__)
 
+# Errors worth retrying; anything else (bad request, auth) fails immediately
+RETRYABLE_ERRORS = (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
+
+class LLMMetrics:
+    """Counters for upstream LLM calls, shared by the sync and async adapters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.retries_denied = 0
+        self.new_connections = 0
+        self.in_flight = 0
+        self.upstream_latency_total = 0.0
+        self.upstream_latency_max = 0.0
+
+    def add(self, name: str, value: float = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def observe_latency(self, seconds: float):
+        with self._lock:
+            self.upstream_latency_total += seconds
+            self.upstream_latency_max = max(self.upstream_latency_max, seconds)
+
+    def trace(self, event_name: str, info: Dict[str, Any]):
+        # httpcore reports every new TCP connection; requests sent on a
+        # pooled keep-alive connection produce no such event
+        if event_name == "connection.connect_tcp.complete":
+            self.add("new_connections")
+
+    async def atrace(self, event_name: str, info: Dict[str, Any]):
+        self.trace(event_name, info)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            attempts = self.requests + self.retries
+            reused = max(attempts - self.new_connections, 0)
+            return {
+                "requests": self.requests,
+                "failures": self.failures,
+                "retries": self.retries,
+                "retries_denied": self.retries_denied,
+                "in_flight": self.in_flight,
+                "new_connections": self.new_connections,
+                "connection_reuse_ratio": round(reused / attempts, 4) if attempts else 0.0,
+                "upstream_latency_avg_ms": round(self.upstream_latency_total / self.requests * 1000, 1) if self.requests else 0.0,
+                "upstream_latency_max_ms": round(self.upstream_latency_max * 1000, 1),
+            }
+
+metrics = LLMMetrics()
+
+def _finish_completion(completion, timer: GenerationTimer) -> str:
+    content = completion.choices[0].message.content
+    usage = getattr(completion, "usage", None)
+    timer.finish(usage.completion_tokens if usage and usage.completion_tokens else len((content or "").split()))
+    return content
+
+class RetryBudget:
+    """
+    Allow retries only while they stay a small fraction of traffic.
+
+    Every request deposits ``ratio`` tokens (capped at ``max_tokens``) and
+    every retry spends one, so an upstream outage cannot multiply load.
+    """
+
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+class LLMSettings:
+    """Connection, timeout, retry and concurrency settings for the LLM client."""
+
+    def __init__(self, connect_timeout: float = 5.0, read_timeout: float = 600.0,
+                 write_timeout: float = 30.0, pool_timeout: float = 30.0,
+                 max_connections: int = 100, keepalive_expiry: float = 60.0,
+                 max_retries: int = 2, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 max_concurrency: int = 8, retry_budget_ratio: float = 0.2):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        self.pool_timeout = pool_timeout
+        self.max_connections = max_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_concurrency = max_concurrency
+        self.retry_budget_ratio = retry_budget_ratio
+
+    @classmethod
+    def from_env(cls) -> "LLMSettings":
+        return cls(
+            connect_timeout=float(os.environ.get("LLM_CONNECT_TIMEOUT", "5")),
+            read_timeout=float(os.environ.get("LLM_READ_TIMEOUT", "600")),
+            write_timeout=float(os.environ.get("LLM_WRITE_TIMEOUT", "30")),
+            pool_timeout=float(os.environ.get("LLM_POOL_TIMEOUT", "30")),
+            max_connections=int(os.environ.get("LLM_MAX_CONNECTIONS", "100")),
+            keepalive_expiry=float(os.environ.get("LLM_KEEPALIVE_EXPIRY", "60")),
+            max_retries=int(os.environ.get("LLM_MAX_RETRIES", "2")),
+            max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", "8")),
+            retry_budget_ratio=float(os.environ.get("LLM_RETRY_BUDGET_RATIO", "0.2"))
+        )
+
+    @property
+    def timeout(self) -> httpx.Timeout:
+        # read is the longest gap between two received chunks, not the whole answer
+        return httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout
+        )
+
+    @property
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff before retry number ``attempt``."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
 class OpenAIAdapter:
-    def __init__(self, api_key: str, base_url: str, model: str):
+    def __init__(self, api_key: str, base_url: str, model: str, settings: Optional[LLMSettings] = None):
+        self.settings = settings or LLMSettings.from_env()
+
+        def trace(request: httpx.Request):
+            request.extensions["trace"] = metrics.trace
+
+        # Retries are handled here so they can be budgeted, not by the SDK
         self.client = OpenAI(
             base_url=base_url,
             api_key=api_key,
-            timeout=10800        
+            timeout=self.settings.timeout,
+            max_retries=0,
+            http_client=DefaultHttpxClient(
+                limits=self.settings.limits,
+                timeout=self.settings.timeout,
+                event_hooks={"request": [trace]}
+            )
         )
         self.model = model
+        self.retry_budget = RetryBudget(self.settings.retry_budget_ratio)
+        self._slots = threading.BoundedSemaphore(self.settings.max_concurrency)
 
     def generate(self, messages: List[Dict[str, str]], stream: bool = False) -> Union[str, Generator]:
         """
         Generate a response from the model.
-        
+
         Args:
             messages: List of message dictionaries with 'role' and 'content'
             stream: Whether to stream the response
-            
+
         Returns:
             Either a string response or a generator for streaming
         """
+        self._slots.acquire()
+        metrics.add("in_flight")
+        released = False
         try:
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                stream=stream
-            )
-            
+            timer = GenerationTimer("stream" if stream else "complete")
+            completion = self._create(messages, stream)
             if stream:
-                return self._process_stream(completion)
-            return completion.choices[0].message.content
+                # The slot is held until the stream is consumed or closed
+                released = True
+                return self._process_stream(completion, timer)
+            return _finish_completion(completion, timer)
         except Exception as e:
+            metrics.add("failures")
             logger.error(f"Error in generate: {str(e)}")
             logger.error(f"Messages: {messages}")
             raise
+        finally:
+            if not released:
+                self._release()
 
-    def _process_stream(self, completion) -> Generator:
+    def _create(self, messages: List[Dict[str, str]], stream: bool):
+        metrics.add("requests")
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                completion = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    stream=stream
+                )
+                metrics.observe_latency(time.perf_counter() - started)
+                return completion
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.settings.max_retries:
+                    raise
+                if not self.retry_budget.withdraw():
+                    metrics.add("retries_denied")
+                    raise
+                attempt += 1
+                metrics.add("retries")
+                delay = self.settings.backoff(attempt)
+                logger.warning(f"LLM call failed ({e.__class__.__name__}), retry {attempt} in {delay:.2f}s")
+                time.sleep(delay)
+
+    def _release(self):
+        metrics.add("in_flight", -1)
+        self._slots.release()
+
+    def _process_stream(self, completion, timer: GenerationTimer) -> Generator:
         """
         Process streaming response from the model.
-        
+
         Args:
             completion: The streaming completion object
-            
+            timer: Records time to first token and tokens/sec
+
         Yields:
             Content chunks from the stream
         """
-        for chunk in completion:
-            if chunk.choices[0].delta.content is not None:
-                yield chunk.choices[0].delta.content 
\ No newline at end of file
+        try:
+            for chunk in completion:
+                if chunk.choices and chunk.choices[0].delta.content is not None:
+                    timer.token()
+                    yield chunk.choices[0].delta.content
+        finally:
+            timer.finish()
+            completion.close()
+            self._release()
+
+class AsyncOpenAIAdapter:
+    def __init__(self, api_key: str, base_url: str, model: str, settings: Optional[LLMSettings] = None):
+        self.settings = settings or LLMSettings.from_env()
+
+        async def trace(request: httpx.Request):
+            request.extensions["trace"] = metrics.atrace
+
+        self.client = AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            timeout=self.settings.timeout,
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=self.settings.limits,
+                timeout=self.settings.timeout,
+                event_hooks={"request": [trace]}
+            )
+        )
+        self.model = model
+        self.retry_budget = RetryBudget(self.settings.retry_budget_ratio)
+        self._slots = asyncio.Semaphore(self.settings.max_concurrency)
+
+    async def generate(self, messages: List[Dict[str, str]], stream: bool = False) -> Union[str, AsyncGenerator]:
+        """
+        Generate a response from the model without blocking the event loop.
+
+        Args:
+            messages: List of message dictionaries with 'role' and 'content'
+            stream: Whether to stream the response
+
+        Returns:
+            Either a string response or an async generator for streaming
+        """
+        await self._slots.acquire()
+        metrics.add("in_flight")
+        released = False
+        try:
+            timer = GenerationTimer("stream" if stream else "complete")
+            completion = await self._create(messages, stream)
+            if stream:
+                # The slot is held until the stream is consumed or closed
+                released = True
+                return self._process_stream(completion, timer)
+            return _finish_completion(completion, timer)
+        except Exception as e:
+            metrics.add("failures")
+            logger.error(f"Error in generate: {str(e)}")
+            logger.error(f"Messages: {messages}")
+            raise
+        finally:
+            if not released:
+                self._release()
+
+    async def _create(self, messages: List[Dict[str, str]], stream: bool):
+        metrics.add("requests")
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                completion = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    stream=stream
+                )
+                metrics.observe_latency(time.perf_counter() - started)
+                return completion
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.settings.max_retries:
+                    raise
+                if not self.retry_budget.withdraw():
+                    metrics.add("retries_denied")
+                    raise
+                attempt += 1
+                metrics.add("retries")
+                delay = self.settings.backoff(attempt)
+                logger.warning(f"LLM call failed ({e.__class__.__name__}), retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    def _release(self):
+        metrics.add("in_flight", -1)
+        self._slots.release()
+
+    async def _process_stream(self, completion, timer: GenerationTimer) -> AsyncGenerator:
+        """
+        Process streaming response from the model.
+
+        Args:
+            completion: The async streaming completion object
+            timer: Records time to first token and tokens/sec
+
+        Yields:
+            Content chunks from the stream
+        """
+        try:
+            async for chunk in completion:
+                if chunk.choices and chunk.choices[0].delta.content is not None:
+                    timer.token()
+                    yield chunk.choices[0].delta.content
+        finally:
+            timer.finish()
+            await completion.close()
+            self._release()
+
+    async def close(self):
+        await self.client.close()
+
+
+# Long-lived adapters built from the environment on first use, so the hot
+# path neither reads env vars nor opens new connection pools
+_llm: Optional[OpenAIAdapter] = None
+_async_llm: Optional[AsyncOpenAIAdapter] = None
+_llm_lock = threading.Lock()
+
+def _env_settings() -> Dict[str, str]:
+    return {
+        "api_key": os.environ["LLM_API_KEY"],
+        "base_url": os.environ["LLM_BASE_URL"],
+        "model": os.environ.get("LLM_MODEL", "deepseek-r1-distill-llama-8b")  # Default if not set
+    }
+
+def get_llm() -> OpenAIAdapter:
+    """Return the shared sync adapter."""
+    global _llm
+    with _llm_lock:
+        if _llm is None:
+            _llm = OpenAIAdapter(**_env_settings())
+        return _llm
+
+def get_async_llm() -> AsyncOpenAIAdapter:
+    """Return the shared async adapter."""
+    global _async_llm
+    with _llm_lock:
+        if _async_llm is None:
+            _async_llm = AsyncOpenAIAdapter(**_env_settings())
+        return _async_llm
+
+async def close_llms():
+    """Close the shared adapters and their connection pools."""
+    global _llm, _async_llm
+    with _llm_lock:
+        llm, async_llm = _llm, _async_llm
+        _llm = _async_llm = None
+    if llm is not None:
+        llm.client.close()
+    if async_llm is not None:
+        await async_llm.close()
@@ -0,0 +1,172 @@
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, Tuple
+import cProfile
+import functools
+import inspect
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+    )
+except ImportError:  # Metrics become no-ops; pip install prometheus-client
+    Counter = Histogram = None
+
+# Stage latencies span sub-millisecond BM25 lookups to multi-second generations
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 20, 35, 50, 75, 100, 150, 200, 500)
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs) -> "_NoopMetric":
+        return self
+
+    def observe(self, value: float):
+        pass
+
+    def inc(self, value: float = 1):
+        pass
+
+def _histogram(name: str, documentation: str, labels: Tuple[str, ...] = (), buckets=STAGE_BUCKETS):
+    if Histogram is None:
+        return _NoopMetric()
+    return Histogram(name, documentation, labels, buckets=buckets)
+
+def _counter(name: str, documentation: str, labels: Tuple[str, ...] = ()):
+    if Counter is None:
+        return _NoopMetric()
+    return Counter(name, documentation, labels)
+
+STAGE_SECONDS = _histogram("rag_stage_seconds", "Time spent in each pipeline stage", ("stage",))
+REQUEST_SECONDS = _histogram("rag_request_seconds", "HTTP request latency until the response starts",
+                             ("method", "path", "status"))
+LLM_TIME_TO_FIRST_TOKEN = _histogram("rag_llm_time_to_first_token_seconds",
+                                     "Time from sending an LLM request to its first token", ("mode",))
+LLM_TOKENS_PER_SECOND = _histogram("rag_llm_tokens_per_second", "LLM generation speed after the first token",
+                                   ("mode",), buckets=TOKEN_RATE_BUCKETS)
+LLM_TOKENS = _counter("rag_llm_tokens", "Tokens generated by the LLM", ("mode",))
+
+def observe(stage: str, seconds: float):
+    """Record the duration of a stage that was timed elsewhere."""
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time the enclosed block as ``stage``, including when it raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s took %.2f ms", stage, elapsed * 1000)
+
+def timed(stage: str) -> Callable[[Callable], Callable]:
+    """Decorator form of span() for plain and async functions."""
+    def decorate(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+class GenerationTimer:
+    """TTFT and tokens/sec of one LLM call; chunks count as tokens when streaming."""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.tokens = 0
+
+    def token(self, count: int = 1):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            LLM_TIME_TO_FIRST_TOKEN.labels(self.mode).observe(self.first_token_at - self.started)
+        self.tokens += count
+
+    def finish(self, tokens: Optional[int] = None):
+        """Record the rate; ``tokens`` is the usage count of a non-streamed answer."""
+        if tokens is not None:
+            # The whole answer arrives at once, so its latency is the TTFT
+            self.token(tokens)
+        if self.first_token_at is None or not self.tokens:
+            return
+        LLM_TOKENS.labels(self.mode).inc(self.tokens)
+        duration = time.perf_counter() - (self.first_token_at if tokens is None else self.started)
+        if duration > 0:
+            LLM_TOKENS_PER_SECOND.labels(self.mode).observe(self.tokens / duration)
+
+def exposition() -> Tuple[bytes, str]:
+    """
+    Metrics in the Prometheus text format.
+
+    With PROMETHEUS_MULTIPROC_DIR set (multi-worker deployments) the values
+    of every worker process are aggregated.
+    """
+    if Histogram is None:
+        return b"# prometheus-client is not installed\n", "text/plain; charset=utf-8"
+    registry = REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+class SamplingProfiler:
+    """
+    Profile a random sample of requests with cProfile (opt-in).
+
+    ``rate`` is the fraction of requests profiled (PROFILE_SAMPLE_RATE, 0 by
+    default); each profile is written to ``directory`` as a .prof file for
+    snakeviz or pstats. One request is profiled at a time. In async
+    handlers the profile also contains whatever else ran on the event loop
+    meanwhile, so read it as a sample of the process's hot paths.
+    """
+
+    def __init__(self, rate: float = 0.0, directory: str = "./profiles"):
+        self.rate = rate
+        self.directory = directory
+        self.profiles = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "SamplingProfiler":
+        return cls(
+            rate=float(os.environ.get("PROFILE_SAMPLE_RATE", "0")),
+            directory=os.environ.get("PROFILE_DIR", "./profiles")
+        )
+
+    @contextmanager
+    def maybe_profile(self, name: str) -> Iterator[bool]:
+        """Profile the enclosed block if it is sampled; yields whether it is."""
+        if self.rate <= 0 or random.random() >= self.rate or not self._lock.acquire(blocking=False):
+            yield False
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                yield True
+            finally:
+                profiler.disable()
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{name.strip('/').replace('/', '_') or 'root'}-{self.profiles}.prof")
+            profiler.dump_stats(path)
+            self.profiles += 1
+            logger.info(f"Wrote profile {path}")
+        finally:
+            self._lock.release()
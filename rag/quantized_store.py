@@ -0,0 +1,495 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+import numpy as np
+from knowledge_base import ChromaDBKnowledgeBase
+
+logger = logging.getLogger(__name__)
+
+_FIELD_RE = re.compile(r"^\w+$")
+_OPERATORS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+def where_sql(where: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """
+    Translate a metadata filter in the vector store's ``where`` syntax to SQL.
+
+    Supports equality, $eq/$ne/$gt/$gte/$lt/$lte/$in/$nin on metadata
+    fields and nested $and/$or.
+
+    Returns:
+        (SQL condition on the ``metadata`` JSON column, parameters)
+    """
+    clauses: List[str] = []
+    params: List[Any] = []
+    for key, value in where.items():
+        if key in ("$and", "$or"):
+            parts = [where_sql(condition) for condition in value]
+            clauses.append("(" + f" {key[1:].upper()} ".join(sql for sql, _ in parts) + ")")
+            params.extend(param for _, part_params in parts for param in part_params)
+            continue
+        if not _FIELD_RE.match(key):
+            raise ValueError(f"Unsupported metadata field: {key}")
+        field = f"json_extract(metadata, '$.{key}')"
+        conditions = value if isinstance(value, dict) else {"$eq": value}
+        for operator, operand in conditions.items():
+            if operator in ("$in", "$nin"):
+                negate = "NOT " if operator == "$nin" else ""
+                clauses.append(f"{field} {negate}IN ({','.join('?' * len(operand))})" if operand else
+                               ("1" if negate else "0"))
+                params.extend(operand)
+            elif operator in _OPERATORS:
+                clauses.append(f"{field} {_OPERATORS[operator]} ?")
+                params.append(operand)
+            else:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+    return " AND ".join(clauses) or "1", params
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+class QuantizedCollection:
+    """
+    Vector store with int8 codes in memory-mapped files and exact rescoring.
+
+    Implements the part of Chroma's collection API the knowledge base uses,
+    and serves as its own client. Vectors are normalized and scored by
+    cosine similarity. Each is stored twice, as float32 and as int8 codes
+    with a per-vector scale; queries scan only the codes, a quarter of the
+    float size, and rescore the best ``rescore`` x ``n_results`` candidates
+    exactly against the float vectors, so only those pages of the float file
+    are read. Once ``ivf_min`` vectors are stored they are also partitioned
+    by k-means into inverted lists and a query scans only its ``nprobe``
+    nearest lists. Documents, metadata and slot assignments live in SQLite.
+    A ``read_only`` collection opens them without creating or changing
+    anything, and is empty until the writer has created the store.
+    """
+
+    name = "knowledge_base"
+    _SCAN_BLOCK = 16384
+    # Filters matching fewer chunks than this are scored exactly
+    _EXACT_FILTER_LIMIT = 20000
+
+    def __init__(self, path: str, read_only: bool = False, nprobe: int = 16,
+                 rescore: int = 10, ivf_min: int = 50000):
+        self.path = path
+        self.read_only = read_only
+        self.nprobe = nprobe
+        self.rescore = rescore
+        self.ivf_min = ivf_min
+        self._lock = threading.RLock()
+        self._train_lock = threading.Lock()
+        # Slots written while k-means runs; reassigned when its centroids are swapped in
+        self._retrain_slots: Optional[set] = None
+        database = os.path.join(path, "chunks.sqlite")
+        if read_only and os.path.exists(database):
+            self._db = sqlite3.connect(f"{Path(os.path.abspath(database)).as_uri()}?mode=ro", uri=True,
+                                       check_same_thread=False)
+        else:
+            if not read_only:
+                os.makedirs(path, exist_ok=True)
+            # A reader opened before the first write sees an empty store until reopened
+            self._db = sqlite3.connect(database if not read_only else ":memory:", check_same_thread=False)
+            if not read_only:
+                self._db.execute("PRAGMA journal_mode=WAL")
+            # Slots index the rows of the vector files; freed slots are reused
+            self._db.execute("CREATE TABLE IF NOT EXISTS chunks (slot INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, "
+                             "document TEXT, metadata TEXT)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS free (slot INTEGER PRIMARY KEY)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, value INTEGER)")
+            self._db.commit()
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self.dim = self._state("dim")
+        self.capacity = self._state("capacity") or 0
+        self._next_slot = self._state("next_slot") or 0
+        self.trained_count = self._state("trained_count") or 0
+        self._vectors = self._codes = self._scales = self._lists = None
+        self._open_files()
+        self._live = np.zeros(self.capacity, dtype=bool)
+        slots = [slot for slot, in self._db.execute("SELECT slot FROM chunks")]
+        self._live[slots] = True
+        centroids_path = os.path.join(path, "centroids.npy")
+        self._centroids = np.load(centroids_path) if os.path.exists(centroids_path) else None
+        self._list_index: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    # Client API
+
+    def get_max_batch_size(self) -> int:
+        return 100_000
+
+    def clear_system_cache(self):
+        pass
+
+    def close(self):
+        with self._lock:
+            for memmap in (self._vectors, self._codes, self._scales, self._lists):
+                if memmap is not None and not self.read_only:
+                    memmap.flush()
+            self._vectors = self._codes = self._scales = self._lists = None
+            self._db.close()
+
+    # Collection API
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def upsert(self, ids: List[str], embeddings, documents: Optional[List[str]] = None,
+               metadatas: Optional[List[Dict[str, Any]]] = None):
+        """Insert or overwrite chunks by ID."""
+        if not ids:
+            return
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._set_state("dim", self.dim)
+            existing = dict(self._select_in("SELECT id, slot FROM chunks WHERE id IN ({})", ids))
+            new_ids = [chunk_id for chunk_id in dict.fromkeys(ids) if chunk_id not in existing]
+            slot_of = {**existing, **dict(zip(new_ids, self._allocate(len(new_ids))))}
+            # The last occurrence of a repeated ID wins, as in Chroma
+            rows = {chunk_id: i for i, chunk_id in enumerate(ids)}
+            slots = np.array([slot_of[chunk_id] for chunk_id in rows], dtype=np.int64)
+            order = [rows[chunk_id] for chunk_id in rows]
+            self._write_vectors(slots, vectors[order])
+            self._db.executemany(
+                "INSERT OR REPLACE INTO chunks (slot, id, document, metadata) VALUES (?, ?, ?, ?)",
+                [(int(slot_of[chunk_id]), chunk_id, documents[i] if documents else None,
+                  json.dumps(metadatas[i]) if metadatas and metadatas[i] else None)
+                 for chunk_id, i in rows.items()]
+            )
+            self._db.commit()
+            self._live[slots] = True
+            self._list_index = None
+            if self._retrain_slots is not None:
+                self._retrain_slots.update(slots.tolist())
+            live = int(self._live.sum())
+            retrain = live >= self.ivf_min and live >= 4 * self.trained_count
+        # Writers only wait for training to snapshot and swap, never for k-means itself
+        if retrain and self._train_lock.acquire(blocking=False):
+            try:
+                self._train()
+            finally:
+                self._train_lock.release()
+
+    add = upsert
+
+    def delete(self, ids: List[str]):
+        if not ids:
+            return
+        with self._lock:
+            slots = [slot for _, slot in self._select_in("SELECT id, slot FROM chunks WHERE id IN ({})", ids)]
+            self._execute_in("DELETE FROM chunks WHERE slot IN ({})", slots)
+            self._db.executemany("INSERT OR IGNORE INTO free VALUES (?)", [(slot,) for slot in slots])
+            self._db.commit()
+            self._live[slots] = False
+            self._list_index = None
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            include: Sequence[str] = ("documents", "metadatas"), limit: Optional[int] = None,
+            offset: Optional[int] = None) -> Dict[str, Any]:
+        condition, params = where_sql(where) if where else ("1", [])
+        sql = f"SELECT id, document, metadata FROM chunks WHERE {condition}"
+        with self._lock:
+            if ids is not None:
+                rows = []
+                for start in range(0, len(ids), 500):
+                    part = ids[start:start + 500]
+                    rows.extend(self._db.execute(f"{sql} AND id IN ({','.join('?' * len(part))})",
+                                                 params + list(part)).fetchall())
+            else:
+                rows = self._db.execute(f"{sql} ORDER BY slot LIMIT ? OFFSET ?",
+                                        params + [-1 if limit is None else limit, offset or 0]).fetchall()
+        return {
+            "ids": [row[0] for row in rows],
+            "documents": [row[1] for row in rows] if "documents" in include else None,
+            "metadatas": [json.loads(row[2]) if row[2] else None for row in rows] if "metadatas" in include else None,
+        }
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict[str, Any]] = None,
+              include: Sequence[str] = ("documents", "distances")) -> Dict[str, Any]:
+        """
+        Nearest chunks for each query embedding.
+
+        Returns:
+            ``ids``, ``documents`` and cosine ``distances`` per query, best first
+        """
+        queries = _normalize(np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.dim or 1))
+        with self._lock:
+            vectors, codes, scales = self._vectors, self._codes, self._scales
+            live = self._live[:self._next_slot].copy()
+            allowed = None
+            if where:
+                condition, params = where_sql(where)
+                allowed = np.sort(np.array([slot for slot, in self._db.execute(
+                    f"SELECT slot FROM chunks WHERE {condition}", params)], dtype=np.int64))
+            list_index = self._get_list_index() if self._centroids is not None else None
+            centroids = self._centroids
+        if vectors is None or not live.any():
+            return {"ids": [[] for _ in queries], "documents": [[] for _ in queries], "distances": [[] for _ in queries]}
+
+        results: List[List[Tuple[int, float]]] = []
+        if allowed is not None and len(allowed) <= self._EXACT_FILTER_LIMIT:
+            for query in queries:
+                results.append(self._top(allowed, np.asarray(vectors[allowed]) @ query, n_results))
+        else:
+            if allowed is not None:
+                mask = np.zeros_like(live)
+                mask[allowed[allowed < len(mask)]] = True
+                live &= mask
+            candidates = n_results * self.rescore
+            for query in queries:
+                if list_index is not None:
+                    slots = self._probe(query, centroids, list_index)
+                    slots = slots[live[slots]]
+                    approximate = self._approximate(codes, scales, slots, query)
+                else:
+                    slots, approximate = self._scan(codes, scales, live, query)
+                shortlist = np.sort(slots[np.argsort(-approximate)[:candidates]])
+                results.append(self._top(shortlist, vectors[shortlist] @ query, n_results))
+
+        with self._lock:
+            documents = dict(self._select_in("SELECT slot, document FROM chunks WHERE slot IN ({})",
+                                             [int(slot) for result in results for slot, _ in result]))
+            ids = dict(self._select_in("SELECT slot, id FROM chunks WHERE slot IN ({})",
+                                       [int(slot) for result in results for slot, _ in result]))
+        # A chunk can be deleted between scoring and the lookup
+        results = [[(slot, score) for slot, score in result if slot in ids] for result in results]
+        return {
+            "ids": [[ids[slot] for slot, _ in result] for result in results],
+            "documents": [[documents[slot] for slot, _ in result] for result in results],
+            "distances": [[1.0 - score for _, score in result] for result in results],
+        }
+
+    # Index maintenance
+
+    def train(self, lists: Optional[int] = None, sample: int = 100_000, iterations: int = 10):
+        """
+        Partition the stored vectors into ``lists`` inverted lists with k-means.
+
+        Runs automatically when the store reaches ``ivf_min`` vectors and
+        again whenever it has grown fourfold since. K-means and the list
+        assignment run on a snapshot without the collection's lock, so
+        queries and writes continue meanwhile; only the swap of the new
+        centroids takes it.
+        """
+        with self._train_lock:
+            self._train(lists, sample, iterations)
+
+    def _train(self, lists: Optional[int] = None, sample: int = 100_000, iterations: int = 10):
+        with self._lock:
+            slots = np.flatnonzero(self._live[:self._next_slot])
+            if not len(slots):
+                return
+            vectors = self._vectors
+            self._retrain_slots = set()
+        try:
+            started = time.perf_counter()
+            lists = lists or int(np.clip(np.sqrt(len(slots)), 16, 4096))
+            rng = np.random.default_rng(0)
+            training = np.sort(rng.choice(slots, min(sample, len(slots)), replace=False))
+            data = np.asarray(vectors[training])
+            centroids = data[rng.choice(len(data), min(lists, len(data)), replace=False)]
+            for _ in range(iterations):
+                assignment = np.argmax(data @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignment, data)
+                counts = np.bincount(assignment, minlength=len(centroids))
+                empty = counts == 0
+                # Reseed empty lists with random training vectors
+                sums[empty] = data[rng.choice(len(data), int(empty.sum()))]
+                centroids = _normalize(sums)
+            centroids = centroids.astype(np.float32)
+            assignment = np.empty(len(slots), dtype=np.int32)
+            for start in range(0, len(slots), self._SCAN_BLOCK):
+                block = slots[start:start + self._SCAN_BLOCK]
+                assignment[start:start + len(block)] = np.argmax(np.asarray(vectors[block]) @ centroids.T, axis=1)
+
+            with self._lock:
+                if self._lists is None:  # Closed meanwhile
+                    return
+                self._centroids = centroids
+                self._lists[slots] = assignment
+                # Written since the snapshot: assigned against the old centroids, or not at all
+                rewritten = np.array(sorted(self._retrain_slots), dtype=np.int64)
+                if len(rewritten):
+                    self._lists[rewritten] = np.argmax(np.asarray(self._vectors[rewritten]) @ centroids.T, axis=1)
+                self._lists.flush()
+                tmp = os.path.join(self.path, "centroids.tmp.npy")
+                np.save(tmp, centroids)
+                os.replace(tmp, os.path.join(self.path, "centroids.npy"))
+                self.trained_count = len(slots)
+                self._set_state("trained_count", self.trained_count)
+                self._db.commit()
+                self._list_index = None
+        finally:
+            with self._lock:
+                self._retrain_slots = None
+        logger.info(f"Partitioned {len(slots)} vectors into {len(centroids)} lists "
+                    f"in {time.perf_counter() - started:.1f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            live = int(self._live.sum())
+            dim = self.dim or 0
+        return {
+            "backend": "quantized",
+            "vectors": live,
+            "dim": dim,
+            "lists": len(self._centroids) if self._centroids is not None else 0,
+            "nprobe": self.nprobe,
+            "rescore": self.rescore,
+            # Scanned on every query; the float vectors are read only for candidates
+            "code_bytes": live * (dim + 4),
+            "float_bytes": live * dim * 4,
+        }
+
+    # Internals
+
+    def _scan(self, codes, scales, live: np.ndarray, query: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        slots = np.flatnonzero(live)
+        return slots, self._approximate(codes, scales, slots, query)
+
+    def _approximate(self, codes, scales, slots: np.ndarray, query: np.ndarray) -> np.ndarray:
+        scores = np.empty(len(slots), dtype=np.float32)
+        for start in range(0, len(slots), self._SCAN_BLOCK):
+            block = slots[start:start + self._SCAN_BLOCK]
+            if len(block) and block[-1] - block[0] == len(block) - 1:
+                # Contiguous slots: a slice reads the memmap without a gather
+                rows = codes[block[0]:block[-1] + 1]
+            else:
+                rows = codes[block]
+            scores[start:start + len(block)] = (rows.astype(np.float32) @ query) * scales[block]
+        return scores
+
+    def _probe(self, query: np.ndarray, centroids: np.ndarray,
+               list_index: Tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+        order, offsets = list_index
+        nearest = np.argsort(-(centroids @ query))[:self.nprobe]
+        return np.sort(np.concatenate([order[offsets[i]:offsets[i + 1]] for i in nearest]))
+
+    def _get_list_index(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Slots grouped by inverted list, rebuilt after writes."""
+        if self._list_index is None:
+            lists = np.asarray(self._lists[:self._next_slot])
+            order = np.argsort(lists, kind="stable")
+            # Untrained (-1) slots sort first and are never probed
+            counts = np.bincount(lists[lists >= 0], minlength=len(self._centroids))
+            offsets = np.concatenate([[0], np.cumsum(counts)]) + int((lists < 0).sum())
+            self._list_index = (order, offsets)
+        return self._list_index
+
+    @staticmethod
+    def _top(slots: np.ndarray, scores: np.ndarray, n: int) -> List[Tuple[int, float]]:
+        best = np.argsort(-scores)[:n]
+        return [(int(slots[i]), float(scores[i])) for i in best]
+
+    def _write_vectors(self, slots: np.ndarray, vectors: np.ndarray):
+        scale = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+        self._vectors[slots] = vectors
+        self._codes[slots] = np.round(vectors / scale[:, None]).astype(np.int8)
+        self._scales[slots] = scale
+        if self._centroids is not None:
+            self._lists[slots] = np.argmax(vectors @ self._centroids.T, axis=1)
+        else:
+            self._lists[slots] = -1
+        for memmap in (self._vectors, self._codes, self._scales, self._lists):
+            memmap.flush()
+
+    def _allocate(self, n: int) -> List[int]:
+        if n == 0:
+            return []
+        free = [slot for slot, in self._db.execute("SELECT slot FROM free ORDER BY slot LIMIT ?", (n,))]
+        self._execute_in("DELETE FROM free WHERE slot IN ({})", free)
+        fresh = list(range(self._next_slot, self._next_slot + n - len(free)))
+        if fresh:
+            self._next_slot = fresh[-1] + 1
+            self._set_state("next_slot", self._next_slot)
+            if self._next_slot > self.capacity:
+                self._grow(self._next_slot)
+        return free + fresh
+
+    def _grow(self, rows: int):
+        capacity = max(1024, self.capacity)
+        while capacity < rows:
+            capacity *= 2
+        for name, dtype, width in self._files():
+            with open(os.path.join(self.path, name), "ab") as f:
+                f.truncate(capacity * width * np.dtype(dtype).itemsize)
+        self.capacity = capacity
+        self._set_state("capacity", capacity)
+        self._open_files()
+        live = np.zeros(capacity, dtype=bool)
+        live[:len(self._live)] = self._live
+        self._live = live
+
+    def _files(self) -> List[Tuple[str, Any, int]]:
+        return [("vectors.f32", np.float32, self.dim), ("codes.i8", np.int8, self.dim),
+                ("scales.f32", np.float32, 1), ("lists.i32", np.int32, 1)]
+
+    def _open_files(self):
+        if not self.capacity or self.dim is None:
+            return
+        mode = "r" if self.read_only else "r+"
+        opened = []
+        for name, dtype, width in self._files():
+            shape = (self.capacity, width) if width > 1 else (self.capacity,)
+            opened.append(np.memmap(os.path.join(self.path, name), dtype=dtype, mode=mode, shape=shape))
+        self._vectors, self._codes, self._scales, self._lists = opened
+
+    def _state(self, name: str) -> Optional[int]:
+        row = self._db.execute("SELECT value FROM state WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, name: str, value: int):
+        self._db.execute("INSERT OR REPLACE INTO state VALUES (?, ?)", (name, int(value)))
+
+    def _select_in(self, sql: str, values: Iterable[Any]) -> List[tuple]:
+        values = list(values)
+        rows: List[tuple] = []
+        for start in range(0, len(values), 500):
+            part = values[start:start + 500]
+            rows.extend(self._db.execute(sql.format(",".join("?" * len(part))), part).fetchall())
+        return rows
+
+    def _execute_in(self, sql: str, values: list):
+        for start in range(0, len(values), 500):
+            part = values[start:start + 500]
+            self._db.execute(sql.format(",".join("?" * len(part))), part)
+
+class QuantizedKnowledgeBase(ChromaDBKnowledgeBase):
+    """
+    Knowledge base on a QuantizedCollection instead of Chroma (KB_BACKEND=quantized).
+
+    Chroma keeps its whole float32 HNSW index in memory; this backend keeps
+    vectors in memory-mapped files and only scans int8 codes, so the
+    resident set is a fraction of the index and the OS pages vectors in and
+    out as needed. Chunking, hybrid BM25 retrieval, metadata filters, source
+    replacement and read-only workers behave as with Chroma. The store lives
+    in ``<path>/quantized`` and is not shared with a Chroma store at the
+    same path. QUANTIZED_NPROBE, QUANTIZED_RESCORE and QUANTIZED_IVF_MIN
+    tune the recall/latency trade-off.
+    """
+
+    def __init__(self, *args, nprobe: Optional[int] = None, rescore: Optional[int] = None,
+                 ivf_min: Optional[int] = None, **kwargs):
+        self.nprobe = nprobe or int(os.environ.get("QUANTIZED_NPROBE", "16"))
+        self.rescore = rescore or int(os.environ.get("QUANTIZED_RESCORE", "10"))
+        self.ivf_min = ivf_min or int(os.environ.get("QUANTIZED_IVF_MIN", "50000"))
+        super().__init__(*args, **kwargs)
+
+    def _connect(self):
+        collection = QuantizedCollection(
+            os.path.join(self.path, "quantized"), read_only=self.read_only,
+            nprobe=self.nprobe, rescore=self.rescore, ivf_min=self.ivf_min
+        )
+        return collection, collection
+
+    def health(self) -> Dict[str, Any]:
+        return {**super().health(), "vector_index": self.collection.stats()}
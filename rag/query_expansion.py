@@ -0,0 +1,247 @@
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Set
+import asyncio
+import logging
+import os
+import threading
+import time
+from bm25 import tokenize
+from knowledge_base import reciprocal_rank_fusion
+from metrics import observe
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = ("rewrite", "raw", "keywords")
+
+_STOPWORDS = frozenset("""
+a about after all also an and any are as at be because been but by can could did do does doing for from
+get got had has have how i if in into is it its just me more most my no not now of on or our out over
+please should so some such tell than that the their them then there these they this those to too up us
+very was we were what when where which while who why will with would you your
+""".split())
+
+class VariantStats:
+    def __init__(self):
+        self.issued = 0
+        self.in_time = 0
+        self.late = 0
+        self.errors = 0
+        self.finished = 0
+        # Searches whose passages made it into the merged result
+        self.contributed = 0
+        # Passages in merged results that no other variant found
+        self.unique_hits = 0
+        self.latency = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        finished = self.finished
+        return {
+            "issued": self.issued,
+            "in_time": self.in_time,
+            "late": self.late,
+            "errors": self.errors,
+            "contributed": self.contributed,
+            "unique_hits": self.unique_hits,
+            "avg_latency_ms": round(1000 * self.latency / finished, 2) if finished else 0.0,
+        }
+
+class QueryExpander:
+    """
+    Retrieve with several variants of the user's question at once.
+
+    Variants:
+
+    - ``raw``: the latest message as written
+    - ``rewrite``: the latest message plus the keywords of the previous
+      ``history`` user turns it does not already contain, so follow-ups such
+      as "what about for witch?" keep their subject. The rewrite is lexical;
+      an LLM rewrite would add a model round trip ahead of retrieval
+    - ``keywords``: the latest message without stop words, which sharpens
+      the dense search on chatty questions
+
+    Identical variants are searched once. All searches start together and
+    whatever has finished ``deadline`` seconds later is merged with
+    reciprocal rank fusion; later variants are dropped, even if they finish
+    while the raw search is still running. The raw search is always waited
+    for, so an answer never has less context than without expansion.
+    """
+
+    def __init__(self, variants: List[str] = list(VARIANTS), deadline: float = 0.15, history: int = 2,
+                 workers: int = 4):
+        unknown = set(variants) - set(VARIANTS)
+        if unknown:
+            raise ValueError(f"Unknown query variants: {sorted(unknown)}")
+        # The raw variant anchors every search
+        self.variants = ["raw"] + [variant for variant in variants if variant != "raw"]
+        self.deadline = deadline
+        self.history = history
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._stats = {variant: VariantStats() for variant in self.variants}
+        self.searches = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["QueryExpander"]:
+        """An expander when QUERY_EXPANSION is enabled, else None (the default)."""
+        if os.environ.get("QUERY_EXPANSION", "").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(
+            variants=[v.strip() for v in os.environ.get("QUERY_EXPANSION_VARIANTS", ",".join(VARIANTS)).split(",")],
+            deadline=float(os.environ.get("QUERY_EXPANSION_DEADLINE_MS", "150")) / 1000,
+            history=int(os.environ.get("QUERY_EXPANSION_HISTORY", "2")),
+            workers=int(os.environ.get("QUERY_EXPANSION_THREADS", "4"))
+        )
+
+    def expand(self, messages: List[Dict[str, str]]) -> Dict[str, str]:
+        """
+        Build the query variants for a conversation.
+
+        Args:
+            messages: Conversation so far, ending with the user's question
+
+        Returns:
+            Variant name -> query, without duplicate or empty queries
+        """
+        latest = messages[-1]["content"]
+        candidates = {"raw": latest}
+        if "rewrite" in self.variants:
+            earlier = [m["content"] for m in messages[:-1] if m["role"] == "user"][-self.history:] if self.history else []
+            present = set(tokenize(latest))
+            context = [word for text in earlier for word in self._keywords(text) if word not in present]
+            if context:
+                candidates["rewrite"] = " ".join([latest] + list(dict.fromkeys(context)))
+        if "keywords" in self.variants:
+            candidates["keywords"] = " ".join(self._keywords(latest))
+        variants: Dict[str, str] = {}
+        for name in self.variants:
+            query = candidates.get(name, "").strip()
+            if query and query not in variants.values():
+                variants[name] = query
+        return variants
+
+    def retrieve(self, messages: List[Dict[str, str]], submit: Callable[[str], Future],
+                 n_results: int) -> List[str]:
+        """
+        Search every variant and merge what finished by the deadline.
+
+        Args:
+            messages: Conversation so far, ending with the user's question
+            submit: Starts a search for a query and returns a future of the
+                caller's own (RetrievalScheduler.submit, run); aretrieve()
+                cancels them when it is cancelled
+            n_results: Passages to return
+
+        Returns:
+            Up to ``n_results`` passages, best first
+        """
+        variants = self.expand(messages)
+        started = time.perf_counter()
+        futures = self._start(variants, submit, started)
+        if len(futures) > 1:
+            wait(list(futures.values()), timeout=self.deadline)
+        in_time = self._done(futures)
+        futures["raw"].result()
+        return self._merge(futures, in_time, n_results, started)
+
+    async def aretrieve(self, messages: List[Dict[str, str]], submit: Callable[[str], Future],
+                        n_results: int) -> List[str]:
+        """retrieve() for the event loop; waits without holding a thread."""
+        variants = self.expand(messages)
+        started = time.perf_counter()
+        futures = self._start(variants, submit, started)
+        if len(futures) > 1:
+            await asyncio.wait([asyncio.wrap_future(future) for future in futures.values()], timeout=self.deadline)
+        in_time = self._done(futures)
+        await asyncio.wrap_future(futures["raw"])
+        return self._merge(futures, in_time, n_results, started)
+
+    def run(self, fn: Callable, *args) -> Future:
+        """
+        Run a search on the expander's own threads, for callers without a
+        RetrievalScheduler. They are kept apart from the graph's retrieval
+        pool, whose threads may be the ones waiting on these searches.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="expansion")
+            return self._executor.submit(fn, *args)
+
+    def close(self):
+        """Stop the search threads without waiting for late variants; run() starts them again."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "deadline_ms": self.deadline * 1000,
+                "searches": self.searches,
+                "variants": {name: stats.as_dict() for name, stats in self._stats.items()},
+            }
+
+    def _start(self, variants: Dict[str, str], submit: Callable[[str], Future], started: float) -> Dict[str, Future]:
+        futures: Dict[str, Future] = {}
+        with self._lock:
+            self.searches += 1
+            for name in variants:
+                self._stats[name].issued += 1
+        for name, query in variants.items():
+            future = submit(query)
+            future.add_done_callback(lambda f, name=name: self._finished(name, f, started))
+            futures[name] = future
+        return futures
+
+    def _finished(self, name: str, future: Future, started: float):
+        elapsed = time.perf_counter() - started
+        observe(f"expansion_{name}", elapsed)
+        with self._lock:
+            stats = self._stats[name]
+            stats.finished += 1
+            stats.latency += elapsed
+            if not future.cancelled() and future.exception() is not None:
+                stats.errors += 1
+
+    @staticmethod
+    def _done(futures: Dict[str, Future]) -> Set[str]:
+        """Variants finished at the deadline; the raw search counts however long it takes."""
+        return {name for name, future in futures.items() if future.done()} | {"raw"}
+
+    def _merge(self, futures: Dict[str, Future], in_time: Set[str], n_results: int, started: float) -> List[str]:
+        rankings: Dict[str, List[str]] = {}
+        for name, future in futures.items():
+            if name not in in_time or future.cancelled():
+                continue
+            if future.exception() is None:
+                rankings[name] = list(future.result())
+            else:
+                logger.warning(f"Query variant {name} failed: {str(future.exception())}")
+        if len(rankings) == 1:
+            merged = rankings["raw"][:n_results]
+        else:
+            merged = reciprocal_rank_fusion(list(rankings.values()))[:n_results]
+        kept = set(merged)
+        found_by: Dict[str, int] = {}
+        for passages in rankings.values():
+            for passage in set(passages) & kept:
+                found_by[passage] = found_by.get(passage, 0) + 1
+        with self._lock:
+            # Counted from the same snapshot as the merge, not from when each search finished
+            for name in futures:
+                if name in rankings:
+                    self._stats[name].in_time += 1
+                elif name not in in_time:
+                    self._stats[name].late += 1
+            for name, passages in rankings.items():
+                hits = set(passages) & kept
+                if hits:
+                    self._stats[name].contributed += 1
+                self._stats[name].unique_hits += sum(1 for passage in hits if found_by[passage] == 1)
+        logger.debug(f"Merged variants {sorted(rankings)} after {(time.perf_counter() - started) * 1000:.1f} ms")
+        return merged
+
+    @staticmethod
+    def _keywords(text: str) -> List[str]:
+        return [word for word in tokenize(text) if word not in _STOPWORDS]
@@ -1,9 +1,18 @@
-from typing import TypedDict, List, Union, Dict, Any, Generator
+from typing import Annotated, TypedDict, List, Union, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import logging
 from langgraph.graph import StateGraph, START
-from langgraph.checkpoint.memory import MemorySaver
-from llm_wrapper import OpenAIAdapter
-from knowledge_base import ChromaDBKnowledgeBase
+from langgraph.config import get_stream_writer
+from langchain_core.runnables import RunnableLambda
+from llm_wrapper import get_llm, get_async_llm
+from knowledge_base import get_knowledge_base, count_tokens
+from checkpoints import create_checkpointer
+from context import assemble_context, context_budget
+from reranker import CrossEncoderReranker
+from retrieval_scheduler import RetrievalScheduler
+from query_expansion import QueryExpander
+from metrics import timed
 import os
 from dotenv import load_dotenv
 
@@ -18,61 +27,187 @@ class Message(TypedDict):
     role: str
     content: str
 
+# Conversation history kept per thread
+HISTORY_MAX_MESSAGES = int(os.environ.get("HISTORY_MAX_MESSAGES", "20"))
+HISTORY_MAX_TOKENS = int(os.environ.get("HISTORY_MAX_TOKENS", "4000"))
+
+def window_messages(history: List[Message], new: List[Message]) -> List[Message]:
+    """
+    Reducer for AgentState.messages: append the new messages, then keep the
+    most recent ones within HISTORY_MAX_MESSAGES and HISTORY_MAX_TOKENS.
+
+    The latest message is always kept, and the window starts at a user turn.
+    """
+    messages = (history or []) + (new or [])
+    messages = messages[-HISTORY_MAX_MESSAGES:] if HISTORY_MAX_MESSAGES > 0 else messages[-1:]
+    tokens = sum(count_tokens(message["content"]) for message in messages)
+    start = 0
+    while start < len(messages) - 1 and (tokens > HISTORY_MAX_TOKENS or messages[start]["role"] != "user"):
+        tokens -= count_tokens(messages[start]["content"])
+        start += 1
+    return messages[start:]
+
 class AgentState(TypedDict):
-    messages: List[Message]
+    messages: Annotated[List[Message], window_messages]
+    # Retrieved passages, best first; cleared once the context is assembled
+    documents: List[str]
     context: Union[str, None]
+    # Tokens used and passages/tokens dropped while assembling the context
+    context_stats: Dict[str, int]
+    # Metadata filter for retrieval, in the vector store's ``where`` syntax
+    filters: Optional[Dict[str, Any]]
     stream: bool
 
+# Retrieval is blocking (Chroma + embedding), so async nodes run it on a
+# bounded pool instead of the event loop
+retrieval_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("RETRIEVAL_THREADS", "8")),
+    thread_name_prefix="retrieval"
+)
+
+# Concurrent retrievals are coalesced into batches (RETRIEVAL_BATCH_WINDOW_MS=0 disables it)
+retrieval_scheduler = RetrievalScheduler.from_env()
+
+# Optional cross-encoder reranking of over-fetched candidates (RERANK_MODEL)
+reranker = CrossEncoderReranker.from_env()
+
+def _retrieval_args(state: AgentState) -> Dict[str, Any]:
+    return {
+        "query": state['messages'][-1]['content'],
+        "where": state.get('filters'),
+        # Over-fetch when a reranker will pick the best few
+        "n_results": reranker.candidates if reranker is not None else None,
+    }
+
+# Optional multi-query retrieval with a deadline (QUERY_EXPANSION)
+query_expander = QueryExpander.from_env()
+
+def _expansion_args(state: AgentState) -> Dict[str, Any]:
+    args = _retrieval_args(state)
+    where, n_results = args["where"], args["n_results"]
+    if retrieval_scheduler is not None:
+        # Variants of one question share a batch with everyone else's queries
+        submit = lambda query: retrieval_scheduler.submit(query, where, n_results)
+    else:
+        kb = get_knowledge_base()
+        submit = lambda query: query_expander.run(kb.get_documents, query, where, n_results)
+    return {
+        "messages": state['messages'],
+        "submit": submit,
+        "n_results": n_results or get_knowledge_base().n_results,
+    }
+
 def retriever_node(state: AgentState) -> Dict[str, Any]:
+    if query_expander is not None:
+        return {"documents": query_expander.retrieve(**_expansion_args(state))}
+    if retrieval_scheduler is not None:
+        return {"documents": retrieval_scheduler.get_documents(**_retrieval_args(state))}
+    return {"documents": get_knowledge_base().get_documents(**_retrieval_args(state))}
+
+def rerank_node(state: AgentState) -> Dict[str, Any]:
+    if reranker is None:
+        return {}
     query = state['messages'][-1]['content']
-    kb = ChromaDBKnowledgeBase()
-    docs = kb.get_documents(query)
-    context = " ".join(docs)
-    return {"context": context}
+    return {"documents": reranker.rerank(query, state.get('documents') or [])}
 
-def generator_node(state: AgentState) -> Dict[str, Any]:
+def context_node(state: AgentState) -> Dict[str, Any]:
+    context = assemble_context(
+        state.get('documents') or [],
+        budget=context_budget(),
+        similarity_threshold=float(os.environ.get("CONTEXT_DEDUP_SIMILARITY", "0.8"))
+    )
+    if context.dropped_passages or context.duplicates:
+        logger.debug("Context: %s", context.stats)
+    # The passages are not needed in the checkpointed state once assembled
+    return {"documents": [], "context": context.text, "context_stats": context.stats}
+
+async def aretriever_node(state: AgentState) -> Dict[str, Any]:
+    if query_expander is not None:
+        return {"documents": await query_expander.aretrieve(**_expansion_args(state))}
+    if retrieval_scheduler is not None:
+        # Waits for the batch without holding a thread
+        documents = await asyncio.wrap_future(retrieval_scheduler.submit(**_retrieval_args(state)))
+        return {"documents": list(documents)}
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(retrieval_executor, retriever_node, state)
+
+async def arerank_node(state: AgentState) -> Dict[str, Any]:
+    if reranker is None:
+        return {}
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(retrieval_executor, rerank_node, state)
+
+def _prompt_messages(state: AgentState) -> List[Message]:
     messages = state['messages'].copy()
     context = state.get('context', '')
-    stream = state.get('stream', False)
     
     # Add context as a system message
     system_message = {"role": "system", "content": f"Use this context to answer the question: {context}"}
-    messages = [system_message] + messages
-    
-    model = os.environ.get("LLM_MODEL", "deepseek-r1-distill-llama-8b")  # Default if not set
+    return [system_message] + messages
 
-    llm = OpenAIAdapter(
-        api_key=os.environ["LLM_API_KEY"],
-        base_url=os.environ["LLM_BASE_URL"],
-        model=model
-    )
+def generator_node(state: AgentState) -> Dict[str, Any]:
+    messages = _prompt_messages(state)
+    stream = state.get('stream', False)
+    llm = get_llm()
     
     if stream:
-        # Return each chunk as a message
-        return {"messages": [{"role": "assistant", "content": chunk} for chunk in llm.generate(messages, stream=True)]}
+        # Push each chunk to the caller as it arrives (stream_mode="custom")
+        # and keep only the complete answer in the checkpointed state
+        writer = get_stream_writer()
+        chunks = []
+        for chunk in llm.generate(messages, stream=True):
+            chunks.append(chunk)
+            writer({"content": chunk})
+        return {"messages": [{"role": "assistant", "content": "".join(chunks)}]}
     
     response = llm.generate(messages)
     return {"messages": [{"role": "assistant", "content": response}]}
 
-# Regular workflow
-workflow = StateGraph(AgentState)
-workflow.add_node("retriever", retriever_node)
-workflow.add_node("generator", generator_node)
+async def agenerator_node(state: AgentState) -> Dict[str, Any]:
+    messages = _prompt_messages(state)
+    stream = state.get('stream', False)
+    llm = get_async_llm()
+    
+    if stream:
+        writer = get_stream_writer()
+        chunks = []
+        async for chunk in await llm.generate(messages, stream=True):
+            chunks.append(chunk)
+            writer({"content": chunk})
+        return {"messages": [{"role": "assistant", "content": "".join(chunks)}]}
+    
+    response = await llm.generate(messages)
+    return {"messages": [{"role": "assistant", "content": response}]}
+
+# Nodes run the sync functions under invoke()/stream() and the async ones
+# under ainvoke()/astream(); each node's duration is recorded as a stage
+retriever = RunnableLambda(timed("retriever")(retriever_node), afunc=timed("retriever")(aretriever_node), name="retriever")
+rerank = RunnableLambda(timed("rerank")(rerank_node), afunc=timed("rerank")(arerank_node), name="rerank")
+context_assembly = RunnableLambda(timed("context")(context_node), name="context")
+generator = RunnableLambda(timed("generator")(generator_node), afunc=timed("generator")(agenerator_node), name="generator")
+
+def _build_workflow() -> StateGraph:
+    # retriever -> rerank (a no-op unless RERANK_MODEL is set) -> context -> generator
+    workflow = StateGraph(AgentState)
+    workflow.add_node("retriever", retriever)
+    workflow.add_node("rerank", rerank)
+    workflow.add_node("context", context_assembly)
+    workflow.add_node("generator", generator)
 
-# Add edge from START to retriever
-workflow.add_edge(START, "retriever")
-# Add edge from retriever to generator
-workflow.add_edge("retriever", "generator")
+    workflow.add_edge(START, "retriever")
+    workflow.add_edge("retriever", "rerank")
+    workflow.add_edge("rerank", "context")
+    workflow.add_edge("context", "generator")
+    return workflow
 
-checkpointer = MemorySaver()
+# Regular workflow
+workflow = _build_workflow()
+
+# Shared by both graphs; CHECKPOINT_BACKEND selects memory, sqlite or redis
+checkpointer = create_checkpointer()
 app = workflow.compile(checkpointer=checkpointer)
 
 # Streaming workflow
-streaming_workflow = StateGraph(AgentState)
-streaming_workflow.add_node("retriever", retriever_node)
-streaming_workflow.add_node("generator", generator_node)
-
-streaming_workflow.add_edge(START, "retriever")
-streaming_workflow.add_edge("retriever", "generator")
+streaming_workflow = _build_workflow()
 
 streaming_app = streaming_workflow.compile(checkpointer=checkpointer) 
\ No newline at end of file
@@ -0,0 +1,165 @@
+from collections import OrderedDict
+from typing import Callable, Dict, Any, List, Optional, Sequence, Tuple
+import hashlib
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+# Scores (query, passage) pairs, higher is more relevant
+Scorer = Callable[[List[Tuple[str, str]]], Sequence[float]]
+
+def load_cross_encoder(model_name: str, batch_size: int = 16) -> Scorer:
+    """
+    Load a sentence-transformers cross-encoder on the CPU.
+
+    Raises:
+        ImportError: If sentence-transformers is not installed
+    """
+    from sentence_transformers import CrossEncoder
+
+    model = CrossEncoder(model_name, device="cpu")
+    return lambda pairs: model.predict(pairs, batch_size=batch_size, show_progress_bar=False)
+
+class CrossEncoderReranker:
+    """
+    Rerank retrieved passages with a cross-encoder.
+
+    Passages are scored against the query in batches of ``batch_size``.
+    Scores are cached per (query, passage), so follow-up and repeated
+    questions only score passages they have not seen. Scoring stops once
+    ``timeout`` seconds have passed and the passages are returned in their
+    retrieval order instead; scores computed so far are still cached.
+    """
+
+    def __init__(self, scorer: Optional[Scorer] = None, model_name: str = DEFAULT_RERANK_MODEL,
+                 candidates: int = 50, top_k: int = 4, batch_size: int = 16,
+                 cache_size: int = 10000, timeout: float = 0.5):
+        self.model_name = model_name
+        self.candidates = candidates
+        self.top_k = top_k
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.timeout = timeout
+        self._scorer = scorer
+        self._load_failed = False
+        self._scores: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.reranked = 0
+        self.fallbacks = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.scoring_time = 0.0
+
+    @classmethod
+    def from_env(cls) -> Optional["CrossEncoderReranker"]:
+        """A reranker for RERANK_MODEL, or None when reranking is disabled (the default)."""
+        model_name = os.environ.get("RERANK_MODEL")
+        if not model_name or model_name.lower() == "none":
+            return None
+        return cls(
+            model_name=model_name,
+            candidates=int(os.environ.get("RERANK_CANDIDATES", "50")),
+            top_k=int(os.environ.get("RERANK_TOP_K", "4")),
+            batch_size=int(os.environ.get("RERANK_BATCH_SIZE", "16")),
+            cache_size=int(os.environ.get("RERANK_CACHE_SIZE", "10000")),
+            timeout=float(os.environ.get("RERANK_TIMEOUT", "0.5"))
+        )
+
+    def rerank(self, query: str, passages: List[str], top_k: Optional[int] = None) -> List[str]:
+        """
+        Order passages by cross-encoder relevance.
+
+        Args:
+            query: The user query
+            passages: Retrieved passages, best first
+            top_k: Passages to keep (defaults to ``self.top_k``)
+
+        Returns:
+            The ``top_k`` most relevant passages, or the first ``top_k`` in
+            retrieval order if the model is unavailable or too slow
+        """
+        top_k = top_k or self.top_k
+        if len(passages) <= 1:
+            return passages[:top_k]
+        scorer = self._get_scorer()
+        if scorer is None:
+            self.fallbacks += 1
+            return passages[:top_k]
+
+        started = time.perf_counter()
+        keys = [self._key(query, passage) for passage in passages]
+        with self._lock:
+            scores = {key: self._scores[key] for key in keys if key in self._scores}
+            for key in scores:
+                self._scores.move_to_end(key)
+        self.cache_hits += len(scores)
+        missing = [i for i, key in enumerate(keys) if key not in scores]
+        self.cache_misses += len(missing)
+
+        timed_out = False
+        for start in range(0, len(missing), self.batch_size):
+            if time.perf_counter() - started > self.timeout:
+                timed_out = True
+                break
+            batch = missing[start:start + self.batch_size]
+            try:
+                batch_scores = scorer([(query, passages[i]) for i in batch])
+            except Exception as e:
+                logger.error(f"Reranking failed: {str(e)}")
+                timed_out = True
+                break
+            new_scores = {keys[i]: float(score) for i, score in zip(batch, batch_scores)}
+            scores.update(new_scores)
+            self._remember(new_scores)
+        self.scoring_time += time.perf_counter() - started
+
+        if timed_out:
+            self.fallbacks += 1
+            logger.warning(f"Reranking stopped after {time.perf_counter() - started:.3f}s, using retrieval order")
+            return passages[:top_k]
+        self.reranked += 1
+        # Stable sort keeps retrieval order among equal scores
+        order = sorted(range(len(passages)), key=lambda i: scores[keys[i]], reverse=True)
+        return [passages[i] for i in order[:top_k]]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "model": self.model_name,
+            "available": not self._load_failed,
+            "reranked": self.reranked,
+            "fallbacks": self.fallbacks,
+            "cache_entries": len(self._scores),
+            "cache_hit_rate": round(self.cache_hits / lookups, 4) if lookups else 0.0,
+            "avg_scoring_ms": round(1000 * self.scoring_time / max(1, self.reranked + self.fallbacks), 2),
+        }
+
+    def _get_scorer(self) -> Optional[Scorer]:
+        if self._scorer is not None or self._load_failed:
+            return self._scorer
+        with self._load_lock:
+            if self._scorer is None and not self._load_failed:
+                try:
+                    self._scorer = load_cross_encoder(self.model_name, self.batch_size)
+                    logger.info(f"Loaded reranker {self.model_name}")
+                except Exception as e:
+                    # Keep answering in retrieval order rather than failing queries
+                    logger.error(f"Could not load reranker {self.model_name}: {str(e)}")
+                    self._load_failed = True
+        return self._scorer
+
+    def _remember(self, scores: Dict[str, float]):
+        with self._lock:
+            self._scores.update(scores)
+            while len(self._scores) > self.cache_size:
+                self._scores.popitem(last=False)
+
+    @staticmethod
+    def _key(query: str, passage: str) -> str:
+        return hashlib.sha1(f"{query}\0{passage}".encode("utf-8")).hexdigest()
@@ -0,0 +1,177 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Any, List, Optional
+import logging
+import os
+import re
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class CacheEntry:
+    response: str
+    created_at: float
+    latency: float
+    vector: Optional[np.ndarray] = None
+
+class ResponseCache:
+    """
+    Cache of generated answers in front of the RAG graph.
+
+    Lookups first try an exact match on the normalized query and, when a
+    similarity threshold and an embedding function are configured, fall back
+    to the most similar cached query by cosine similarity. Entries expire
+    after ``ttl`` seconds and the least recently used entry is evicted once
+    ``capacity`` is reached. Call invalidate() whenever the knowledge base
+    changes.
+    """
+
+    def __init__(self, capacity: int = 1024, ttl: float = 3600,
+                 similarity_threshold: Optional[float] = None,
+                 embed: Optional[Callable[[List[str]], Any]] = None):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.embed = embed
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.latency_saved = 0.0
+        # Bumped on every invalidation so answers generated against an older
+        # knowledge base are not cached after the fact
+        self.generation = 0
+
+    @classmethod
+    def from_env(cls, embed: Optional[Callable[[List[str]], Any]] = None) -> "ResponseCache":
+        threshold = os.environ.get("RESPONSE_CACHE_SIMILARITY")
+        return cls(
+            capacity=int(os.environ.get("RESPONSE_CACHE_SIZE", "1024")),
+            ttl=float(os.environ.get("RESPONSE_CACHE_TTL", "3600")),
+            similarity_threshold=float(threshold) if threshold else None,
+            embed=embed
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Lowercase, collapse whitespace and drop surrounding punctuation."""
+        return re.sub(r"\s+", " ", query.lower()).strip(" \t\n?!.,;:")
+
+    def get(self, query: str) -> Optional[str]:
+        """Return a cached answer for the query, or None."""
+        if not self.enabled:
+            return None
+        key = self.normalize(query)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.created_at >= self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                self.latency_saved += entry.latency
+                return entry.response
+            semantic = self._semantic_candidates()
+
+        if semantic:
+            vector = self._embed(key)
+            if vector is not None:
+                keys, matrix = semantic
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    with self._lock:
+                        entry = self._entries.get(keys[best])
+                        if entry is not None and now - entry.created_at < self.ttl:
+                            self._entries.move_to_end(keys[best])
+                            self.semantic_hits += 1
+                            self.latency_saved += entry.latency
+                            return entry.response
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, query: str, response: str, latency: float, generation: Optional[int] = None):
+        """
+        Cache an answer.
+
+        Args:
+            query: The user query
+            response: The generated answer
+            latency: Seconds it took to generate, reported as saved on hits
+            generation: The cache generation read before generating; the
+                answer is dropped if the cache was invalidated since
+        """
+        if not self.enabled or not response:
+            return
+        key = self.normalize(query)
+        vector = self._embed(key) if self._semantic_enabled() else None
+        now = time.time()
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._expire(now)
+            self._entries[key] = CacheEntry(response, now, latency, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """Drop every cached answer, e.g. after the knowledge base changed."""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+            self.generation += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "size": len(self._entries),
+                "capacity": self.capacity,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "latency_saved_seconds": round(self.latency_saved, 3),
+            }
+
+    def _semantic_enabled(self) -> bool:
+        return self.similarity_threshold is not None and self.embed is not None
+
+    def _semantic_candidates(self):
+        if not self._semantic_enabled():
+            return None
+        items = [(key, entry.vector) for key, entry in self._entries.items() if entry.vector is not None]
+        if not items:
+            return None
+        keys = [key for key, _ in items]
+        return keys, np.vstack([vector for _, vector in items])
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        try:
+            vector = np.asarray(self.embed([text])[0], dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"Response cache could not embed query: {str(e)}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _expire(self, now: float):
+        expired = [key for key, entry in self._entries.items() if now - entry.created_at >= self.ttl]
+        for key in expired:
+            del self._entries[key]
@@ -0,0 +1,166 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import json
+import logging
+import os
+import threading
+import time
+from knowledge_base import ChromaDBKnowledgeBase, get_knowledge_base
+from metrics import observe, span
+
+logger = logging.getLogger(__name__)
+
+# Queries batched together must share the filter and result count
+BatchKey = Tuple[str, Optional[int]]
+
+class RetrievalScheduler:
+    """
+    Coalesce concurrent retrieval queries into batches.
+
+    Queries arriving within ``window`` seconds of the first one in a batch
+    (or until ``max_batch`` are waiting) are embedded and searched together
+    with ChromaDBKnowledgeBase.get_documents_batch(), and the results fanned
+    back out to each caller. Identical queries in flight at the same time
+    share one search (single-flight), but each caller gets its own future,
+    so a caller that gives up (e.g. a cancelled asyncio task) does not
+    cancel the others. Each query waits at most ``window``
+    seconds longer than it would alone; batches run on ``workers`` threads,
+    so a slow batch does not hold up the next one.
+    """
+
+    def __init__(self, window: float = 0.005, max_batch: int = 32, workers: int = 2,
+                 kb_getter: Callable[[], ChromaDBKnowledgeBase] = get_knowledge_base):
+        self.window = window
+        self.max_batch = max_batch
+        self.workers = workers
+        self.kb_getter = kb_getter
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._condition = threading.Condition()
+        # Waiting queries per batch key, in arrival order, with their enqueue time
+        self._waiting: Dict[BatchKey, Dict[str, float]] = {}
+        # Callers' futures per in-flight query
+        self._in_flight: Dict[Tuple[str, BatchKey], List[Future]] = {}
+        self._dispatcher: Optional[threading.Thread] = None
+        self._closed = False
+        self.queries = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.batched_queries = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["RetrievalScheduler"]:
+        """A scheduler per RETRIEVAL_BATCH_WINDOW_MS (5 by default), or None when it is 0."""
+        window_ms = float(os.environ.get("RETRIEVAL_BATCH_WINDOW_MS", "5"))
+        if window_ms <= 0:
+            return None
+        return cls(
+            window=window_ms / 1000,
+            max_batch=int(os.environ.get("RETRIEVAL_BATCH_SIZE", "32")),
+            workers=int(os.environ.get("RETRIEVAL_BATCH_WORKERS", "2"))
+        )
+
+    def submit(self, query: str, where: Optional[Dict[str, Any]] = None,
+               n_results: Optional[int] = None) -> Future:
+        """
+        Queue a query for the next batch.
+
+        Returns:
+            A future of this caller's own resolving to the chunk texts, as
+            get_documents() returns them; callers of identical in-flight
+            queries share the same list
+        """
+        key = (json.dumps(where, sort_keys=True) if where else "", n_results)
+        future: Future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Retrieval scheduler is closing")
+            self.queries += 1
+            callers = self._in_flight.get((query, key))
+            if callers is not None:
+                self.coalesced += 1
+                callers.append(future)
+                return future
+            self._in_flight[(query, key)] = [future]
+            self._waiting.setdefault(key, {})[query] = time.perf_counter()
+            if self._dispatcher is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="retrieval-batch")
+                self._dispatcher = threading.Thread(target=self._dispatch, name="retrieval-dispatcher", daemon=True)
+                self._dispatcher.start()
+            self._condition.notify()
+        return future
+
+    def get_documents(self, query: str, where: Optional[Dict[str, Any]] = None,
+                      n_results: Optional[int] = None) -> List[str]:
+        """Blocking form of submit()."""
+        return list(self.submit(query, where, n_results).result())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "queries": self.queries,
+            "coalesced": self.coalesced,
+            "batches": self.batches,
+            "avg_batch_size": round(self.batched_queries / self.batches, 2) if self.batches else 0.0,
+        }
+
+    def close(self):
+        """Run what is queued, then stop the threads; the next submit() starts them again."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+            dispatcher, executor = self._dispatcher, self._executor
+        if dispatcher is not None:
+            dispatcher.join()
+            executor.shutdown(wait=True)
+        with self._condition:
+            self._dispatcher = self._executor = None
+            self._closed = False
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                while not self._waiting and not self._closed:
+                    self._condition.wait()
+                if not self._waiting:
+                    return
+                # Hold the oldest batch open until its window passes or it fills up
+                key = min(self._waiting, key=lambda k: next(iter(self._waiting[k].values())))
+                deadline = next(iter(self._waiting[key].values())) + self.window
+                while not self._closed and len(self._waiting[key]) < self.max_batch:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                waiting = self._waiting[key]
+                queries = list(waiting)[:self.max_batch]
+                enqueued = [waiting.pop(query) for query in queries]
+                if not waiting:
+                    del self._waiting[key]
+            dispatched = time.perf_counter()
+            for started in enqueued:
+                observe("retrieval_queue_wait", dispatched - started)
+            self._executor.submit(self._run_batch, key, queries)
+
+    def _run_batch(self, key: BatchKey, queries: List[str]):
+        where = json.loads(key[0]) if key[0] else None
+        try:
+            with span("retrieval_batch"):
+                results = self.kb_getter().get_documents_batch(queries, where=where, n_results=key[1])
+            outcomes = [(result, None) for result in results]
+        except Exception as e:
+            logger.error(f"Batched retrieval of {len(queries)} queries failed: {str(e)}")
+            outcomes = [(None, e)] * len(queries)
+        with self._condition:
+            self.batches += 1
+            self.batched_queries += len(queries)
+            callers = [self._in_flight.pop((query, key)) for query in queries]
+        for futures, (result, error) in zip(callers, outcomes):
+            for future in futures:
+                # Skips callers that cancelled, and keeps them from cancelling now
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
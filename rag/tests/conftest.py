@@ -0,0 +1,38 @@
+import hashlib
+import numpy as np
+import pytest
+from chromadb.api.types import EmbeddingFunction
+
+
+class HashingEmbeddingFunction(EmbeddingFunction):
+    """Deterministic bag-of-words embedding so tests never download a model."""
+
+    def __init__(self, dim: int = 64):
+        self.dim = dim
+
+    def __call__(self, input):
+        vectors = []
+        for text in input:
+            vector = np.zeros(self.dim, dtype=np.float32)
+            for word in text.lower().split():
+                digest = hashlib.md5(word.encode("utf-8")).digest()
+                vector[int.from_bytes(digest[:4], "little") % self.dim] += 1.0
+            vector[0] += 1e-3  # never return an all-zero vector
+            vectors.append(vector)
+        return vectors
+
+    @staticmethod
+    def name() -> str:
+        return "test-hashing"
+
+    def get_config(self):
+        return {"dim": self.dim}
+
+    @staticmethod
+    def build_from_config(config):
+        return HashingEmbeddingFunction(config.get("dim", 64))
+
+
+@pytest.fixture
+def embedding_function():
+    return HashingEmbeddingFunction()
@@ -0,0 +1,222 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+from fastapi.testclient import TestClient
+import api
+import knowledge_base
+import rag_agent
+from response_cache import ResponseCache
+
+
+class FakeLLM:
+    chunks = ["Use ", "Lightning ", "Arrow"]
+
+    async def generate(self, messages, stream=False):
+        if stream:
+            return self._stream()
+        return "".join(self.chunks)
+
+    async def _stream(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+@pytest.fixture
+def client(tmp_path, embedding_function, monkeypatch):
+    monkeypatch.setenv("LLM_API_KEY", "test")
+    monkeypatch.setenv("LLM_BASE_URL", "http://llm.invalid/v1")
+    monkeypatch.setattr(rag_agent, "get_async_llm", FakeLLM)
+    monkeypatch.setattr(api, "response_cache", ResponseCache())
+    knowledge_base.open_knowledge_base(path=str(tmp_path), embedding_function=embedding_function)
+    with TestClient(api.app) as test_client:
+        yield test_client
+
+
+def sse_events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], fields["data"]))
+    return events
+
+
+def test_query_stream_emits_each_chunk(client):
+    response = client.post("/query-stream", json={"message": "best ranger build", "thread_id": "t1"})
+    events = sse_events(response.text)
+
+    assert [json.loads(data)["content"] for event, data in events if event == "message"] == FakeLLM.chunks
+    assert events[-1] == ("done", "[DONE]")
+
+    # The checkpoint keeps one complete answer rather than one message per chunk
+    state = rag_agent.streaming_app.get_state({"configurable": {"thread_id": "t1"}})
+    assert state.values["messages"] == [
+        {"role": "user", "content": "best ranger build"},
+        {"role": "assistant", "content": "Use Lightning Arrow"},
+    ]
+
+
+def test_threads_keep_history_and_skip_the_cache(client):
+    client.post("/query", json={"message": "best ranger build"})
+    client.post("/query", json={"message": "tell me about bows", "thread_id": "t2"})
+    follow_up = client.post("/query", json={"message": "best ranger build", "thread_id": "t2"}).json()
+    assert "cached" not in follow_up
+
+    state = rag_agent.app.get_state({"configurable": {"thread_id": "t2"}})
+    assert [message["role"] for message in state.values["messages"]] == ["user", "assistant"] * 2
+    # Queries without a thread_id leave no checkpoint behind
+    assert all(not thread.startswith("oneshot-") for thread in rag_agent.checkpointer.storage)
+
+
+def test_query_answers_from_cache_on_repeat(client):
+    first = client.post("/query", json={"message": "best ranger build"}).json()
+    second = client.post("/query", json={"message": "Best ranger build?"}).json()
+
+    assert first == {"response": "Use Lightning Arrow"}
+    assert second == {"response": "Use Lightning Arrow", "cached": True}
+
+
+def test_cache_writes_run_off_the_event_loop(client, monkeypatch):
+    on_loop = []
+
+    def put(*args):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+
+    monkeypatch.setattr(api.response_cache, "put", put)
+    client.post("/query", json={"message": "best ranger build"})
+    client.post("/query-stream", json={"message": "best witch build"})
+    assert on_loop == [False, False]
+
+
+def test_cached_answer_starts_the_thread_history(client):
+    client.post("/query", json={"message": "best ranger build"})
+    cached = client.post("/query", json={"message": "best ranger build", "thread_id": "t3"}).json()
+    streamed = client.post("/query-stream", json={"message": "best ranger build", "thread_id": "t4"})
+    follow_up = client.post("/query", json={"message": "what about for witch?", "thread_id": "t3"}).json()
+
+    assert cached["cached"] is True
+    assert json.loads(sse_events(streamed.text)[0][1])["cached"] is True
+    assert "cached" not in follow_up
+    state = rag_agent.app.get_state({"configurable": {"thread_id": "t3"}})
+    assert [message["content"] for message in state.values["messages"]] == [
+        "best ranger build", "Use Lightning Arrow", "what about for witch?", "Use Lightning Arrow"
+    ]
+    state = rag_agent.streaming_app.get_state({"configurable": {"thread_id": "t4"}})
+    assert [message["role"] for message in state.values["messages"]] == ["user", "assistant"]
+
+
+def test_update_batch_ingests_ndjson_and_replaces_by_url(client, monkeypatch):
+    monkeypatch.setattr(api, "UPDATE_BATCH_SIZE", 2)
+    lines = [
+        {"url": "https://poe2db.tw/us/Bows", "content": "# Bows\nBows are ranged weapons."},
+        {"url": "https://poe2db.tw/us/Quivers", "content": "# Quivers\nQuivers hold arrows."},
+        "not json",
+        {"content": "# Notes\nUnsourced note."},
+    ]
+    body = "\n".join(line if isinstance(line, str) else json.dumps(line) for line in lines)
+    result = client.post("/update-batch", content=body.encode()).json()
+
+    assert result["documents"] == 3
+    assert [error["line"] for error in result["errors"]] == [3]
+    assert set(result["chunk_ids"]) == {"https://poe2db.tw/us/Bows", "https://poe2db.tw/us/Quivers"}
+
+    kb = knowledge_base.get_knowledge_base()
+    updated = json.dumps({"url": "https://poe2db.tw/us/Bows", "content": "# Bows\nBows now fire two arrows."})
+    result = client.post("/update-batch", content=updated.encode()).json()
+    stored = kb.collection.get(where={"source": "https://poe2db.tw/us/Bows"})
+    assert stored["ids"] == result["chunk_ids"]["https://poe2db.tw/us/Bows"]
+    assert all("two arrows" in document for document in stored["documents"])
+    assert kb.collection.count() == 3
+
+
+def test_update_indexes_uploads_in_a_background_job(client):
+    documents = [{"url": f"https://poe2db.tw/us/Page_{i}", "content": f"# Page {i}\nBody of page {i}."} for i in range(5)]
+    response = client.post("/update", files={"file": ("pages.json", json.dumps(documents), "application/json")})
+    assert response.status_code == 202
+
+    job_id = response.json()["job_id"]
+    for _ in range(100):
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] in ("succeeded", "failed"):
+            break
+        time.sleep(0.05)
+    assert job["status"] == "succeeded"
+    assert job["result"]["documents"] == 5
+    assert job["progress"]["chunks"] == 5
+    assert client.get("/jobs/unknown").status_code == 404
+
+
+def test_upload_temp_files_are_removed_on_failure_and_cancellation(client, tmp_path, monkeypatch):
+    upload_dir = tmp_path / "uploads"
+    upload_dir.mkdir()
+    monkeypatch.setattr(api, "UPLOAD_DIR", str(upload_dir))
+    files = {"file": ("page.txt", "# Page\nBody.", "text/plain")}
+
+    async def broken_write(*args):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(api, "run_in_threadpool", broken_write)
+        assert client.post("/update", files=files).status_code == 500
+    assert list(upload_dir.iterdir()) == []
+
+    # Queued behind a running job, then cancelled at shutdown
+    release = threading.Event()
+    api.jobs.submit("block", lambda job: release.wait(5))
+    job_id = client.post("/update", files=files).json()["job_id"]
+    assert len(list(upload_dir.iterdir())) == 1
+    threading.Timer(0.1, release.set).start()
+    api.jobs.shutdown()
+    assert api.jobs.get(job_id).error == "Cancelled at shutdown"
+    assert list(upload_dir.iterdir()) == []
+
+
+def test_update_wait_returns_result_or_error(client):
+    page = {"url": "https://poe2db.tw/us/Bows", "content": "# Bows\nBows are ranged weapons.", "timestamp": "t"}
+    result = client.post("/update?wait=true", files={"file": ("bows.json", json.dumps(page), "application/json")}).json()
+    assert len(result["chunk_ids"]["https://poe2db.tw/us/Bows"]) == 1
+
+    response = client.post("/update?wait=true", files={"file": ("bad.json", "[1, 2", "application/json")})
+    assert response.status_code == 400
+
+
+def test_filtered_query_bypasses_cache_and_delete_removes_source(client):
+    page = {"url": "https://poe2db.tw/us/Bows", "content": "# Bows\n## Unique\n- Widowhail", "timestamp": "2025-01-01T00:00:00"}
+    client.post("/update-batch", content=json.dumps(page).encode())
+    stored = knowledge_base.get_knowledge_base().collection.get(include=["metadatas"])["metadatas"][0]
+    assert stored["crawled_at"] > 0
+
+    client.post("/query", json={"message": "best bow"})
+    filtered = client.post("/query", json={"message": "best bow", "section": "Unique", "max_age_days": 30}).json()
+    assert "cached" not in filtered
+
+    assert client.delete("/documents", params={"source": "https://poe2db.tw/us/Bows"}).json()["deleted"] == 1
+    assert knowledge_base.get_knowledge_base().collection.count() == 0
+
+
+def test_read_only_worker_redirects_writes_to_the_indexer(client, monkeypatch):
+    monkeypatch.setattr(knowledge_base.get_knowledge_base(), "read_only", True)
+    monkeypatch.setattr(api, "INDEXER_URL", "http://indexer:8001")
+    response = client.post("/update-batch?x=1", content=b"", follow_redirects=False)
+    assert response.status_code == 307
+    assert response.headers["location"] == "http://indexer:8001/update-batch?x=1"
+    # Jobs only exist on the indexer that runs them
+    response = client.get("/jobs/abc", follow_redirects=False)
+    assert response.headers["location"] == "http://indexer:8001/jobs/abc"
+
+    monkeypatch.setattr(api, "INDEXER_URL", None)
+    assert client.delete("/documents", params={"source": "s"}).status_code == 403
+
+
+def test_metrics_endpoint_exposes_stage_histograms(client):
+    pytest.importorskip("prometheus_client")
+    client.post("/query", json={"message": "best ranger build"})
+    body = client.get("/metrics").text
+    for stage in ("retriever", "context", "generator", "kb_query", "embed_query"):
+        assert f'rag_stage_seconds_count{{stage="{stage}"}}' in body
+    assert 'rag_request_seconds_count{method="POST",path="/query",status="200"}' in body
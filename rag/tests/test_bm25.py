@@ -0,0 +1,35 @@
+import sqlite3
+import pytest
+from bm25 import BM25Index
+from knowledge_base import reciprocal_rank_fusion
+
+
+def test_bm25_ranks_exact_names_and_tracks_deletes(tmp_path):
+    path = str(tmp_path / "bm25.sqlite")
+    index = BM25Index(path)
+    index.add(
+        ["a", "b", "c"],
+        ["Widowhail is a unique Crude Bow", "Crude Bow base item", "Quill Rain is a unique Shortbow"]
+    )
+    index.add(["a"], ["Widowhail is a unique Crude Bow"])
+
+    assert len(index) == 3
+    assert [chunk_id for chunk_id, _ in index.search("widowhail bow")][0] == "a"
+    assert [chunk_id for chunk_id, _ in index.search("Quill Rain")] == ["c"]
+
+    index.delete(["a"])
+    index.close()
+
+    reopened = BM25Index(path, read_only=True)
+    assert len(reopened) == 2
+    assert reopened.search("Widowhail") == []
+    with pytest.raises(sqlite3.OperationalError):
+        reopened.add(["d"], ["Widowhail"])
+    reopened.close()
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d", "b"]], k=60)
+
+    assert fused[:2] == ["c", "b"]
+    assert set(fused) == {"a", "b", "c", "d"}
@@ -0,0 +1,66 @@
+import asyncio
+import pytest
+from langgraph.graph import StateGraph, START
+import api
+import checkpoints
+import rag_agent
+from checkpoints import create_checkpointer, prune_checkpoints
+
+
+def test_window_messages_keeps_recent_turns(monkeypatch):
+    monkeypatch.setattr(rag_agent, "HISTORY_MAX_MESSAGES", 4)
+    history = []
+    for i in range(4):
+        history = rag_agent.window_messages(history, [{"role": "user", "content": f"q{i}"}])
+        history = rag_agent.window_messages(history, [{"role": "assistant", "content": f"a{i}"}])
+    assert [message["content"] for message in history] == ["q2", "a2", "q3", "a3"]
+
+    monkeypatch.setattr(rag_agent, "HISTORY_MAX_TOKENS", 2)
+    history = rag_agent.window_messages(history, [{"role": "user", "content": "q4"}])
+    assert [message["content"] for message in history] == ["q4"]
+
+
+def counter_graph(saver):
+    graph = StateGraph(dict)
+    graph.add_node("step", lambda state: {"count": state.get("count", 0) + 1})
+    graph.add_edge(START, "step")
+    return graph.compile(checkpointer=saver)
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_prune_keeps_latest_checkpoint_and_evicts_idle_threads(backend, tmp_path, monkeypatch):
+    if backend == "sqlite":
+        pytest.importorskip("langgraph.checkpoint.sqlite")
+    monkeypatch.setenv("CHECKPOINT_PATH", str(tmp_path / "checkpoints.sqlite"))
+    saver = create_checkpointer(backend)
+    graph = counter_graph(saver)
+    config = {"configurable": {"thread_id": "t"}}
+    for _ in range(3):
+        graph.invoke({"count": graph.get_state(config).values.get("count", 0)}, config)
+
+    pruned = prune_checkpoints(saver, ttl=3600)
+    assert pruned["threads"] == 0 and pruned["checkpoints"] > 0
+    assert graph.get_state(config).values["count"] == 3
+    assert len(list(saver.list(config))) == 1
+
+    monkeypatch.setattr(checkpoints.time, "time", lambda: 4e9)
+    assert prune_checkpoints(saver, ttl=3600)["threads"] == 1
+    assert saver.get_tuple(config) is None
+
+
+def test_cached_turns_persist_and_stay_windowed(tmp_path, monkeypatch):
+    pytest.importorskip("langgraph.checkpoint.sqlite")
+    monkeypatch.setenv("CHECKPOINT_PATH", str(tmp_path / "checkpoints.sqlite"))
+    monkeypatch.setattr(rag_agent, "HISTORY_MAX_MESSAGES", 2)
+    config = {"configurable": {"thread_id": "t"}}
+    monkeypatch.setattr(api, "rag_agent", rag_agent._build_workflow().compile(checkpointer=create_checkpointer("sqlite")))
+    for message in ["best ranger build", "what about for witch?"]:
+        asyncio.run(api._record_cached_turn(api.Query(message=message, thread_id="t"), config, f"answer: {message}"))
+
+    # A new process sees the turns, bounded like any other history
+    reopened = rag_agent._build_workflow().compile(checkpointer=create_checkpointer("sqlite"))
+    assert reopened.get_state(config).values["messages"] == [
+        {"role": "user", "content": "what about for witch?"},
+        {"role": "assistant", "content": "answer: what about for witch?"},
+    ]
+    assert prune_checkpoints(reopened.checkpointer, ttl=3600)["threads"] == 0
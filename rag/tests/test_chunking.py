@@ -0,0 +1,41 @@
+from knowledge_base import MarkdownChunker, count_tokens
+
+PAGE = """# Bows
+Source: https://poe2db.tw/us/Bows
+Crawled at: 2025-01-01T00:00:00
+
+## Crude Bow
+- Physical Damage
+- 7-13
+- Critical Hit Chance
+- 5.00%
+
+## Recurve Bow
+""" + "\n".join(f"- Modifier line {i} adds fire damage to attacks" for i in range(40))
+
+
+def test_chunks_respect_headings_and_token_limit():
+    chunker = MarkdownChunker(max_tokens=64, overlap_tokens=16)
+    chunks = list(chunker.split(PAGE))
+
+    assert all(count_tokens(chunk) <= 64 for chunk in chunks)
+    crude = [chunk for chunk in chunks if "## Crude Bow" in chunk]
+    assert len(crude) == 1 and "Recurve" not in crude[0]
+    recurve = [chunk for chunk in chunks if "## Recurve Bow" in chunk]
+    assert len(recurve) > 1
+    assert all(chunk.startswith("# Bows\n## Recurve Bow") for chunk in recurve)
+    # The page header is not a chunk of its own
+    assert chunks[0].startswith("# Bows\n## Crude Bow")
+    assert not any("Crawled at" in chunk or "Source:" in chunk for chunk in chunks)
+
+
+def test_overlap_carries_trailing_rows():
+    chunker = MarkdownChunker(max_tokens=64, overlap_tokens=16)
+    recurve = [chunk for chunk in chunker.split(PAGE) if "## Recurve Bow" in chunk]
+    last_row = recurve[0].splitlines()[-1]
+    assert last_row in recurve[1].splitlines()
+
+
+def test_split_accepts_line_iterables():
+    chunker = MarkdownChunker(max_tokens=64, overlap_tokens=16)
+    assert list(chunker.split(iter(PAGE.splitlines(keepends=True)))) == list(chunker.split(PAGE))
@@ -0,0 +1,29 @@
+import context as context_module
+from context import assemble_context, context_budget, context_window
+
+
+def test_assemble_context_dedupes_and_respects_budget():
+    passages = [
+        "# Bows\nBows are two-handed ranged weapons that use quivers.",
+        "# Bows\nBows are two-handed ranged weapons that use quivers!",
+        "# Quivers\n" + "Quivers grant bonuses to bow attacks. " * 40,
+        "# Widowhail\nUnique bow.",
+    ]
+    context = assemble_context(passages, budget=40)
+
+    assert context.text.split("\n\n---\n\n") == [passages[0], passages[3]]
+    assert context.duplicates == 1
+    assert context.dropped_passages == 1
+    assert context.dropped_tokens > 200
+    assert context.tokens <= 40
+
+
+def test_context_budget_follows_model(monkeypatch):
+    monkeypatch.delenv("CONTEXT_MAX_TOKENS", raising=False)
+    assert context_window("meta-llama/Llama-3-8B-Instruct") == 8192
+    monkeypatch.setitem(context_module.MODEL_CONTEXT_WINDOWS, "tiny", 1024)
+    assert context_budget("tiny-chat") == 512
+    assert context_budget("gpt-4o-mini") == 2048
+
+    monkeypatch.setenv("CONTEXT_MAX_TOKENS", "512")
+    assert context_budget("gpt-4o-mini") == 512
@@ -0,0 +1,104 @@
+import pytest
+import numpy as np
+from chromadb.api.types import EmbeddingFunction
+from embedding_cache import EmbeddingCache, CachedEmbeddingFunction
+from knowledge_base import ChromaDBKnowledgeBase
+
+
+class CountingEmbeddingFunction(EmbeddingFunction):
+    def __init__(self, inner):
+        self.inner = inner
+        self.texts = 0
+
+    def __call__(self, input):
+        self.texts += len(input)
+        return self.inner(input)
+
+    @staticmethod
+    def name():
+        return "test-counting"
+
+    def get_config(self):
+        return {}
+
+    @staticmethod
+    def build_from_config(config):
+        raise NotImplementedError
+
+
+def test_cache_persists_and_evicts_least_recently_used(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), capacity=2)
+    cache.put_many({"a": np.ones(4), "b": np.zeros(4)})
+    cache.get_many(["a"])
+    cache.put_many({"c": np.full(4, 2.0)})
+
+    assert set(cache.get_many(["a", "b", "c"])) == {"a", "c"}
+    assert cache.stats()["evictions"] == 1
+    cache.close()
+
+    reopened = EmbeddingCache(str(tmp_path), capacity=2)
+    np.testing.assert_array_equal(reopened.get_many(["c"])["c"], np.full(4, 2.0, dtype=np.float32))
+    reopened.close()
+
+
+def test_repeat_texts_skip_the_model(tmp_path, embedding_function):
+    model = CountingEmbeddingFunction(embedding_function)
+    cached = CachedEmbeddingFunction(model, EmbeddingCache(str(tmp_path), capacity=100))
+
+    first = cached(["best ranger build", "witch minions"])
+    second = cached(["best ranger build", "witch minions"])
+
+    assert model.texts == 2
+    np.testing.assert_array_equal(first[0], second[0])
+    assert cached.cache.stats()["hits"] == 2
+
+
+def test_knowledge_base_caches_ingest_and_queries(tmp_path, embedding_function):
+    model = CountingEmbeddingFunction(embedding_function)
+    kb = ChromaDBKnowledgeBase(path=str(tmp_path), embedding_function=model)
+    kb.add_documents(["Ranger uses bows"])
+    kb.add_documents(["Ranger uses bows"])
+    kb.get_documents("ranger")
+    kb.get_documents("ranger")
+
+    assert model.texts == 2
+    assert kb.health()["embedding_cache"]["hits"] == 2
+    kb.close()
+
+
+def test_interrupted_write_never_maps_a_key_to_another_vector(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), capacity=1)
+    cache.put_many({"a": np.ones(4)})
+    # Stand-in for a crash after the vector is written but before its key is
+    cache._db.execute(
+        "CREATE TRIGGER interrupt BEFORE INSERT ON entries WHEN NEW.key = 'b' "
+        "BEGIN SELECT RAISE(ABORT, 'interrupted'); END"
+    )
+
+    with pytest.raises(Exception, match="interrupted"):
+        cache.put_many({"b": np.full(4, 3.0)})
+    cache._db.rollback()
+    cache._db.execute("DROP TRIGGER interrupt")
+    cache.close()
+
+    reopened = EmbeddingCache(str(tmp_path), capacity=1)
+    assert reopened.get_many(["a", "b"]) == {}
+    # The evicted slot is reused
+    reopened.put_many({"c": np.full(4, 2.0)})
+    np.testing.assert_array_equal(reopened.get_many(["c"])["c"], np.full(4, 2.0, dtype=np.float32))
+    assert reopened.stats()["size"] == 1
+    reopened.close()
+
+
+def test_model_with_another_dimension_replaces_the_cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), capacity=10)
+    cache.put_many({"small": np.ones(4)})
+    cache.close()
+
+    reopened = EmbeddingCache(str(tmp_path), capacity=10)
+    reopened.put_many({"large": np.full(8, 2.0)})
+
+    assert reopened.get_many(["small", "large"]).keys() == {"large"}
+    np.testing.assert_array_equal(reopened.get_many(["large"])["large"], np.full(8, 2.0, dtype=np.float32))
+    assert reopened.stats()["size"] == 1 and reopened.dim == 8
+    reopened.close()
@@ -0,0 +1,57 @@
+import io
+import json
+from datetime import datetime
+import pytest
+import knowledge_base
+from ingest import iter_documents, iter_json_values
+
+
+@pytest.mark.parametrize("text", [
+    '[1, 2.5, "x", {"a": [1, 2]}, [], 1e10, -3, true, null]',
+    '{"content": "a"}\n{"content": "b"}\n\n',
+    '  {"content": "single"}  ',
+    '[]',
+])
+def test_iter_json_values_across_buffer_boundaries(text):
+    expected = json.loads(text) if text.startswith("[") else [json.loads(line) for line in text.splitlines() if line.strip()]
+    for buffer_size in (1, 2, 7, 1 << 16):
+        assert list(iter_json_values(io.StringIO(text), buffer_size)) == expected
+
+
+def test_iter_json_values_rejects_truncated_input():
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_values(io.StringIO('[{"content": "a"}, {"content": '), 4))
+
+
+def test_iter_json_values_reports_malformed_values_without_reading_on():
+    lines = ['{"content": "a"}', '{"content": "b"}', '{"content": nope}'] + ['{"content": "c"}'] * 100000
+    stream = io.StringIO("\n".join(lines))
+    with pytest.raises(json.JSONDecodeError) as error:
+        list(iter_json_values(stream, 1024))
+    assert error.value.lineno == 3 and error.value.pos == 46
+    assert "line 3" in str(error.value)
+    assert stream.tell() < 10000
+
+    with pytest.raises(json.JSONDecodeError, match="longer than 100"):
+        list(iter_json_values(io.StringIO('["' + "x" * 1000), 16, max_value_size=100))
+
+
+def test_bulk_rebuild_keeps_sources_so_updates_replace_them(tmp_path, embedding_function):
+    url = "https://poe2db.tw/us/Bows"
+    crawled = tmp_path / "pages"
+    crawled.mkdir()
+    (crawled / "bows.json").write_text(json.dumps(
+        {"url": url, "content": "# Bows\n- Crude Bow", "timestamp": "2024-01-01T00:00:00"}))
+    (crawled / "notes.txt").write_text("# Notes\nUnsourced note.")
+    kb = knowledge_base.ChromaDBKnowledgeBase(path=str(tmp_path / "store"), embedding_function=embedding_function)
+    kb.bulk_add(iter_documents([str(crawled)]), batch_size=1)
+
+    stored = kb.collection.get(where={"source": url})
+    assert len(stored["ids"]) == 1
+    assert stored["metadatas"][0]["crawled_at"] == datetime(2024, 1, 1).timestamp()
+    assert stored["metadatas"][0]["section"] == "Bows"
+
+    kb.update_documents(["# Bows\n- Crude Bow, buffed"], source=url)
+    assert ["buffed" in document for document in kb.collection.get(where={"source": url})["documents"]] == [True]
+    assert kb.collection.count() == 2
+    kb.close()
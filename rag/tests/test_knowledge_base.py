@@ -0,0 +1,157 @@
+import os
+import pytest
+import knowledge_base
+from knowledge_base import open_knowledge_base, get_knowledge_base, close_knowledge_base
+
+
+def test_shared_knowledge_base_is_reused(tmp_path, embedding_function):
+    kb = open_knowledge_base(path=str(tmp_path), embedding_function=embedding_function)
+    try:
+        assert get_knowledge_base() is kb
+        assert open_knowledge_base() is kb
+
+        kb.add_documents(["Ranger uses bows", "Witch summons minions"])
+        health = kb.health()
+        assert health["documents"] == 2
+        assert health["open_time_ms"] >= 0
+    finally:
+        close_knowledge_base()
+    assert knowledge_base._shared_kb is None
+
+
+def test_add_documents_is_idempotent(tmp_path, embedding_function):
+    kb = knowledge_base.ChromaDBKnowledgeBase(path=str(tmp_path), embedding_function=embedding_function)
+    first = kb.add_documents(["Ranger uses bows", "Ranger uses bows", "Witch summons minions"])
+    second = kb.add_documents(["Witch summons minions"])
+
+    assert len(first) == 2
+    assert second == [first[1]]
+    assert kb.collection.count() == 2
+    kb.close()
+
+
+def test_bulk_add_batches_and_reports_rate(tmp_path, embedding_function):
+    kb = knowledge_base.ChromaDBKnowledgeBase(path=str(tmp_path), embedding_function=embedding_function)
+    documents = [f"# Page {i}\n- Item {i} deals cold damage" for i in range(50)]
+    stats = kb.bulk_add(documents, batch_size=8, write_batch_size=16)
+
+    assert stats["documents"] == 50
+    assert stats["chunks"] == kb.collection.count() == 50
+    assert stats["docs_per_sec"] > 0
+    assert kb.get_documents("Item 7 cold damage")
+    kb.close()
+
+
+def test_update_documents_replaces_a_source(tmp_path, embedding_function):
+    kb = knowledge_base.ChromaDBKnowledgeBase(path=str(tmp_path), embedding_function=embedding_function)
+    kb.add_documents(["Unrelated page"])
+    first = kb.update_documents(["# Bows\n- Crude Bow\n\n## Old\n- Removed item"], source="https://poe2db.tw/us/Bows")
+    second = kb.update_documents(["# Bows\n- Crude Bow\n\n## New\n- Added item"], source="https://poe2db.tw/us/Bows")
+
+    assert first[0] == second[0]
+    stored = kb.collection.get(where={"source": "https://poe2db.tw/us/Bows"})["documents"]
+    assert sorted(stored) == sorted(["# Bows\n- Crude Bow", "# Bows\n## New\n- Added item"])
+    assert kb.collection.count() == 3
+    kb.close()
+
+
+def test_get_documents_fuses_lexical_matches(tmp_path):
+    # A two-dimensional embedding is nearly useless, so BM25 has to find the name
+    from conftest import HashingEmbeddingFunction
+    kb = knowledge_base.ChromaDBKnowledgeBase(
+        path=str(tmp_path), embedding_function=HashingEmbeddingFunction(dim=2),
+        n_results=3, vector_k=3, bm25_k=3
+    )
+    kb.add_documents([f"# Item {i}\n- Item {i} deals cold damage" for i in range(40)])
+    kb.update_documents(["# Widowhail\nUnique bow that boosts quiver bonuses"], source="https://poe2db.tw/us/Widowhail")
+
+    assert any("Widowhail" in document for document in kb.get_documents("Widowhail quiver"))
+
+    kb.update_documents(["# Widowhail\nRemoved from the game"], source="https://poe2db.tw/us/Widowhail")
+    assert kb.lexical_index.search("quiver") == []
+    kb.close()
+
+
+def test_chunks_carry_metadata_and_filter_retrieval(tmp_path, embedding_function):
+    kb = knowledge_base.ChromaDBKnowledgeBase(path=str(tmp_path), embedding_function=embedding_function)
+    kb.replace_sources(
+        {
+            "https://poe2db.tw/us/Bows": "# Bows\n## Unique\n- Widowhail boosts quiver bonuses",
+            "https://poe2db.tw/us/Quivers": "# Quivers\n## Unique\n- Asphyxia's Wrath adds cold damage",
+        },
+        metadata={"https://poe2db.tw/us/Bows": {"crawled_at": 1000.0}, "https://poe2db.tw/us/Quivers": {"crawled_at": 2000.0}}
+    )
+    kb.add_documents(["# Notes\nQuiver bonuses stack"])
+
+    stored = kb.collection.get(where={"source": "https://poe2db.tw/us/Bows"}, include=["metadatas"])
+    metadata = stored["metadatas"][0]
+    assert metadata["section"] == "Unique"
+    assert metadata["crawled_at"] == 1000.0
+    assert len(metadata["content_hash"]) == 64
+
+    fresh = kb.get_documents("quiver bonuses", where={"crawled_at": {"$gte": 1500.0}})
+    assert fresh == ["# Quivers\n## Unique\n- Asphyxia's Wrath adds cold damage"]
+    by_section = kb.get_documents("quiver bonuses", where={"section": "Notes"})
+    assert by_section == ["# Notes\nQuiver bonuses stack"]
+
+    assert kb.delete_source("https://poe2db.tw/us/Bows") == 1
+    assert kb.lexical_index.search("widowhail") == []
+    assert kb.collection.count() == 2
+    kb.close()
+
+
+def test_read_only_instance_rejects_writes_and_sees_external_ones(tmp_path, embedding_function):
+    writer = knowledge_base.ChromaDBKnowledgeBase(path=str(tmp_path), embedding_function=embedding_function)
+    reader = knowledge_base.ChromaDBKnowledgeBase(
+        path=str(tmp_path), embedding_function=embedding_function, read_only=True, refresh_interval=0
+    )
+    with pytest.raises(knowledge_base.ReadOnlyError):
+        reader.add_documents(["Ranger uses bows"])
+    assert reader.embedding_cache is None
+
+    writer.add_documents(["# Widowhail\nUnique bow"])
+    assert reader.generation() == writer.generation() != 0
+    writer.close()
+
+    assert reader.get_documents("Widowhail") == ["# Widowhail\nUnique bow"]
+    assert reader.refresh() is False
+    reader.close()
+
+
+def test_generation_counts_writes_within_one_timestamp_tick(tmp_path, embedding_function, monkeypatch):
+    writer = knowledge_base.ChromaDBKnowledgeBase(path=str(tmp_path), embedding_function=embedding_function)
+    reader = knowledge_base.ChromaDBKnowledgeBase(
+        path=str(tmp_path), embedding_function=embedding_function, read_only=True, refresh_interval=0
+    )
+    writer.add_documents(["# Widowhail\nUnique bow"])
+    assert reader.get_documents("Widowhail") == ["# Widowhail\nUnique bow"]
+    old_client = reader.client
+    # A coarse filesystem clock: every write lands on the same mtime
+    mtime = os.stat(tmp_path / "generation").st_mtime_ns
+    utime, rename = os.utime, os.rename
+    monkeypatch.setattr(os, "utime", lambda path, *args, **kwargs: utime(path, ns=(mtime, mtime)))
+    monkeypatch.setattr(os, "replace", lambda src, dst: (rename(src, dst), utime(dst, ns=(mtime, mtime))))
+
+    writer.add_documents(["# Quiver\nUnique quiver"])
+
+    assert os.stat(tmp_path / "generation").st_mtime_ns == mtime
+    assert reader.get_documents("Unique quiver", n_results=2)[0] == "# Quiver\nUnique quiver"
+    assert old_client._closed
+    writer.close()
+    reader.close()
+
+
+def test_reader_opened_before_the_writer_creates_nothing(tmp_path, embedding_function):
+    reader = knowledge_base.ChromaDBKnowledgeBase(
+        path=str(tmp_path), embedding_function=embedding_function, read_only=True, refresh_interval=0
+    )
+    assert not (tmp_path / "bm25.sqlite").exists()
+    assert reader.get_documents("Widowhail") == []
+
+    writer = knowledge_base.ChromaDBKnowledgeBase(path=str(tmp_path), embedding_function=embedding_function)
+    writer.add_documents(["# Widowhail\nUnique bow"])
+    writer.close()
+
+    assert reader.get_documents("Widowhail") == ["# Widowhail\nUnique bow"]
+    assert len(reader.lexical_index) == 1
+    reader.close()
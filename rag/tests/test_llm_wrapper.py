@@ -0,0 +1,48 @@
+import httpx
+import pytest
+from openai import OpenAI, InternalServerError
+import llm_wrapper
+from llm_wrapper import OpenAIAdapter, LLMSettings, LLMMetrics
+
+
+def completion(content):
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "test",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+    }
+
+
+def adapter_with(responses, monkeypatch, **settings):
+    monkeypatch.setattr(llm_wrapper, "metrics", LLMMetrics())
+    adapter = OpenAIAdapter("key", "http://llm.test/v1", "test",
+                            settings=LLMSettings(backoff_base=0, **settings))
+    replies = iter(responses)
+
+    def handler(request):
+        status, body = next(replies)
+        return httpx.Response(status, json=body)
+
+    adapter.client = OpenAI(api_key="key", base_url="http://llm.test/v1", max_retries=0,
+                            http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+    return adapter
+
+
+def test_retries_transient_errors(monkeypatch):
+    adapter = adapter_with([(500, {"error": "busy"}), (200, completion("ok"))], monkeypatch)
+
+    assert adapter.generate([{"role": "user", "content": "hi"}]) == "ok"
+    stats = llm_wrapper.metrics.stats()
+    assert stats["requests"] == 1 and stats["retries"] == 1 and stats["in_flight"] == 0
+
+
+def test_retry_budget_stops_retry_storms(monkeypatch):
+    adapter = adapter_with([(500, {"error": "down"})] * 10, monkeypatch, max_retries=5)
+    adapter.retry_budget = llm_wrapper.RetryBudget(ratio=0, max_tokens=1)
+
+    with pytest.raises(InternalServerError):
+        adapter.generate([{"role": "user", "content": "hi"}])
+    stats = llm_wrapper.metrics.stats()
+    assert stats["retries"] == 1 and stats["retries_denied"] == 1 and stats["failures"] == 1
@@ -0,0 +1,42 @@
+import pytest
+import metrics
+
+prometheus_client = pytest.importorskip("prometheus_client")
+
+
+def sample(name, **labels):
+    return prometheus_client.REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_span_and_timed_record_stage_latency():
+    before = sample("rag_stage_seconds_count", stage="test_stage")
+    with metrics.span("test_stage"):
+        pass
+
+    @metrics.timed("test_stage")
+    def work():
+        return 42
+
+    assert work() == 42
+    assert sample("rag_stage_seconds_count", stage="test_stage") == before + 2
+
+
+def test_generation_timer_records_ttft_and_rate():
+    before = sample("rag_llm_tokens_total", mode="test")
+    timer = metrics.GenerationTimer("test")
+    for _ in range(3):
+        timer.token()
+    timer.finish()
+    assert sample("rag_llm_tokens_total", mode="test") == before + 3
+    assert sample("rag_llm_time_to_first_token_seconds_count", mode="test") >= 1
+
+
+def test_sampling_profiler_writes_profiles(tmp_path):
+    profiler = metrics.SamplingProfiler(rate=1.0, directory=str(tmp_path))
+    with profiler.maybe_profile("/query") as sampled:
+        sum(range(1000))
+    assert sampled
+    assert len(list(tmp_path.glob("*-query-0.prof"))) == 1
+
+    with metrics.SamplingProfiler(rate=0.0).maybe_profile("/query") as sampled:
+        assert not sampled
@@ -0,0 +1,95 @@
+import threading
+import numpy as np
+import pytest
+import quantized_store
+from quantized_store import QuantizedCollection, QuantizedKnowledgeBase, where_sql
+
+
+def test_where_sql_translates_filters():
+    sql, params = where_sql({"$and": [{"source": "https://poe2db.tw/us/Bows"}, {"crawled_at": {"$gte": 100}}]})
+    assert sql == "(json_extract(metadata, '$.source') = ? AND json_extract(metadata, '$.crawled_at') >= ?)"
+    assert params == ["https://poe2db.tw/us/Bows", 100]
+    with pytest.raises(ValueError):
+        where_sql({"source; DROP TABLE chunks": "x"})
+
+
+def test_partitioned_search_matches_exact_search(tmp_path):
+    # Embeddings cluster by topic; so does this data
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((30, 32))
+    vectors = (centers[rng.integers(0, 30, 3000)] + 0.5 * rng.standard_normal((3000, 32))).astype(np.float32)
+    collection = QuantizedCollection(str(tmp_path), nprobe=8, rescore=10, ivf_min=1000)
+    collection.upsert(ids=[f"v{i}" for i in range(len(vectors))], embeddings=vectors,
+                      documents=[f"doc {i}" for i in range(len(vectors))])
+    assert collection.stats()["lists"] > 0
+
+    queries = vectors[:50] + 0.1 * rng.standard_normal((50, 32)).astype(np.float32)
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    exact = np.argsort(-(queries @ normalized.T), axis=1)[:, :5]
+    results = collection.query(query_embeddings=queries, n_results=5)
+    recall = np.mean([len({f"v{i}" for i in row} & set(ids)) / 5 for row, ids in zip(exact, results["ids"])])
+    assert recall >= 0.9
+    assert results["documents"][0][0] == "doc 0"
+    collection.close()
+
+
+def test_quantized_knowledge_base_replaces_sources_and_filters(tmp_path, embedding_function):
+    kb = QuantizedKnowledgeBase(path=str(tmp_path), embedding_function=embedding_function)
+    kb.add_documents([f"# Item {i}\n- Item {i} deals cold damage" for i in range(20)])
+    kb.update_documents(["# Widowhail\nUnique bow that boosts quiver bonuses"],
+                        source="https://poe2db.tw/us/Widowhail", metadata={"crawled_at": 100})
+
+    assert any("Widowhail" in document for document in kb.get_documents("Widowhail quiver"))
+    assert kb.get_documents("cold damage", where={"crawled_at": {"$gte": 50}}) == \
+        ["# Widowhail\nUnique bow that boosts quiver bonuses"]
+
+    kb.update_documents(["# Widowhail\nRemoved from the game"], source="https://poe2db.tw/us/Widowhail")
+    assert kb.collection.count() == 21
+    assert kb.delete_source("https://poe2db.tw/us/Widowhail") == 1
+    assert kb.health()["vector_index"]["vectors"] == 20
+    kb.close()
+
+    reader = QuantizedKnowledgeBase(path=str(tmp_path), embedding_function=embedding_function, read_only=True)
+    assert len(reader.get_documents("Item 3 cold damage")) == 5
+    reader.close()
+
+    empty = QuantizedCollection(str(tmp_path / "empty"), read_only=True)
+    assert empty.count() == 0 and not (tmp_path / "empty").exists()
+    empty.close()
+
+
+def test_writes_and_queries_proceed_while_training(tmp_path, monkeypatch):
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((2000, 16)).astype(np.float32)
+    collection = QuantizedCollection(str(tmp_path), nprobe=4, ivf_min=10**9)
+    collection.upsert(ids=[f"v{i}" for i in range(len(vectors))], embeddings=vectors)
+
+    # Hold k-means at its first iteration until the main thread has written and queried
+    training, resume = threading.Event(), threading.Event()
+    normalize = quantized_store._normalize
+
+    def paused_normalize(values):
+        if threading.current_thread().name == "trainer" and not training.is_set():
+            training.set()
+            resume.wait(5)
+        return normalize(values)
+
+    monkeypatch.setattr(quantized_store, "_normalize", paused_normalize)
+    trainer = threading.Thread(target=collection.train, name="trainer")
+    trainer.start()
+    assert training.wait(5)
+
+    late = rng.standard_normal((1, 16)).astype(np.float32)
+    writer = threading.Thread(target=collection.upsert, kwargs={"ids": ["late"], "embeddings": late})
+    writer.start()
+    writer.join(2)
+    assert not writer.is_alive()
+    assert collection.query(query_embeddings=late, n_results=1)["ids"] == [["late"]]
+    resume.set()
+    trainer.join(5)
+
+    # The slot written mid-training is assigned to its nearest new list
+    slot = collection._db.execute("SELECT slot FROM chunks WHERE id = 'late'").fetchone()[0]
+    assert collection._lists[slot] == np.argmax(collection._centroids @ normalize(late)[0])
+    assert collection.query(query_embeddings=late, n_results=1)["ids"] == [["late"]]
+    collection.close()
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+import pytest
+from query_expansion import QueryExpander
+
+
+def test_variants_follow_the_conversation():
+    expander = QueryExpander()
+    messages = [
+        {"role": "user", "content": "Which bows deal cold damage?"},
+        {"role": "assistant", "content": "Widowhail and a few others."},
+        {"role": "user", "content": "What about for the witch?"},
+    ]
+
+    variants = expander.expand(messages)
+
+    assert variants["raw"] == "What about for the witch?"
+    assert variants["rewrite"] == "What about for the witch? bows deal cold damage"
+    assert variants["keywords"] == "witch"
+    # A first question has no history to add, and plain keywords are searched once
+    assert expander.expand([{"role": "user", "content": "cold damage"}]) == {"raw": "cold damage"}
+    with pytest.raises(ValueError):
+        QueryExpander(variants=["raw", "hyde"])
+
+
+@pytest.mark.parametrize("run", ["sync", "async"])
+def test_late_variants_are_dropped(run):
+    expander = QueryExpander(deadline=0.05)
+    results = {
+        "Which bows deal cold damage": ["a", "b", "c"],
+        "bows deal cold damage": ["d", "b"],
+    }
+
+    def submit(query):
+        future = Future()
+        if query in results:
+            future.set_result(results[query])
+        else:
+            # The rewrite never finishes before the deadline
+            threading.Timer(0.5, future.set_result, [["late"]]).start()
+        return future
+
+    messages = [
+        {"role": "user", "content": "Tell me about the witch"},
+        {"role": "assistant", "content": "She is a caster."},
+        {"role": "user", "content": "Which bows deal cold damage"},
+    ]
+    if run == "sync":
+        documents = expander.retrieve(messages, submit, n_results=3)
+    else:
+        documents = asyncio.run(expander.aretrieve(messages, submit, n_results=3))
+
+    assert documents == ["b", "a", "d"]
+    stats = expander.stats()
+    assert stats["searches"] == 1
+    assert stats["variants"]["raw"]["contributed"] == 1
+    assert stats["variants"]["keywords"]["unique_hits"] == 1
+    assert stats["variants"]["rewrite"]["issued"] == 1
+    assert stats["variants"]["rewrite"]["in_time"] == 0
+
+
+@pytest.mark.parametrize("run", ["sync", "async"])
+def test_variant_finishing_while_raw_runs_is_late(run):
+    expander = QueryExpander(variants=["raw", "keywords"], deadline=0.05)
+
+    def submit(query):
+        future = Future()
+        # Both miss the deadline; keywords finishes first, before raw returns
+        delay, result = (0.3, ["a"]) if query == "Which bows deal cold damage" else (0.1, ["late"])
+        threading.Timer(delay, future.set_result, [result]).start()
+        return future
+
+    messages = [{"role": "user", "content": "Which bows deal cold damage"}]
+    if run == "sync":
+        documents = expander.retrieve(messages, submit, n_results=3)
+    else:
+        documents = asyncio.run(expander.aretrieve(messages, submit, n_results=3))
+
+    assert documents == ["a"]
+    stats = expander.stats()["variants"]
+    assert (stats["keywords"]["in_time"], stats["keywords"]["late"], stats["keywords"]["contributed"]) == (0, 1, 0)
+    assert stats["raw"]["in_time"] == 1
+
+
+def test_cancelled_retrieval_cancels_only_its_own_searches(caplog):
+    expander = QueryExpander(deadline=0.001)
+    futures = []
+
+    def submit(query):
+        futures.append(Future())
+        return futures[-1]
+
+    async def cancel():
+        task = asyncio.ensure_future(expander.aretrieve(
+            [{"role": "user", "content": "Which bows deal cold damage"}], submit, n_results=3))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel())
+
+    # Cancelled while waiting on the raw search, which is this caller's own future
+    assert futures[0].cancelled()
+    assert expander.stats()["variants"]["raw"]["errors"] == 0
+    assert "exception calling callback" not in caplog.text
@@ -0,0 +1,46 @@
+import time
+from reranker import CrossEncoderReranker
+
+
+class WordOverlapScorer:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.pairs = 0
+
+    def __call__(self, pairs):
+        time.sleep(self.delay)
+        self.pairs += len(pairs)
+        return [len(set(query.split()) & set(passage.split())) for query, passage in pairs]
+
+
+def test_rerank_orders_by_score_and_caches_pairs():
+    scorer = WordOverlapScorer()
+    reranker = CrossEncoderReranker(scorer=scorer, top_k=2, batch_size=2)
+    passages = ["witch minions", "ranger bow arrows", "ranger bow", "unrelated"]
+
+    assert reranker.rerank("ranger bow arrows", passages) == ["ranger bow arrows", "ranger bow"]
+    assert scorer.pairs == 4
+
+    reranker.rerank("ranger bow arrows", passages + ["bow"])
+    assert scorer.pairs == 5
+    assert reranker.stats()["reranked"] == 2
+
+
+def test_rerank_falls_back_to_retrieval_order_when_slow():
+    reranker = CrossEncoderReranker(scorer=WordOverlapScorer(delay=0.02), top_k=2, batch_size=1, timeout=0.01)
+    passages = ["witch minions", "ranger bow", "ranger bow arrows"]
+
+    assert reranker.rerank("ranger bow arrows", passages) == ["witch minions", "ranger bow"]
+    assert reranker.stats()["fallbacks"] == 1
+
+
+def test_rerank_without_model_keeps_retrieval_order(monkeypatch):
+    import reranker as reranker_module
+
+    def missing(*args):
+        raise ImportError("No module named 'sentence_transformers'")
+
+    monkeypatch.setattr(reranker_module, "load_cross_encoder", missing)
+    reranker = CrossEncoderReranker(top_k=1)
+    assert reranker.rerank("query", ["first", "second"]) == ["first"]
+    assert reranker.stats()["available"] is False
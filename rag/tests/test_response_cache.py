@@ -0,0 +1,45 @@
+import time
+from response_cache import ResponseCache
+
+
+def test_exact_hits_use_normalized_query():
+    cache = ResponseCache(capacity=2)
+    cache.put("Best Ranger build?", "Use a bow", latency=3.0)
+
+    assert cache.get("  best   ranger BUILD ") == "Use a bow"
+    assert cache.get("best witch build") is None
+    stats = cache.stats()
+    assert stats["exact_hits"] == 1 and stats["misses"] == 1
+    assert stats["latency_saved_seconds"] == 3.0
+
+
+def test_capacity_and_ttl_evict_entries():
+    cache = ResponseCache(capacity=2, ttl=0.05)
+    cache.put("a", "1", latency=1)
+    cache.put("b", "2", latency=1)
+    cache.get("a")
+    cache.put("c", "3", latency=1)
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+
+    time.sleep(0.06)
+    assert cache.get("a") is None
+
+
+def test_semantic_match_above_threshold(embedding_function):
+    cache = ResponseCache(similarity_threshold=0.8, embed=embedding_function)
+    cache.put("best ranger bow build", "Lightning arrow", latency=2)
+
+    assert cache.get("ranger best bow build please") == "Lightning arrow"
+    assert cache.get("witch minion skills") is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_invalidation_drops_entries_and_stale_puts():
+    cache = ResponseCache()
+    cache.put("q", "old", latency=1)
+    generation = cache.generation
+    cache.invalidate()
+    cache.put("q", "stale", latency=1, generation=generation)
+
+    assert cache.get("q") is None
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import pytest
+import knowledge_base
+from retrieval_scheduler import RetrievalScheduler
+
+
+def test_concurrent_queries_are_batched_and_coalesced(tmp_path, embedding_function):
+    kb = knowledge_base.ChromaDBKnowledgeBase(path=str(tmp_path), embedding_function=embedding_function)
+    kb.add_documents([f"# Item {i}\n- Item {i} deals {kind} damage" for i, kind in
+                      enumerate(["cold", "fire", "lightning", "chaos"] * 5)])
+    kb.update_documents(["# Widowhail\nUnique bow"], source="https://poe2db.tw/us/Widowhail",
+                        metadata={"crawled_at": 100})
+    scheduler = RetrievalScheduler(window=0.1, kb_getter=lambda: kb)
+    queries = ["cold damage", "fire damage", "unique bow", "cold damage"]
+
+    futures = [scheduler.submit(query) for query in queries]
+    filtered = scheduler.submit("unique bow", where={"crawled_at": {"$gte": 50}})
+    results = [future.result(timeout=10) for future in futures]
+
+    assert results == [kb.get_documents(query) for query in queries]
+    assert results[0] is results[3]
+    assert filtered.result(timeout=10) == kb.get_documents("unique bow", where={"crawled_at": {"$gte": 50}})
+    stats = scheduler.stats()
+    assert stats["queries"] == 5
+    assert stats["coalesced"] == 1
+    # The filtered query cannot share the unfiltered batch
+    assert stats["batches"] == 2
+    assert stats["avg_batch_size"] == 2.0
+    scheduler.close()
+    kb.close()
+
+
+def test_batch_failure_reaches_every_caller():
+    class BrokenKnowledgeBase:
+        def get_documents_batch(self, queries, where=None, n_results=None):
+            raise RuntimeError("store unavailable")
+
+    scheduler = RetrievalScheduler(window=0.01, kb_getter=BrokenKnowledgeBase)
+    futures = [scheduler.submit("cold damage"), scheduler.submit("fire damage")]
+
+    for future in futures:
+        with pytest.raises(RuntimeError, match="store unavailable"):
+            future.result(timeout=10)
+    scheduler.close()
+    # Closing stops the threads; the next query starts them again
+    with pytest.raises(RuntimeError):
+        scheduler.get_documents("chaos damage")
+
+
+def test_cancelled_caller_leaves_shared_and_batched_queries_running():
+    release = threading.Event()
+
+    class SlowKnowledgeBase:
+        def get_documents_batch(self, queries, where=None, n_results=None):
+            release.wait(5)
+            return [[f"{query} result"] for query in queries]
+
+    scheduler = RetrievalScheduler(window=0.05, kb_getter=SlowKnowledgeBase)
+
+    async def callers():
+        cancelled, shared, other = (asyncio.ensure_future(asyncio.wrap_future(scheduler.submit(query)))
+                                    for query in ["cold damage", "cold damage", "fire damage"])
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        return await asyncio.wait_for(asyncio.gather(shared, other), timeout=5)
+
+    assert asyncio.run(callers()) == [["cold damage result"], ["fire damage result"]]
+    assert scheduler.stats()["batches"] == 1
+    scheduler.close()